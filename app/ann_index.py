@@ -0,0 +1,213 @@
+# app/ann_index.py
+
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import TEMPLATE_ANN_NPROBE, TEMPLATE_ANN_REFINE
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class IVFIndex:
+    """
+    Índice aproximado por producto interno (coseno con vectores normalizados):
+    - IVF: k-means esférico reparte los vectores en `n_lists` listas; una
+      búsqueda solo recorre las `nprobe` listas con centroide más cercano,
+    - cuantización escalar: cada dimensión se guarda en uint8 con su mínimo y
+      paso propios (4x menos memoria que float32).
+    `nprobe` es la perilla recall/latencia: con nprobe = n_lists la búsqueda
+    es exhaustiva (salvo el error de cuantización, que corrige `refine`).
+    """
+
+    def __init__(self, dim: int, n_lists: int, nprobe: int = TEMPLATE_ANN_NPROBE):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.centroids = np.zeros((0, dim), dtype=np.float32)
+        self.vmin = np.zeros(dim, dtype=np.float32)
+        self.step = np.ones(dim, dtype=np.float32)
+        self._codes: List[np.ndarray] = []
+        self._ids: List[np.ndarray] = []
+        self._lock = threading.Lock()
+
+    @property
+    def is_trained(self) -> bool:
+        return len(self.centroids) > 0
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self._ids)
+
+    # ------------------ ENTRENAMIENTO ------------------
+
+    def train(self, vectors: np.ndarray, n_iter: int = 10, max_samples_per_list: int = 64, seed: int = 0) -> None:
+        """k-means esférico sobre una muestra y rango por dimensión para la cuantización."""
+        vectors = _normalize(vectors)
+        rng = np.random.default_rng(seed)
+        n_lists = min(self.n_lists, len(vectors))
+        sample_size = min(len(vectors), n_lists * max_samples_per_list)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            counts = np.bincount(assign, minlength=n_lists)
+            # Suma por lista con reduceat sobre la muestra ordenada (np.add.at es mucho más lento)
+            order = np.argsort(assign, kind="stable")
+            sums = np.zeros_like(centroids)
+            nonempty = np.flatnonzero(counts)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+            sums[nonempty] = np.add.reduceat(sample[order], starts, axis=0)
+            empty = counts == 0
+            # Las listas vacías se reinician con vectores al azar de la muestra
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+            centroids = _normalize(sums)
+
+        self.n_lists = n_lists
+        self.centroids = centroids.astype(np.float32)
+        self.vmin = vectors.min(axis=0)
+        span = vectors.max(axis=0) - self.vmin
+        self.step = np.where(span > 0, span / 255.0, 1.0).astype(np.float32)
+        self._codes = [np.zeros((0, self.dim), dtype=np.uint8) for _ in range(n_lists)]
+        self._ids = [np.zeros(0, dtype=np.int64) for _ in range(n_lists)]
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((vectors - self.vmin) / self.step)
+        # Vectores insertados después del entrenamiento pueden salirse del rango
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    # ------------------ INSERCIÓN ------------------
+
+    def add(self, vectors: np.ndarray, ids: Sequence[int]) -> None:
+        """Inserta vectores con sus ids (filas del store); se puede llamar varias veces."""
+        if not self.is_trained:
+            raise RuntimeError("IVFIndex must be trained before adding vectors")
+        vectors = _normalize(np.atleast_2d(vectors))
+        ids = np.asarray(ids, dtype=np.int64)
+        assign = np.argmax(vectors @ self.centroids.T, axis=1)
+        codes = self._encode(vectors)
+
+        with self._lock:
+            for list_id in np.unique(assign):
+                mask = assign == list_id
+                self._codes[list_id] = np.concatenate([self._codes[list_id], codes[mask]])
+                self._ids[list_id] = np.concatenate([self._ids[list_id], ids[mask]])
+
+    # ------------------ BÚSQUEDA ------------------
+
+    def search(
+        self,
+        query: Sequence[float],
+        k: int,
+        nprobe: Optional[int] = None,
+        refine: int = TEMPLATE_ANN_REFINE,
+        exact: Optional[Callable[[np.ndarray], np.ndarray]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (ids, puntajes) de los `k` vecinos aproximados, de mayor a menor.
+        Con `exact(ids) -> puntajes`, se toman k * refine candidatos cuantizados
+        y se reordenan con el puntaje exacto.
+        """
+        q = _normalize(np.asarray(query, dtype=np.float32))
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        probes = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+
+        with self._lock:
+            codes = [self._codes[p] for p in probes]
+            ids = [self._ids[p] for p in probes]
+        if not codes:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        codes = np.concatenate(codes)
+        ids = np.concatenate(ids)
+        if not len(ids):
+            return ids, np.zeros(0, dtype=np.float32)
+
+        # q · (vmin + step * code) = q · vmin + (q * step) · code
+        scores = codes @ (q * self.step) + float(q @ self.vmin)
+
+        n_candidates = min(len(ids), k * refine if exact is not None else k)
+        top = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+        ids, scores = ids[top], scores[top]
+        if exact is not None:
+            scores = exact(ids)
+
+        order = np.argsort(-scores, kind="stable")[:k]
+        return ids[order], scores[order]
+
+    # ------------------ PERSISTENCIA ------------------
+
+    def save(self, path: str) -> None:
+        """Guarda el índice en un .npz (escritura atómica)."""
+        with self._lock:
+            sizes = np.array([len(ids) for ids in self._ids], dtype=np.int64)
+            codes = np.concatenate(self._codes) if self._codes else np.zeros((0, self.dim), dtype=np.uint8)
+            ids = np.concatenate(self._ids) if self._ids else np.zeros(0, dtype=np.int64)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            params=np.array([self.dim, self.n_lists, self.nprobe], dtype=np.int64),
+            centroids=self.centroids,
+            vmin=self.vmin,
+            step=self.step,
+            sizes=sizes,
+            codes=codes,
+            ids=ids
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            dim, n_lists, nprobe = (int(v) for v in data["params"])
+            index = cls(dim, n_lists, nprobe)
+            index.centroids = data["centroids"]
+            index.vmin = data["vmin"]
+            index.step = data["step"]
+            bounds = np.cumsum(data["sizes"])[:-1]
+            index._codes = np.split(data["codes"], bounds)
+            index._ids = np.split(data["ids"], bounds)
+        return index
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, n_lists: Optional[int] = None, nprobe: int = TEMPLATE_ANN_NPROBE) -> "IVFIndex":
+        """Entrena e inserta todo `vectors` (ids = número de fila). Por defecto ~4·√n listas."""
+        n_lists = n_lists or max(1, int(4 * np.sqrt(len(vectors))))
+        index = cls(vectors.shape[1], n_lists, nprobe)
+        index.train(vectors)
+        index.add(vectors, np.arange(len(vectors)))
+        return index
+
+    def stats(self) -> Dict:
+        sizes = [len(ids) for ids in self._ids]
+        return {
+            "vectors": sum(sizes),
+            "dim": self.dim,
+            "lists": self.n_lists,
+            "nprobe": self.nprobe,
+            "largest_list": max(sizes, default=0),
+            "code_bytes": sum(c.nbytes for c in self._codes)
+        }
+
+
+def recall_at_k(
+    index: IVFIndex,
+    matrix: np.ndarray,
+    queries: np.ndarray,
+    k: int = 10,
+    nprobe: Optional[int] = None,
+    refine: int = TEMPLATE_ANN_REFINE
+) -> float:
+    """Fracción de los `k` vecinos exactos (producto con `matrix` normalizada) que devuelve el índice."""
+    hits = 0
+    for query in _normalize(queries):
+        exact = np.argpartition(-(matrix @ query), k - 1)[:k]
+        found, _ = index.search(query, k, nprobe=nprobe, refine=refine, exact=lambda ids: matrix[ids] @ query)
+        hits += len(np.intersect1d(exact, found))
+    return hits / (k * len(queries))
@@ -1,4 +1,8 @@
-from typing import Dict, Optional
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.schema_index import SchemaIndex
 
 def quote_ident(name: str) -> str:
     escaped = name.replace('"', '""')
@@ -10,99 +14,246 @@ def format_value(val):
         return f"'{escaped}'"
     return str(val)
 
-def assemble_query(
-    template: str,
+# ------------------ COMPILACIÓN ------------------
+
+_PLACEHOLDER_RE = re.compile(r"\{\{(\w+)\}\}")
+# Funciones de agregación que rodean a un placeholder: AVG({{column}}), MAX({{column}}), ...
+_AGG_BEFORE_RE = re.compile(r"\b(AVG|SUM|COUNT|MAX|MIN)\(\s*$", re.IGNORECASE)
+_LIMIT_BEFORE_RE = re.compile(r"\bLIMIT\s+$", re.IGNORECASE)
+
+# Texto que queda en la consulta cuando un placeholder no se pudo llenar
+UNKNOWN_MARKERS = {
+    "column": "UNKNOWN_COLUMN",
+    "table": "UNKNOWN_TABLE",
+    "value": "UNKNOWN_VALUE",
+    "group_column": "UNKNOWN_GROUP",
+    "agg_func": "UNKNOWN_AGG",
+    "agg_column": "UNKNOWN_AGG_COLUMN",
+    "table1": "UNKNOWN_TABLE",
+    "table2": "UNKNOWN_TABLE",
+    "col1": "UNKNOWN_COLUMN",
+    "col2": "UNKNOWN_COLUMN",
+}
+
+
+class Slot:
+    """
+    Placeholder de una plantilla compilada. `context` se resuelve al compilar
+    mirando el texto vecino: "agg" dentro de AVG(...)/SUM(...)/..., "limit"
+    tras LIMIT, o None.
+    """
+
+    __slots__ = ("name", "context", "resolve", "unknown")
+
+    def __init__(self, name: str, context: Optional[str] = None):
+        self.name = name
+        self.context = context
+        # Resolutor ya especializado para el contexto: en el render no se vuelve a mirar
+        self.resolve = RESOLVERS[(name, context)] if (name, context) in RESOLVERS else RESOLVERS[(name, None)]
+        self.unknown = "UNKNOWN_AGG_COLUMN" if (name, context) == ("column", "agg") else UNKNOWN_MARKERS[name]
+
+
+class CompiledTemplate:
+    """
+    Plantilla compilada: `literals` tiene un segmento más que `refs`, y entre
+    cada par de literales va el valor del slot `slots[refs[i]]` (cada slot
+    distinto se resuelve una sola vez por render).
+    """
+
+    __slots__ = ("template", "literals", "refs", "slots", "needs_join", "_program", "_tail")
+
+    def __init__(self, template: str, literals: List[str], refs: List[int], slots: List[Slot]):
+        self.template = template
+        self.literals = tuple(literals)
+        self.refs = tuple(refs)
+        self.slots = tuple(slots)
+        self.needs_join = any(slot.name in _JOIN_SLOTS for slot in slots)
+        # Forma plana para el render: (literal previo, slot) por referencia, más el literal final
+        self._program = tuple(zip(self.literals, self.refs))
+        self._tail = self.literals[-1]
+
+
+@lru_cache(maxsize=4096)
+def compile_template(template: str) -> CompiledTemplate:
+    """
+    Compila una plantilla una sola vez (queda en caché por texto). Los
+    placeholders desconocidos se conservan como texto literal.
+    """
+    literals: List[str] = []
+    refs: List[int] = []
+    slots: List[Slot] = []
+    positions: Dict[Tuple[str, Optional[str]], int] = {}
+    literal_start = 0
+    for match in _PLACEHOLDER_RE.finditer(template):
+        name = match.group(1)
+        if name not in UNKNOWN_MARKERS:
+            continue
+        preceding = template[:match.start()]
+        context = None
+        if name == "column" and _AGG_BEFORE_RE.search(preceding):
+            context = "agg"
+        elif name == "value" and _LIMIT_BEFORE_RE.search(preceding):
+            context = "limit"
+        if (name, context) not in positions:
+            positions[(name, context)] = len(slots)
+            slots.append(Slot(name, context))
+        literals.append(template[literal_start:match.start()])
+        refs.append(positions[(name, context)])
+        literal_start = match.end()
+    literals.append(template[literal_start:])
+    return CompiledTemplate(template, literals, refs, slots)
+
+# ------------------ RESOLUCIÓN DE PLACEHOLDERS ------------------
+
+def _first_dict(intent: Dict, key: str) -> Dict:
+    items = intent.get(key) or []
+    return items[0] if items and isinstance(items[0], dict) else {}
+
+
+def _intent_tables(intent: Dict) -> List[str]:
+    return [t for t in intent.get("tables") or [] if isinstance(t, str)]
+
+
+def _resolve_column(intent: Dict, join) -> Optional[str]:
+    columns = intent.get("columns")
+    return ", ".join([quote_ident(c) for c in columns]) if columns else None
+
+
+def _resolve_agg_column(intent: Dict, join) -> Optional[str]:
+    column = _first_dict(intent, "aggregations").get("column")
+    return quote_ident(column) if column else None
+
+
+def _resolve_table(intent: Dict, join) -> Optional[str]:
+    tables = intent.get("tables")
+    return quote_ident(tables[0]) if tables else None
+
+
+def _resolve_value(intent: Dict, join) -> Optional[str]:
+    conditions = intent.get("conditions")
+    if conditions and isinstance(conditions[0], dict):
+        val = conditions[0].get("value")
+        if val is not None:
+            return format_value(val)
+    return None
+
+
+def _resolve_limit(intent: Dict, join) -> Optional[str]:
+    limit = intent.get("limit")
+    if isinstance(limit, int) and not isinstance(limit, bool):
+        return str(limit)
+    return _resolve_value(intent, join)
+
+
+def _resolve_group_column(intent: Dict, join) -> Optional[str]:
+    group_by = intent.get("group_by")
+    return quote_ident(group_by[0]) if group_by else None
+
+
+def _resolve_agg_func(intent: Dict, join) -> Optional[str]:
+    func = _first_dict(intent, "aggregations").get("function")
+    return func.upper() if func else None
+
+
+class _JoinContext:
+    """
+    Tablas y columnas de tpl_08 ({{table1}} JOIN {{table2}} ON {{table1}}.{{col1}} = {{table2}}.{{col2}}).
+    Las tablas salen de la intención (o de overrides); las columnas, de la
+    FK directa entre ambas en el índice de esquema. Se calcula solo si la
+    plantilla tiene algún placeholder de JOIN.
+    """
+
+    def __init__(self, intent: Dict, overrides: Dict[str, str], index: Optional[SchemaIndex]):
+        tables = _intent_tables(intent)
+        self.tables: List[Optional[str]] = [
+            overrides.get(name, "").strip('"') or (tables[i] if len(tables) > i else None)
+            for i, name in enumerate(("table1", "table2"))
+        ]
+        self.columns: List[Optional[str]] = [None, None]
+        left, right = self.tables
+        if index is not None and left and right:
+            left = index.canonical_table(left) or left
+            right = index.canonical_table(right) or right
+            self.tables = [left, right]
+            conditions = index.join_conditions(left, right)
+            if conditions:
+                self.columns = list(conditions[0])
+
+
+def _join_table(position: int) -> Callable:
+    def resolve(intent: Dict, join: _JoinContext) -> Optional[str]:
+        table = join.tables[position]
+        return quote_ident(table) if table else None
+    return resolve
+
+
+def _join_column(position: int) -> Callable:
+    def resolve(intent: Dict, join: _JoinContext) -> Optional[str]:
+        column = join.columns[position]
+        return quote_ident(column) if column else None
+    return resolve
+
+
+# Resolutor por (placeholder, contexto); (nombre, None) sirve para cualquier contexto sin entrada propia
+RESOLVERS: Dict[Tuple[str, Optional[str]], Callable[[Dict, Any], Optional[str]]] = {
+    ("column", None): _resolve_column,
+    ("column", "agg"): _resolve_agg_column,
+    ("table", None): _resolve_table,
+    ("value", None): _resolve_value,
+    ("value", "limit"): _resolve_limit,
+    ("group_column", None): _resolve_group_column,
+    ("agg_func", None): _resolve_agg_func,
+    ("agg_column", None): _resolve_agg_column,
+    ("table1", None): _join_table(0),
+    ("table2", None): _join_table(1),
+    ("col1", None): _join_column(0),
+    ("col2", None): _join_column(1),
+}
+_JOIN_SLOTS = frozenset(("table1", "table2", "col1", "col2"))
+
+# ------------------ ENSAMBLADO ------------------
+
+def render_template(
+    compiled: CompiledTemplate,
     intent: Dict,
-    overrides: Optional[Dict[str, str]] = None
+    overrides: Optional[Dict[str, str]] = None,
+    index: Optional[SchemaIndex] = None
 ) -> Dict:
-    result = template
-    missing = []
-
-    overrides = overrides or {}
-
-    # COLUMN
-    if "{{column}}" in result:
-        if "column" in overrides:
-            result = result.replace("{{column}}", overrides["column"])
-        elif any(func in template for func in ["AVG({{column}})", "SUM({{column}})", "COUNT({{column}})"]):
-            aggs = intent.get("aggregations", [])
-            if aggs and isinstance(aggs[0], dict) and "column" in aggs[0]:
-                result = result.replace("{{column}}", quote_ident(aggs[0]["column"]))
-            else:
-                result = result.replace("{{column}}", "UNKNOWN_AGG_COLUMN")
-                missing.append("column")
-        elif intent.get("columns"):
-            result = result.replace("{{column}}", ", ".join([quote_ident(c) for c in intent["columns"]]))
-        else:
-            result = result.replace("{{column}}", "UNKNOWN_COLUMN")
-            missing.append("column")
-
-    # TABLE
-    if "{{table}}" in result:
-        if "table" in overrides:
-            result = result.replace("{{table}}", overrides["table"])
-        elif intent.get("tables"):
-            result = result.replace("{{table}}", quote_ident(intent["tables"][0]))
-        else:
-            result = result.replace("{{table}}", "UNKNOWN_TABLE")
-            missing.append("table")
-
-    # VALUE
-    if "{{value}}" in result:
-        if "value" in overrides:
-            result = result.replace("{{value}}", overrides["value"])
-        elif intent.get("conditions"):
-            val = intent["conditions"][0].get("value")
-            if val is not None:
-                result = result.replace("{{value}}", format_value(val))
-            else:
-                result = result.replace("{{value}}", "UNKNOWN_VALUE")
-                missing.append("value")
-        else:
-            result = result.replace("{{value}}", "UNKNOWN_VALUE")
-            missing.append("value")
-
-    # GROUP_COLUMN
-    if "{{group_column}}" in result:
-        if "group_column" in overrides:
-            result = result.replace("{{group_column}}", overrides["group_column"])
-        elif intent.get("group_by"):
-            result = result.replace("{{group_column}}", quote_ident(intent["group_by"][0]))
-        else:
-            result = result.replace("{{group_column}}", "UNKNOWN_GROUP")
-            missing.append("group_column")
-
-    # AGG_FUNC
-    if "{{agg_func}}" in result:
-        if "agg_func" in overrides:
-            result = result.replace("{{agg_func}}", overrides["agg_func"])
-        elif intent.get("aggregations"):
-            func = intent["aggregations"][0].get("function")
-            if func:
-                result = result.replace("{{agg_func}}", func.upper())
-            else:
-                result = result.replace("{{agg_func}}", "UNKNOWN_AGG")
-                missing.append("agg_func")
-        else:
-            result = result.replace("{{agg_func}}", "UNKNOWN_AGG")
-            missing.append("agg_func")
-
-    # AGG_COLUMN
-    if "{{agg_column}}" in result:
-        if "agg_column" in overrides:
-            result = result.replace("{{agg_column}}", overrides["agg_column"])
-        elif intent.get("aggregations"):
-            col = intent["aggregations"][0].get("column")
-            if col:
-                result = result.replace("{{agg_column}}", quote_ident(col))
-            else:
-                result = result.replace("{{agg_column}}", "UNKNOWN_AGG_COLUMN")
-                missing.append("agg_column")
-        else:
-            result = result.replace("{{agg_column}}", "UNKNOWN_AGG_COLUMN")
-            missing.append("agg_column")
+    """Resuelve cada slot una vez y arma la consulta en una sola pasada sobre los segmentos."""
+    join = _JoinContext(intent, overrides or {}, index) if compiled.needs_join else None
+
+    values = []
+    missing: List[str] = []
+    for slot in compiled.slots:
+        value = overrides.get(slot.name) if overrides else None
+        if value is None:
+            value = slot.resolve(intent, join)
+            if value is None:
+                value = slot.unknown
+                if slot.name not in missing:
+                    missing.append(slot.name)
+        values.append(value)
 
+    parts = []
+    append = parts.append
+    for literal, ref in compiled._program:
+        append(literal)
+        append(values[ref])
+    append(compiled._tail)
     return {
-        "query": result,
+        "query": "".join(parts),
         "missing_fields": missing
     }
+
+
+def assemble_query(
+    template: str,
+    intent: Dict,
+    overrides: Optional[Dict[str, str]] = None,
+    index: Optional[SchemaIndex] = None
+) -> Dict:
+    """
+    Llena la plantilla con la intención (y `overrides`, que tienen prioridad).
+    `index` permite completar las columnas de JOIN ({{col1}}/{{col2}}) con las FKs.
+    """
+    return render_template(compile_template(template), intent, overrides, index)
@@ -0,0 +1,142 @@
+# app/batch.py
+
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.parser import parse_intent
+from app.embedding import get_embeddings
+from app.selector import select_best_template
+from app.assembler import assemble_query
+from app.complex_assembler import apply_complex_assembly
+from app.pipeline import cached_response, format_result, remember_result
+from app.db_registry import DatabaseEntry
+from app.config import BATCH_LLM_CONCURRENCY, EMBEDDING_BATCH_MAX_SIZE, EMBEDDING_BATCH_MAX_IN_FLIGHT
+from app.metrics import STAGE_LATENCY, ERRORS
+
+
+async def iter_generate_sql_batch(
+    queries: List[str],
+    database: DatabaseEntry,
+    concurrency: Optional[int] = None,
+    use_cache: bool = True
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Traduce un lote de preguntas y produce los resultados en el orden de entrada.
+    - Un solo esquema para todo el lote; cada validación toma y devuelve su
+      conexión del pool (un lote largo no retiene conexiones entre preguntas).
+    - Las preguntas ya respondidas salen del nivel exacto de la caché de
+      resultados sin pedir su embedding; las parecidas, del nivel semántico.
+    - Embeddings del resto en tandas de EMBEDDING_BATCH_MAX_SIZE preguntas (como
+      mucho EMBEDDING_BATCH_MAX_IN_FLIGHT en vuelo); cada pregunta espera solo su tanda.
+    - Como máximo `concurrency` llamadas al LLM en vuelo a la vez.
+    - Si no se puede cargar el esquema, se produce una única línea de error.
+    """
+    if concurrency is not None and concurrency <= 0:
+        raise ValueError(f"concurrency must be positive, got {concurrency}")
+    limit = concurrency or BATCH_LLM_CONCURRENCY
+    semaphore = asyncio.Semaphore(limit)
+
+    try:
+        schema_repo = await database.schema_cache.aget()
+    except Exception as e:
+        ERRORS.inc(stage="batch")
+        yield {"status": "error", "error": f"Could not load schema: {e}"}
+        return
+    schema_columns = schema_repo.get_schema_dict()["columns"]
+    schema_index = schema_repo.get_index()
+
+    chunk_size = max(1, EMBEDDING_BATCH_MAX_SIZE)
+    embed_gate = asyncio.Semaphore(EMBEDDING_BATCH_MAX_IN_FLIGHT)
+
+    async def embed_chunk(chunk: List[str]) -> List[List[float]]:
+        async with embed_gate:
+            with STAGE_LATENCY.time(stage="embedding_batch"):
+                return await get_embeddings(chunk)
+
+    # Los aciertos exactos no se embeben
+    exact: Dict[int, Dict[str, Any]] = {}
+    if use_cache:
+        for index, nl_query in enumerate(queries):
+            hit = database.results.get_exact(schema_repo.fingerprint, nl_query)
+            if hit is not None:
+                exact[index] = hit
+    pending = [index for index in range(len(queries)) if index not in exact]
+
+    # Pregunta → (tarea de su tanda, posición dentro de la tanda)
+    embedding_tasks = []
+    chunk_of: Dict[int, Tuple["asyncio.Task", int]] = {}
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        task = asyncio.create_task(embed_chunk([queries[index] for index in chunk]))
+        embedding_tasks.append(task)
+        for position, index in enumerate(chunk):
+            chunk_of[index] = (task, position)
+
+    async def run_one(index: int, nl_query: str) -> Dict[str, Any]:
+        if index in exact:
+            return cached_response(nl_query, exact[index])
+        task, position = chunk_of[index]
+        embedding = (await task)[position]
+        if use_cache:
+            hit = database.results.get_similar(schema_repo.fingerprint, nl_query, embedding)
+            if hit is not None:
+                return cached_response(nl_query, hit)
+
+        with STAGE_LATENCY.time(stage="schema_linking"):
+            linked = await database.linker.link(schema_repo, nl_query, embedding, site="parse_intent")
+
+        async with semaphore:
+            with STAGE_LATENCY.time(stage="intent"):
+                intent = await parse_intent(
+                    nl_query,
+                    schema=schema_columns,
+                    index=schema_index,
+                    schema_text=linked.text
+                )
+
+        with STAGE_LATENCY.time(stage="selection"):
+            selected = select_best_template(embedding, intent)
+        with STAGE_LATENCY.time(stage="assembly"):
+            assembled = assemble_query(selected["template"], intent, index=schema_index)
+
+        async with semaphore:
+            with STAGE_LATENCY.time(stage="enrichment"):
+                enriched = await apply_complex_assembly(
+                    assembled["query"],
+                    intent,
+                    nl_query,
+                    schema_repo,
+                    linker=database.linker,
+                    question_embedding=embedding,
+                    template=selected["template"]
+                )
+
+        with STAGE_LATENCY.time(stage="validation"):
+            validation = await database.pool.avalidate(enriched["query"])
+        result = format_result(nl_query, intent, embedding, selected, assembled, enriched, validation, linked)
+        remember_result(database, schema_repo, nl_query, embedding, result)
+        return result
+
+    tasks = [asyncio.create_task(run_one(i, q)) for i, q in enumerate(queries)]
+
+    try:
+        for index, task in enumerate(tasks):
+            try:
+                result = await task
+            except Exception as e:
+                ERRORS.inc(stage="batch")
+                result = {"status": "error", "input": queries[index], "error": str(e)}
+            yield {"index": index, **result}
+    finally:
+        for task in tasks + embedding_tasks:
+            task.cancel()
+
+
+async def generate_sql_batch(
+    queries: List[str],
+    database: DatabaseEntry,
+    concurrency: Optional[int] = None,
+    use_cache: bool = True
+) -> List[Dict[str, Any]]:
+    """Versión no incremental de `iter_generate_sql_batch`."""
+    return [result async for result in iter_generate_sql_batch(queries, database, concurrency, use_cache)]
@@ -1,10 +1,12 @@
-from typing import Dict
+from typing import Dict, List, Optional
 from app.schema_repository import SchemaRepository
+from app.schema_linking import SchemaLinker
 from app.llm_helper import complete_placeholders_with_llm
-from app.assembler import assemble_query
-from app.join_resolver import suggest_join_info
+from app.assembler import UNKNOWN_MARKERS, assemble_query
+from app.join_resolver import suggest_join_info, build_join_clause
+from app.metrics import STAGE_LATENCY
 
-PLACEHOLDER_KEYS = ["UNKNOWN_TABLE", "UNKNOWN_COLUMN", "UNKNOWN_GROUP", "UNKNOWN_VALUE"]
+PLACEHOLDER_KEYS = sorted(set(UNKNOWN_MARKERS.values()))
 
 def has_placeholders(sql: str) -> bool:
     return any(ph in sql for ph in PLACEHOLDER_KEYS)
@@ -21,13 +23,20 @@ async def apply_complex_assembly(
     partial_query: str,
     intent: Dict,
     nl_input: str,
-    schema_repo: SchemaRepository
+    schema_repo: SchemaRepository,
+    linker: Optional[SchemaLinker] = None,
+    question_embedding: Optional[List[float]] = None,
+    template: Optional[str] = None
 ) -> Dict:
     """
     Completa placeholders faltantes y resuelve JOINs con ayuda del LLM.
+    Con `linker`, los prompts llevan solo la parte relevante del esquema.
+    `template` (la plantilla elegida) se vuelve a ensamblar con lo que
+    sugiere el LLM; sin ella no hay placeholders que llenar en `partial_query`.
     """
     notes = []
     schema_dict = schema_repo.get_schema_dict()
+    index = schema_repo.get_index()
 
     # Paso 1: Si no hay placeholders, devolver tal cual
     if not has_placeholders(partial_query):
@@ -38,11 +47,25 @@ async def apply_complex_assembly(
         }
 
     # Paso 2: Completar placeholders
-    llm_result = await complete_placeholders_with_llm(
-        user_query=nl_input,
-        partial_sql=partial_query,
-        schema=schema_dict["columns"]
-    )
+    schema_text = None
+    if linker is not None:
+        linked = await linker.link(
+            schema_repo,
+            nl_input,
+            question_embedding,
+            quoted=True,
+            include=[t for t in intent.get("tables") or [] if isinstance(t, str)],
+            site="complete_placeholders"
+        )
+        schema_text = linked.text
+
+    with STAGE_LATENCY.time(stage="llm_enrichment"):
+        llm_result = await complete_placeholders_with_llm(
+            user_query=nl_input,
+            partial_sql=partial_query,
+            schema=schema_dict["columns"],
+            schema_text=schema_text
+        )
 
     if "error" in llm_result:
         notes.append(f"⚠️ Enrichment failed: {llm_result['error']}")
@@ -56,14 +79,13 @@ async def apply_complex_assembly(
         for key, value in llm_result.items()
     }
 
-    enriched = assemble_query(partial_query, intent, overrides)
+    enriched = assemble_query(template or partial_query, intent, overrides, index)
 
     if enriched["missing_fields"]:
         notes.append("⚠️ Some fields are still missing after enrichment.")
 
     # Paso 3: Verificar si hay columnas externas (JOIN implícito)
     main_table = overrides.get("table", None)
-    all_columns = schema_dict
 
     used_columns = []
     if "column" in overrides:
@@ -74,18 +96,41 @@ async def apply_complex_assembly(
         used_columns += [overrides["group_column"]]
 
     # Revisar si alguna columna pertenece a otra tabla
+    joined_tables = set()
+    from_clause = f"FROM {main_table}" if main_table else None
     for col in used_columns:
         col_clean = col.strip('"')
         if main_table:
-            main_table_clean = main_table.strip('"')
-            if col_clean not in all_columns.get(main_table_clean, []):
+            # Nombres tal como están en el esquema: el LLM puede cambiar mayúsculas
+            main_table_clean = index.canonical_table(main_table) or main_table.strip('"')
+            col_clean = index.canonical_column(main_table_clean, col_clean) or col_clean
+            if not index.has_column(main_table_clean, col_clean):
                 # Buscar sugerencia de JOIN
-                join_suggestion = await suggest_join_info(nl_input, col_clean, main_table_clean, all_columns)
+                with STAGE_LATENCY.time(stage="join_resolution"):
+                    join_suggestion = await suggest_join_info(
+                        nl_input,
+                        col_clean,
+                        main_table_clean,
+                        schema_dict["columns"],
+                        index=index,
+                        render_schema=(
+                            (lambda tables: linker.subset(schema_repo, tables, site="join_resolver").text)
+                            if linker is not None else None
+                        )
+                    )
 
-                if "join_table" in join_suggestion and "join_condition" in join_suggestion:
-                    join_clause = f' JOIN "{join_suggestion["join_table"]}" ON {join_suggestion["join_condition"]}'
-                    enriched["query"] = enriched["query"].replace("FROM " + main_table, f'FROM {main_table}{join_clause}')
-                    notes.append(f"🔗 Auto JOIN added with {join_suggestion['join_table']}")
+                if "join_clause" in join_suggestion:
+                    # Varias columnas pueden compartir tramos de ruta: no repetir JOINs y
+                    # añadir los nuevos detrás de los previos (una ruta puede apoyarse en ellos)
+                    joins = [j for j in join_suggestion["joins"] if j["table"] not in joined_tables]
+                    if joins:
+                        extended = from_clause + build_join_clause(joins)
+                        enriched["query"] = enriched["query"].replace(from_clause, extended, 1)
+                        from_clause = extended
+                        joined_tables.update(j["table"] for j in joins)
+                        notes.append(
+                            f"🔗 Auto JOIN added with {join_suggestion['join_table']} ({join_suggestion['source']})"
+                        )
                 else:
                     notes.append(f"⚠️ No JOIN could be resolved for column: {col_clean}")
 
@@ -0,0 +1,139 @@
+# app/config.py
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuración para base de datos (PostgreSQL por defecto)
+DB_CONFIG = {
+    "dbname": os.getenv("DB_NAME", "spider_test"),
+    "user": os.getenv("DB_USER", "postgres"),
+    "password": os.getenv("DB_PASSWORD", ""),
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": int(os.getenv("DB_PORT", "5432"))
+}
+
+# Caché de esquema: segundos antes de volver a introspeccionar (0 = sin expiración)
+SCHEMA_CACHE_TTL = float(os.getenv("SCHEMA_CACHE_TTL", "300"))
+
+# Snapshots de esquema en disco, reutilizados mientras la huella de la base no cambie
+# (cadena vacía = desactivado)
+SCHEMA_SNAPSHOT_DIR = os.getenv("SCHEMA_SNAPSHOT_DIR", ".cache/schema") or None
+
+# Lotes: máximo de llamadas al LLM en vuelo simultáneamente
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# Métricas Prometheus en /metrics (desactivadas: registrar es una operación vacía)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# Hilos dedicados a trabajo bloqueante de base de datos (introspección y EXPLAIN)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+
+# ------------------ MULTI-BASE (db_id) ------------------
+
+# db_id usado cuando la petición no indica ninguno (apunta a DB_CONFIG)
+DEFAULT_DB_ID = os.getenv("DEFAULT_DB_ID", "default")
+
+# JSON opcional {db_id: {"type": "postgresql" | "sqlite", ...conexión}}
+DATABASES_FILE = os.getenv("DATABASES_FILE") or None
+
+# Directorio opcional con bases SQLite al estilo Spider: <dir>/<db_id>/<db_id>.sqlite
+SQLITE_DB_DIR = os.getenv("SQLITE_DB_DIR") or None
+
+# Presupuesto del registro: bases en memoria, conexiones abiertas, columnas cacheadas
+# y MB de las matrices de las cachés de resultados
+REGISTRY_MAX_DATABASES = int(os.getenv("REGISTRY_MAX_DATABASES", "64"))
+REGISTRY_MAX_CONNECTIONS = int(os.getenv("REGISTRY_MAX_CONNECTIONS", "128"))
+REGISTRY_MAX_COLUMNS = int(os.getenv("REGISTRY_MAX_COLUMNS", "2000000"))
+REGISTRY_MAX_RESULT_CACHE_MB = float(os.getenv("REGISTRY_MAX_RESULT_CACHE_MB", "256"))
+
+# Conexiones de validación por base de datos
+VALIDATION_POOL_SIZE = int(os.getenv("VALIDATION_POOL_SIZE", "4"))
+
+# Árboles de rutas por FKs cacheados (por huella de esquema y tabla origen)
+JOIN_PATH_CACHE_SIZE = int(os.getenv("JOIN_PATH_CACHE_SIZE", "4096"))
+
+# ------------------ ENLACE DE ESQUEMA (PROMPTS) ------------------
+
+# Tablas mejor puntuadas que se envían al LLM (más sus vecinas por FK)
+SCHEMA_LINK_TOP_K = int(os.getenv("SCHEMA_LINK_TOP_K", "8"))
+# Con este número de tablas o menos se envía el esquema completo
+SCHEMA_LINK_MIN_TABLES = int(os.getenv("SCHEMA_LINK_MIN_TABLES", "12"))
+# Usar embeddings de tablas además de la coincidencia léxica, y su peso en el puntaje
+SCHEMA_LINK_EMBEDDINGS = os.getenv("SCHEMA_LINK_EMBEDDINGS", "1").lower() not in ("0", "false", "no")
+SCHEMA_LINK_EMBEDDING_WEIGHT = float(os.getenv("SCHEMA_LINK_EMBEDDING_WEIGHT", "1.5"))
+
+# ------------------ CLIENTE LLM ------------------
+
+# URL base de la API compatible con OpenAI (vacío = la de OpenAI; p. ej. un servidor falso local)
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "") or None
+# Segundos por intento, para conectar y plazo total de una llamada con sus reintentos
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "60"))
+# Reintentos ante 429/5xx/timeouts, con backoff exponencial (base y tope en segundos) y jitter
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+# Llamadas en vuelo: en total y por modelo
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MODEL_CONCURRENCY = int(os.getenv("LLM_MODEL_CONCURRENCY", "16"))
+# Token bucket: peticiones por segundo y ráfaga máxima (0 = sin límite de tasa)
+LLM_RATE_LIMIT_RPS = float(os.getenv("LLM_RATE_LIMIT_RPS", "0"))
+LLM_RATE_LIMIT_BURST = int(os.getenv("LLM_RATE_LIMIT_BURST", "20"))
+# Pool HTTP: conexiones totales y conexiones keep-alive reutilizables
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "32"))
+
+# ------------------ CACHÉ DE RESPUESTAS LLM ------------------
+
+# Modo: "read_write" (normal, solo llamadas con temperature=0), "off", "record"
+# (siempre llama y guarda; para grabar fixtures) o "replay" (solo caché, sin red)
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "read_write")
+# Base SQLite de las respuestas (cadena vacía = solo memoria)
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_responses.sqlite") or None
+# Respuestas en la LRU de memoria y filas en disco antes de expulsar las menos usadas
+LLM_CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "2000"))
+LLM_CACHE_DISK_ITEMS = int(os.getenv("LLM_CACHE_DISK_ITEMS", "100000"))
+
+# ------------------ CACHÉ DE EMBEDDINGS ------------------
+
+# Base SQLite del nivel en disco (cadena vacía = solo memoria)
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite") or None
+# Vectores en la LRU de memoria y filas en disco antes de expulsar los menos usados
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "10000"))
+EMBEDDING_CACHE_DISK_ITEMS = int(os.getenv("EMBEDDING_CACHE_DISK_ITEMS", "500000"))
+
+# Backend de embeddings: "openai" (remoto) o "hashing" (local, sin red)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+# Dimensiones del backend local por hashing
+HASHING_EMBEDDING_DIM = int(os.getenv("HASHING_EMBEDDING_DIM", "512"))
+
+# Micro-lotes de embeddings: textos por llamada, espera máxima para juntar y lotes en vuelo
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "64"))
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5"))
+EMBEDDING_BATCH_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_BATCH_MAX_IN_FLIGHT", "4"))
+
+# ------------------ CACHÉ DE RESULTADOS ------------------
+
+# Resultados completos por base de datos (0 = sin caché), segundos de vida (0 = sin expiración) y
+# coseno mínimo para reutilizar la respuesta de una pregunta parecida
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "2000"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3600"))
+RESULT_CACHE_SIMILARITY = float(os.getenv("RESULT_CACHE_SIMILARITY", "0.97"))
+
+# ------------------ PLANTILLAS ------------------
+
+# A partir de este número de plantillas se busca con el índice aproximado (IVF) en vez de un barrido completo
+TEMPLATE_ANN_MIN_TEMPLATES = int(os.getenv("TEMPLATE_ANN_MIN_TEMPLATES", "20000"))
+# Listas IVF recorridas por búsqueda (más = mejor recall, más latencia)
+TEMPLATE_ANN_NPROBE = int(os.getenv("TEMPLATE_ANN_NPROBE", "8"))
+# Candidatos cuantizados por resultado que se reordenan con el puntaje exacto
+TEMPLATE_ANN_REFINE = int(os.getenv("TEMPLATE_ANN_REFINE", "4"))
+# Pesos del puntaje de plantillas: "termino=peso,..." con cosine, coverage y entity_match
+# (vacío = cosine=0.7,coverage=0.3)
+TEMPLATE_SCORE_WEIGHTS = os.getenv("TEMPLATE_SCORE_WEIGHTS", "")
+# Construcción del store de plantillas: textos por llamada de embeddings y llamadas en vuelo
+TEMPLATE_BUILD_BATCH_SIZE = int(os.getenv("TEMPLATE_BUILD_BATCH_SIZE", "512"))
+TEMPLATE_BUILD_CONCURRENCY = int(os.getenv("TEMPLATE_BUILD_CONCURRENCY", "4"))
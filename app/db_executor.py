@@ -0,0 +1,84 @@
+# app/db_executor.py
+
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+from app.config import DB_POOL_SIZE
+from app.metrics import DB_QUEUE_DEPTH, DB_ACTIVE, DB_QUEUE_WAIT
+
+T = TypeVar("T")
+
+
+class DBExecutor:
+    """
+    Pool acotado de hilos para las llamadas bloqueantes de psycopg2/sqlite3.
+    Saca la introspección y los EXPLAIN del event loop, así una validación
+    lenta no frena al resto de peticiones del worker.
+    """
+
+    def __init__(self, max_workers: int = DB_POOL_SIZE):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="sql-sketcher-db"
+        )
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+
+    def _track(self, fn: Callable[..., T], submitted_at: float) -> T:
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        DB_QUEUE_DEPTH.dec()
+        DB_ACTIVE.inc()
+        DB_QUEUE_WAIT.observe(time.perf_counter() - submitted_at)
+        try:
+            return fn()
+        finally:
+            with self._lock:
+                self._active -= 1
+            DB_ACTIVE.dec()
+
+    def _forget_cancelled(self, future: Future) -> None:
+        # Un trabajo cancelado en la cola (cliente desconectado, timeout, shutdown) nunca pasa por _track
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+            DB_QUEUE_DEPTH.dec()
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        call = functools.partial(fn, *args, **kwargs)
+
+        with self._lock:
+            self._queued += 1
+        DB_QUEUE_DEPTH.inc()
+
+        future = self._executor.submit(self._track, call, time.perf_counter())
+        future.add_done_callback(self._forget_cancelled)
+        # Cancelar la espera cancela el trabajo si todavía no empezó
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self._queued,
+                "active": self._active
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Executor compartido por el proceso (los hilos se crean bajo demanda)
+db_executor = DBExecutor()
+
+
+async def run_db(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Ejecuta `fn` en el pool de base de datos sin bloquear el event loop."""
+    return await db_executor.run(fn, *args, **kwargs)
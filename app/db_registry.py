@@ -0,0 +1,346 @@
+# app/db_registry.py
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.schema_cache import SchemaCache
+from app.schema_repository import SchemaRepository
+from app.schema_linking import SchemaLinker
+from app.result_cache import ResultCache
+from app.validator import ValidationPool
+from app.metrics import DB_REQUESTS, DB_VALIDATION_CONNECTIONS, REGISTRY_DATABASES, REGISTRY_EVICTIONS
+from app.config import (
+    DB_CONFIG,
+    DEFAULT_DB_ID,
+    DATABASES_FILE,
+    SQLITE_DB_DIR,
+    SCHEMA_CACHE_TTL,
+    SCHEMA_SNAPSHOT_DIR,
+    REGISTRY_MAX_DATABASES,
+    REGISTRY_MAX_CONNECTIONS,
+    REGISTRY_MAX_COLUMNS,
+    REGISTRY_MAX_RESULT_CACHE_MB,
+    VALIDATION_POOL_SIZE
+)
+
+# ------------------ CATÁLOGO DE BASES ------------------
+
+def load_database_catalog() -> Dict[str, Dict[str, Any]]:
+    """
+    Bases conocidas por db_id. Siempre incluye DEFAULT_DB_ID → DB_CONFIG (PostgreSQL)
+    y, si existe, las entradas de DATABASES_FILE.
+    """
+    catalog: Dict[str, Dict[str, Any]] = {DEFAULT_DB_ID: {"type": "postgresql", **DB_CONFIG}}
+    if DATABASES_FILE:
+        with open(DATABASES_FILE, "r", encoding="utf-8") as f:
+            catalog.update(json.load(f))
+    return catalog
+
+
+def make_resolver(
+    catalog: Dict[str, Dict[str, Any]],
+    sqlite_dir: Optional[str] = SQLITE_DB_DIR
+) -> Callable[[str], Optional[Dict[str, Any]]]:
+    """Resuelve un db_id con el catálogo y, si no está, con el directorio de SQLite."""
+
+    def resolve(db_id: str) -> Optional[Dict[str, Any]]:
+        if db_id in catalog:
+            return catalog[db_id]
+        if sqlite_dir and os.path.basename(db_id) == db_id:
+            path = os.path.join(sqlite_dir, db_id, f"{db_id}.sqlite")
+            if os.path.exists(path):
+                return {"type": "sqlite", "path": path}
+        return None
+
+    return resolve
+
+# ------------------ REGISTRO ------------------
+
+# Recursos con presupuesto en el registro (además del número de bases)
+BUDGET_RESOURCES = ("connections", "columns", "result_cache")
+
+
+class DatabaseEntry:
+    """
+    Esquema cacheado, enlazador de esquema y pool de validación de una base de datos.
+    `usage` lleva lo que ocupa de cada recurso con presupuesto; cada componente
+    avisa al cambiar (`on_usage`), así el registro no lo recalcula en cada petición.
+    `active` cuenta las peticiones en curso: una entrada expulsada no se cierra
+    hasta que terminan.
+    """
+
+    def __init__(self, db_id: str, db_info: Dict[str, Any], schema_cache: SchemaCache, pool: ValidationPool):
+        self.db_id = db_id
+        self.db_info = db_info
+        self.schema_cache = schema_cache
+        self.pool = pool
+        self.usage: Dict[str, int] = dict.fromkeys(BUDGET_RESOURCES, 0)
+        self.on_usage: Optional[Callable[["DatabaseEntry", str, int], None]] = None
+        self.active = 0
+        self.retired = False
+        pool.on_open_change = lambda count: self._report("connections", count)
+        # Sus fragmentos cacheados se descartan con cada cambio de esquema
+        self.linker = SchemaLinker()
+        schema_cache.subscribe(self.linker.on_schema_change)
+        # Respuestas ya generadas para esta base; un cambio de esquema descarta las afectadas
+        self.results = ResultCache()
+        self.results.on_resize = lambda nbytes: self._report("result_cache", nbytes)
+        schema_cache.subscribe(self.results.on_schema_change)
+        schema_cache.subscribe(self._count_columns)
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.requests = 0
+
+    def _report(self, resource: str, value: int) -> None:
+        if self.on_usage is not None:
+            self.on_usage(self, resource, value)
+        else:
+            self.usage[resource] = value
+
+    def _count_columns(self, change) -> None:
+        """Columnas del esquema cargado (aproximación de su memoria), recalculadas con cada cambio."""
+        repo = self.schema_cache.peek()
+        columns = repo.get_schema_dict()["columns"] if repo is not None else {}
+        self._report("columns", sum(len(cols) for cols in columns.values()))
+
+    def column_count(self) -> int:
+        return self.usage["columns"]
+
+    def close(self) -> None:
+        self.pool.close()
+        self.schema_cache.invalidate()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "type": self.db_info.get("type"),
+            "requests": self.requests,
+            "idle_seconds": time.monotonic() - self.last_used,
+            "validation_connections": self.pool.open_connections,
+            "columns": self.column_count(),
+            "schema_cache": self.schema_cache.stats(),
+            "result_cache": self.results.stats()
+        }
+
+
+class DatabaseRegistry:
+    """
+    Enruta peticiones por db_id. Cada base se abre de forma perezosa (esquema
+    cacheado + pool de validación) y las menos usadas recientemente se expulsan
+    cuando se supera el presupuesto de bases, conexiones, columnas en memoria o
+    memoria de las cachés de resultados. Los totales se llevan al día con los
+    avisos de cada entrada (sin recorrerlas en cada petición). Las peticiones
+    toman la entrada con `lease` (o `acquire`/`release`): una entrada expulsada
+    mientras está en uso se cierra al soltarla la última petición.
+    """
+
+    def __init__(
+        self,
+        resolver: Callable[[str], Optional[Dict[str, Any]]],
+        max_databases: int = REGISTRY_MAX_DATABASES,
+        max_connections: int = REGISTRY_MAX_CONNECTIONS,
+        max_columns: int = REGISTRY_MAX_COLUMNS,
+        max_result_cache_mb: float = REGISTRY_MAX_RESULT_CACHE_MB,
+        pool_size: int = VALIDATION_POOL_SIZE,
+        schema_ttl: float = SCHEMA_CACHE_TTL,
+        snapshot_dir: Optional[str] = SCHEMA_SNAPSHOT_DIR
+    ):
+        self._resolver = resolver
+        self.max_databases = max_databases
+        self.max_connections = max_connections
+        self.max_columns = max_columns
+        self.max_result_cache_bytes = int(max_result_cache_mb * 1024 * 1024)
+        self.pool_size = pool_size
+        self.schema_ttl = schema_ttl
+        self.snapshot_dir = snapshot_dir
+        self._entries: "OrderedDict[str, DatabaseEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Totales por recurso de las entradas registradas; los avisos llegan desde
+        # otros hilos, por eso tienen su propio lock (nunca se toma el otro dentro)
+        self._usage: Dict[str, int] = dict.fromkeys(BUDGET_RESOURCES, 0)
+        self._usage_lock = threading.Lock()
+        self.evictions = 0
+
+    def _create_entry(self, db_id: str, db_info: Dict[str, Any]) -> DatabaseEntry:
+        db_type = db_info.get("type", "postgresql")
+        conn_config = {k: v for k, v in db_info.items() if k not in ("type", "pg_schema")}
+        pg_schema = db_info.get("pg_schema", "public")
+
+        def loader() -> SchemaRepository:
+            return SchemaRepository(
+                db_type,
+                conn_config,
+                pg_schema=pg_schema,
+                snapshot_dir=self.snapshot_dir
+            )
+
+        return DatabaseEntry(
+            db_id,
+            db_info,
+            SchemaCache(loader, ttl=self.schema_ttl),
+            ValidationPool({"type": db_type, **conn_config}, max_size=self.pool_size)
+        )
+
+    def get(self, db_id: str) -> DatabaseEntry:
+        """
+        Devuelve la entrada de `db_id`, creándola si hace falta. No toca la base:
+        el esquema y las conexiones se abren al usarse. Lanza KeyError si el
+        db_id no está configurado. Para usarla durante una petición, `lease`.
+        """
+        return self._get(db_id, acquire=False)
+
+    def acquire(self, db_id: str) -> DatabaseEntry:
+        """Como `get`, pero la marca en uso hasta `release` (no se cierra si se expulsa antes)."""
+        return self._get(db_id, acquire=True)
+
+    def release(self, entry: DatabaseEntry, close: bool = True) -> bool:
+        """
+        Suelta una entrada tomada con `acquire`. True si era la última petición
+        de una entrada ya expulsada: se cierra aquí o, con close=False, el llamador
+        (p. ej. en el pool de base de datos para no bloquear el event loop).
+        """
+        with self._lock:
+            entry.active -= 1
+            pending = entry.retired and entry.active == 0
+        if pending and close:
+            self._close([entry])
+        return pending
+
+    @contextmanager
+    def lease(self, db_id: str) -> Iterator[DatabaseEntry]:
+        entry = self.acquire(db_id)
+        try:
+            yield entry
+        finally:
+            self.release(entry)
+
+    def _get(self, db_id: str, acquire: bool) -> DatabaseEntry:
+        with self._lock:
+            entry = self._entries.get(db_id)
+            if entry is None:
+                db_info = self._resolver(db_id)
+                if db_info is None:
+                    raise KeyError(db_id)
+                entry = self._create_entry(db_id, db_info)
+                self._attach(entry)
+            else:
+                self._entries.move_to_end(db_id)
+
+            entry.last_used = time.monotonic()
+            entry.requests += 1
+            if acquire:
+                entry.active += 1
+            to_close = self._evict_over_budget(keep=db_id)
+
+        self._close(to_close)
+        DB_REQUESTS.inc(db_id=db_id)
+        DB_VALIDATION_CONNECTIONS.set(entry.pool.open_connections, db_id=db_id)
+        REGISTRY_DATABASES.set(len(self._entries))
+        return entry
+
+    # ------------------ PRESUPUESTO ------------------
+
+    def _on_usage(self, entry: DatabaseEntry, resource: str, value: int) -> None:
+        with self._usage_lock:
+            self._usage[resource] += value - entry.usage[resource]
+            entry.usage[resource] = value
+
+    def _attach(self, entry: DatabaseEntry) -> None:
+        """Registra la entrada (con _lock tomado) y suma su uso a los totales."""
+        self._entries[entry.db_id] = entry
+        with self._usage_lock:
+            for resource, value in entry.usage.items():
+                self._usage[resource] += value
+            entry.on_usage = self._on_usage
+
+    def _retire(self, entry: DatabaseEntry) -> bool:
+        """Saca su uso de los totales (con _lock tomado); True si se puede cerrar ya."""
+        with self._usage_lock:
+            entry.on_usage = None
+            for resource, value in entry.usage.items():
+                self._usage[resource] -= value
+        entry.retired = True
+        return entry.active == 0
+
+    def close_entry(self, entry: DatabaseEntry) -> None:
+        self._close([entry])
+
+    def _close(self, entries: List[DatabaseEntry]) -> None:
+        for entry in entries:
+            entry.close()
+            DB_VALIDATION_CONNECTIONS.set(0, db_id=entry.db_id)
+
+    def _over_budget(self) -> Optional[str]:
+        if len(self._entries) > self.max_databases:
+            return "databases"
+        usage = self._usage
+        if usage["connections"] > self.max_connections:
+            return "connections"
+        if usage["columns"] > self.max_columns:
+            return "columns"
+        if usage["result_cache"] > self.max_result_cache_bytes:
+            return "result_cache"
+        return None
+
+    def _evict_over_budget(self, keep: str) -> List[DatabaseEntry]:
+        """
+        Saca entradas en orden LRU (nunca `keep`) hasta volver al presupuesto.
+        Devuelve las que se pueden cerrar ya; las que siguen en uso se cierran en `release`.
+        """
+        to_close = []
+        reason = self._over_budget()
+        while reason is not None:
+            victim = next((db_id for db_id in self._entries if db_id != keep), None)
+            if victim is None:
+                break
+            entry = self._entries.pop(victim)
+            if self._retire(entry):
+                to_close.append(entry)
+            self.evictions += 1
+            REGISTRY_EVICTIONS.inc(reason=reason)
+            reason = self._over_budget()
+        return to_close
+
+    def evict(self, db_id: str) -> bool:
+        with self._lock:
+            entry = self._entries.pop(db_id, None)
+            if entry is None:
+                return False
+            close = self._retire(entry)
+        if close:
+            self._close([entry])
+        REGISTRY_DATABASES.set(len(self._entries))
+        return True
+
+    def close_all(self) -> None:
+        """Cierre al apagar: todas las entradas, aunque haya peticiones en curso."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            for entry in entries:
+                self._retire(entry)
+        for entry in entries:
+            entry.close()
+        REGISTRY_DATABASES.set(0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = list(self._entries.items())
+        with self._usage_lock:
+            usage = dict(self._usage)
+        return {
+            "databases": len(entries),
+            "max_databases": self.max_databases,
+            "open_connections": usage["connections"],
+            "max_connections": self.max_connections,
+            "columns": usage["columns"],
+            "max_columns": self.max_columns,
+            "result_cache_bytes": usage["result_cache"],
+            "max_result_cache_bytes": self.max_result_cache_bytes,
+            "evictions": self.evictions,
+            "entries": {db_id: e.stats() for db_id, e in entries}
+        }
@@ -1,18 +1,65 @@
 # app/embedding.py
 
-from openai import AsyncOpenAI
-from dotenv import load_dotenv
-import os
+from typing import Dict, Optional
 
-load_dotenv()
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from app.embedding_cache import embedding_cache
+from app.embedding_batcher import EmbeddingBatcher
+from app.embedding_providers import EmbeddingProvider, get_embedding_provider
 
-async def get_embedding(text: str) -> list[float]:
+# Un micro-batcher por backend, creado al primer uso
+_batchers: Dict[str, EmbeddingBatcher] = {}
+
+
+def get_batcher(provider: EmbeddingProvider) -> EmbeddingBatcher:
+    batcher = _batchers.get(provider.model)
+    if batcher is None:
+        batcher = EmbeddingBatcher(provider)
+        _batchers[provider.model] = batcher
+    return batcher
+
+
+async def get_embedding(text: str, provider: Optional[EmbeddingProvider] = None) -> list[float]:
     """
-    Obtiene el embedding semántico del texto usando la API text-embedding-ada-002.
+    Obtiene el embedding semántico del texto con el backend configurado
+    (EMBEDDING_BACKEND: text-embedding-ada-002 de OpenAI o el local por hashing).
+    Los backends remotos pasan primero por la caché de embeddings (memoria y disco)
+    y los fallos se agrupan con las peticiones concurrentes en una sola llamada.
     """
-    response = await client.embeddings.create(
-        model="text-embedding-ada-002",
-        input=text
-    )
-    return response.data[0].embedding
+    provider = provider or get_embedding_provider()
+    if provider.cacheable:
+        cached = await embedding_cache.aget(provider.model, text)
+        if cached is not None:
+            return cached
+
+    if provider.batchable:
+        embedding = await get_batcher(provider).embed(text)
+    else:
+        embedding = (await provider.embed([text]))[0]
+
+    if provider.cacheable:
+        embedding_cache.put(provider.model, text, embedding)
+    return embedding
+
+
+async def get_embeddings(texts: list[str], provider: Optional[EmbeddingProvider] = None) -> list[list[float]]:
+    """
+    Obtiene los embeddings de varios textos en una sola llamada al backend.
+    Devuelve los vectores en el mismo orden que `texts`; solo se piden
+    los que no están en caché (y cada texto repetido una vez).
+    """
+    if not texts:
+        return []
+    provider = provider or get_embedding_provider()
+    if not provider.cacheable:
+        return await provider.embed(texts)
+
+    results = await embedding_cache.aget_many(provider.model, texts)
+    missing = list(dict.fromkeys(t for t, vector in zip(texts, results) if vector is None))
+    if not missing:
+        return results
+
+    vectors = await provider.embed(missing)
+    embedding_cache.put_many(provider.model, missing, vectors)
+
+    fetched = dict(zip(missing, vectors))
+    return [vector if vector is not None else fetched[text] for text, vector in zip(texts, results)]
@@ -0,0 +1,115 @@
+# app/embedding_batcher.py
+
+import asyncio
+import time
+from typing import List, Optional, Tuple
+
+from app.embedding_providers import EmbeddingProvider
+from app.metrics import EMBEDDING_BATCH_SIZE, EMBEDDING_QUEUE_WAIT
+from app.config import (
+    EMBEDDING_BATCH_MAX_SIZE,
+    EMBEDDING_BATCH_MAX_WAIT_MS,
+    EMBEDDING_BATCH_MAX_IN_FLIGHT
+)
+
+Pending = Tuple[str, "asyncio.Future", float]
+
+
+class EmbeddingBatcher:
+    """
+    Agrupa las peticiones de embedding concurrentes en una sola llamada al
+    backend. Una petición espera como mucho `max_wait_ms` a que se junten
+    otras (o hasta `max_batch` textos); luego se envía el lote y cada futuro
+    recibe su propio vector. Como máximo `max_in_flight` lotes a la vez.
+    """
+
+    def __init__(
+        self,
+        provider: EmbeddingProvider,
+        max_batch: int = EMBEDDING_BATCH_MAX_SIZE,
+        max_wait_ms: float = EMBEDDING_BATCH_MAX_WAIT_MS,
+        max_in_flight: int = EMBEDDING_BATCH_MAX_IN_FLIGHT
+    ):
+        self.provider = provider
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_in_flight = max_in_flight
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[Pending] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._tasks: set = set()
+
+        # Contadores
+        self.batches = 0
+        self.texts = 0
+
+    def _bind(self) -> asyncio.AbstractEventLoop:
+        # Futuros, temporizador y semáforo pertenecen a un event loop concreto
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._pending = []
+            self._timer = None
+            self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        return loop
+
+    async def embed(self, text: str) -> List[float]:
+        loop = self._bind()
+        future = loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            task = self._loop.create_task(self._dispatch(batch))
+            # Mantener la referencia hasta que termine (create_task solo guarda una débil)
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch: List[Pending]) -> None:
+        async with self._in_flight:
+            now = time.perf_counter()
+            for _, _, enqueued_at in batch:
+                EMBEDDING_QUEUE_WAIT.observe(now - enqueued_at)
+
+            # El mismo texto pedido varias veces en la ventana se envía una sola vez
+            texts = list(dict.fromkeys(text for text, future, _ in batch if not future.done()))
+            if not texts:
+                return
+            EMBEDDING_BATCH_SIZE.observe(len(texts))
+            self.batches += 1
+            self.texts += len(texts)
+
+            try:
+                vectors = dict(zip(texts, await self.provider.embed(texts)))
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            for text, future, _ in batch:
+                if not future.done():
+                    future.set_result(vectors[text])
+
+    def stats(self):
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_in_flight": self.max_in_flight,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": self.texts / self.batches if self.batches else None
+        }
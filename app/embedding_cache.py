@@ -0,0 +1,103 @@
+# app/embedding_cache.py
+
+import hashlib
+import unicodedata
+from array import array
+from typing import Dict, List, Optional
+
+from app.metrics import CACHE_REQUESTS
+from app.tiered_cache import TieredCache
+from app.config import (
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MEMORY_ITEMS,
+    EMBEDDING_CACHE_DISK_ITEMS
+)
+
+
+def normalize_text(text: str) -> str:
+    """Misma clave para preguntas que solo difieren en mayúsculas, espacios o forma Unicode."""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache(TieredCache):
+    """
+    Caché de embeddings en dos niveles (TieredCache), compartida por la API y
+    la generación de plantillas; el disco guarda los vectores en float32.
+    La clave es el hash de modelo + texto normalizado. Un acierto en disco
+    sube el vector a memoria; un fallo en ambos lo resuelve el llamador con `put`.
+    """
+
+    table = "embeddings"
+    columns = "model TEXT NOT NULL, vector BLOB NOT NULL"
+    value_column = "vector"
+    label = "Embedding"
+
+    def __init__(
+        self,
+        path: Optional[str] = EMBEDDING_CACHE_PATH,
+        max_memory: int = EMBEDDING_CACHE_MEMORY_ITEMS,
+        max_disk: int = EMBEDDING_CACHE_DISK_ITEMS
+    ):
+        super().__init__(path, max_memory, max_disk)
+
+        # Contadores
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _encode(self, vector: List[float]) -> bytes:
+        return array("f", vector).tobytes()
+
+    def _decode(self, blob: bytes) -> List[float]:
+        return array("f", blob).tolist()
+
+    async def aget_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Vectores en el orden de `texts` (None = no está); el disco se consulta una vez para todos los fallos."""
+        found = await self._lookup([cache_key(model, text) for text in texts])
+        results = []
+        with self._lock:
+            for vector, tier in found:
+                self._count(tier)
+                results.append(vector)
+        return results
+
+    def _count(self, tier: Optional[str]) -> None:
+        CACHE_REQUESTS.inc(cache="embedding_memory", result="hit" if tier == "memory" else "miss")
+        if tier == "memory":
+            self.memory_hits += 1
+        elif tier == "disk":
+            self.disk_hits += 1
+            CACHE_REQUESTS.inc(cache="embedding_disk", result="hit")
+        else:
+            self.misses += 1
+            if self.path:
+                CACHE_REQUESTS.inc(cache="embedding_disk", result="miss")
+
+    async def aget(self, model: str, text: str) -> Optional[List[float]]:
+        return (await self.aget_many(model, [text]))[0]
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]) -> None:
+        """Guarda en memoria ya y encola la escritura en disco (no bloquea)."""
+        items = {cache_key(model, text): list(vector) for text, vector in zip(texts, vectors)}
+        self._store(items, ("model",), (model,))
+
+    def put(self, model: str, text: str, vector: List[float]) -> None:
+        self.put_many(model, [text], [vector])
+
+    def stats(self) -> Dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            **self.disk_stats(),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else None
+        }
+
+
+# Caché compartida por el proceso (la base en disco se abre al primer uso)
+embedding_cache = EmbeddingCache()
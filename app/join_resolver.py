@@ -1,35 +1,171 @@
 # app/join_resolver.py
 
-import os
 import json
-from typing import Dict
-from openai import AsyncOpenAI
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from app.llm_client import llm_client
+from app.metrics import CACHE_REQUESTS, JOIN_RESOLUTIONS
+from app.schema_index import SchemaIndex
+from app.schema_linking import format_table
+from app.config import JOIN_PATH_CACHE_SIZE
+
+# ------------------ RUTAS POR GRAFO DE FKs ------------------
+
+# Árboles BFS por (huella del esquema, tabla origen), compartidos entre bases con el mismo esquema
+_bfs_cache: "OrderedDict[Tuple[str, str], Tuple[Dict[str, int], Dict[str, str], Dict[str, int]]]" = OrderedDict()
+_bfs_lock = threading.Lock()
+
+
+def quote_ident(name: str) -> str:
+    escaped = name.replace('"', '""')
+    return f'"{escaped}"'
+
+
+def _shortest_paths(index: SchemaIndex, source: str) -> Tuple[Dict[str, int], Dict[str, str], Dict[str, int]]:
+    """
+    BFS desde `source` sobre el grafo de FKs: distancia, predecesor y número de
+    caminos mínimos a cada tabla (más de uno significa que la ruta es ambigua).
+    Se cachea por huella de esquema, así cada tabla origen se recorre una sola vez.
+    Un índice sin huella no se cachea: no hay clave estable para su contenido.
+    """
+    if index.fingerprint is None:
+        return _bfs(index, source)
+
+    key = (index.fingerprint, source)
+    with _bfs_lock:
+        cached = _bfs_cache.get(key)
+        if cached is not None:
+            _bfs_cache.move_to_end(key)
+            CACHE_REQUESTS.inc(cache="join_path", result="hit")
+            return cached
+    CACHE_REQUESTS.inc(cache="join_path", result="miss")
+
+    result = _bfs(index, source)
+    with _bfs_lock:
+        _bfs_cache[key] = result
+        while len(_bfs_cache) > JOIN_PATH_CACHE_SIZE:
+            _bfs_cache.popitem(last=False)
+    return result
+
+
+def _bfs(index: SchemaIndex, source: str) -> Tuple[Dict[str, int], Dict[str, str], Dict[str, int]]:
+    dist = {source: 0}
+    parent: Dict[str, str] = {}
+    paths = {source: 1}
+    queue = deque([source])
+    while queue:
+        table = queue.popleft()
+        for neighbor in index.neighbors_of(table):
+            if neighbor not in dist:
+                dist[neighbor] = dist[table] + 1
+                parent[neighbor] = table
+                paths[neighbor] = paths[table]
+                queue.append(neighbor)
+            elif dist[neighbor] == dist[table] + 1:
+                paths[neighbor] += paths[table]
+    return dist, parent, paths
+
+
+def resolve_join_path(index: SchemaIndex, main_table: str, column: str) -> Dict[str, Any]:
+    """
+    Encuentra la ruta de FKs más corta (posiblemente de varios saltos) desde
+    `main_table` hasta la tabla que contiene `column`. `status` puede ser:
+    - "local": la columna ya está en la tabla principal,
+    - "resolved": ruta única; incluye `joins` y `join_clause` listos para el FROM,
+    - "ambiguous": varias tablas o rutas posibles (o varias FKs en un mismo salto),
+    - "missing": ninguna tabla tiene la columna o no hay ruta por FKs.
+    """
+    owners = index.tables_with_column(column)
+    if not owners:
+        return {"status": "missing", "reason": f"Column not found in schema: {column}"}
+    if main_table in owners:
+        return {"status": "local"}
+
+    dist, parent, paths = _shortest_paths(index, main_table)
+    reachable = [t for t in owners if t in dist]
+    if not reachable:
+        return {"status": "missing", "reason": f"No foreign-key path from {main_table} to {', '.join(owners)}"}
+
+    best = min(dist[t] for t in reachable)
+    candidates = [t for t in reachable if dist[t] == best]
+    if len(candidates) > 1 or paths[candidates[0]] > 1:
+        return {"status": "ambiguous", "candidates": candidates}
+
+    target = candidates[0]
+    path = [target]
+    while path[-1] != main_table:
+        path.append(parent[path[-1]])
+    path.reverse()
+
+    joins: List[Dict[str, str]] = []
+    for left, right in zip(path, path[1:]):
+        conditions = index.join_conditions(left, right)
+        if len(conditions) != 1:
+            # Dos FKs entre las mismas tablas (p. ej. home_team / away_team): decide el LLM
+            return {"status": "ambiguous", "candidates": candidates, "path": path}
+        left_col, right_col = conditions[0]
+        joins.append({
+            "table": right,
+            "on_condition": f"{quote_ident(left)}.{quote_ident(left_col)} = {quote_ident(right)}.{quote_ident(right_col)}"
+        })
+
+    return {
+        "status": "resolved",
+        "join_table": target,
+        "path": path,
+        "joins": joins,
+        "join_clause": build_join_clause(joins)
+    }
+
+
+def build_join_clause(joins: List[Dict[str, str]]) -> str:
+    return "".join(f' JOIN {quote_ident(j["table"])} ON {j["on_condition"]}' for j in joins)
+
+# ------------------ RESOLUCIÓN (FK → LLM) ------------------
 
 async def suggest_join_info(
     user_input: str,
     missing_column: str,
     main_table: str,
-    schema_columns: Dict[str, list]
-) -> Dict[str, str]:
+    schema_columns: Dict[str, list],
+    index: Optional[SchemaIndex] = None,
+    render_schema: Optional[Callable[[Iterable[str]], str]] = None
+) -> Dict[str, Any]:
     """
-    Usa el LLM para sugerir a qué tabla pertenece una columna y qué condición JOIN usar.
+    Resuelve a qué tabla pertenece una columna y cómo unirla a la tabla principal.
+    Con `index`, primero se busca la ruta en el grafo de FKs; solo si es ambigua
+    (o no existe) se consulta al LLM, con un prompt limitado a la tabla principal,
+    las tablas dueñas y sus vecinos por FK. La respuesta siempre trae `join_clause`.
+    `render_schema(tablas)` permite reutilizar fragmentos ya formateados (SchemaLinker).
     """
 
-    # 🔧 Preprocesar el esquema si hay columnas como diccionarios
-    cleaned_schema = {
-        table: [
-            col["name"] if isinstance(col, dict) and "name" in col else str(col)
-            for col in columns
-        ]
-        for table, columns in schema_columns.items()
-    }
-
-    schema_str = "\n".join(
-        f"Table: {table}\nColumns: {', '.join(cols)}"
-        for table, cols in cleaned_schema.items()
-    )
+    if index is not None:
+        resolved = resolve_join_path(index, main_table, missing_column)
+        if resolved["status"] == "resolved":
+            JOIN_RESOLUTIONS.inc(source="fk_graph")
+            return {**resolved, "source": "fk_graph"}
+        if resolved["status"] == "local":
+            return {"error": f"Column {missing_column} already belongs to {main_table}"}
+
+        owners = index.tables_with_column(missing_column)
+        if not owners:
+            JOIN_RESOLUTIONS.inc(source="none")
+            return {"error": f"Column not found in schema: {missing_column}"}
+
+        relevant = {main_table, *owners}
+        for table in list(relevant):
+            relevant.update(index.neighbors_of(table))
+        schema_columns = {
+            table: cols for table, cols in schema_columns.items() if table in relevant
+        }
+
+    if render_schema is not None:
+        schema_str = render_schema(schema_columns)
+    else:
+        # format_table también acepta columnas como diccionarios
+        schema_str = "\n".join(format_table(table, cols) for table, cols in schema_columns.items())
 
     prompt = f"""
 You are a SQL assistant helping to resolve JOIN conditions.
@@ -68,9 +204,10 @@ Respond only with a JSON object:
 """
 
     try:
-        response = await client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
+        response = await llm_client.chat(
+            "join_resolver",
+            "gpt-3.5-turbo",
+            [{"role": "user", "content": prompt}],
             temperature=0
         )
 
@@ -83,7 +220,21 @@ Respond only with a JSON object:
         if cleaned.startswith("```"):
             cleaned = cleaned.replace("```json", "").replace("```", "").strip()
 
-        return json.loads(cleaned)
+        suggestion = json.loads(cleaned)
+        condition = suggestion.get("on_condition") or suggestion.get("join_condition")
+        if not suggestion.get("join_table") or not condition:
+            JOIN_RESOLUTIONS.inc(source="none")
+            return {"error": "LLM did not return join_table and on_condition.", "raw_response": suggestion}
+
+        joins = [{"table": suggestion["join_table"], "on_condition": condition}]
+        JOIN_RESOLUTIONS.inc(source="llm")
+        return {
+            "join_table": suggestion["join_table"],
+            "on_condition": condition,
+            "joins": joins,
+            "join_clause": build_join_clause(joins),
+            "source": "llm"
+        }
 
     except Exception as e:
         return {"error": str(e)}
@@ -0,0 +1,107 @@
+# app/llm_cache.py
+
+import hashlib
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from app.metrics import LLM_CACHE_REQUESTS
+from app.tiered_cache import TieredCache
+from app.config import (
+    LLM_CACHE_MODE,
+    LLM_CACHE_PATH,
+    LLM_CACHE_MEMORY_ITEMS,
+    LLM_CACHE_DISK_ITEMS
+)
+
+CACHE_MODES = ("read_write", "off", "record", "replay")
+# Parámetros que no cambian la respuesta: no forman parte de la clave
+_TRANSPORT_PARAMS = frozenset(("timeout", "deadline"))
+
+
+class LLMCacheMiss(Exception):
+    """En modo "replay" no hay respuesta grabada para la llamada (y no se sale a la red)."""
+
+
+def response_key(model: str, messages: List[Dict[str, Any]], params: Dict[str, Any]) -> str:
+    """Hash de (modelo, mensajes, parámetros); el orden de las claves no importa."""
+    payload = {
+        "model": model,
+        "messages": messages,
+        "params": {k: v for k, v in params.items() if k not in _TRANSPORT_PARAMS}
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache(TieredCache):
+    """
+    Caché de respuestas de chat del LLM en dos niveles (TieredCache), como
+    EmbeddingCache. Guarda la respuesta serializada (JSON) por `response_key`.
+    Los prompts incluyen el esquema, así que un cambio de esquema cambia la clave.
+    Modos (`mode`):
+    - "read_write": solo llamadas deterministas (temperature=0),
+    - "off": no se usa,
+    - "record": toda llamada va a la API y se guarda (graba fixtures),
+    - "replay": toda llamada sale de la caché; un fallo es LLMCacheMiss.
+    """
+
+    table = "llm_responses"
+    columns = "site TEXT NOT NULL, model TEXT NOT NULL, response TEXT NOT NULL, created_at REAL NOT NULL"
+    value_column = "response"
+    label = "LLM"
+
+    def __init__(
+        self,
+        path: Optional[str] = LLM_CACHE_PATH,
+        mode: str = LLM_CACHE_MODE,
+        max_memory: int = LLM_CACHE_MEMORY_ITEMS,
+        max_disk: int = LLM_CACHE_DISK_ITEMS
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode: {mode!r} (expected one of {', '.join(CACHE_MODES)})")
+        super().__init__(path, max_memory, max_disk)
+        self.mode = mode
+
+        # Contadores por call site: {"parse_intent": {"memory_hits": .., "disk_hits": .., "misses": ..}}
+        self._sites: Dict[str, Dict[str, int]] = {}
+
+    def applies_to(self, params: Dict[str, Any]) -> bool:
+        """Si la llamada pasa por la caché: en "read_write", solo con temperature=0 y sin streaming."""
+        if self.mode == "off" or params.get("stream"):
+            return False
+        if self.mode == "read_write":
+            return params.get("temperature") == 0
+        return True
+
+    def _count(self, site: str, result: str) -> None:
+        counters = self._sites.setdefault(site, {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+        counters[{"memory_hit": "memory_hits", "disk_hit": "disk_hits", "miss": "misses"}[result]] += 1
+        LLM_CACHE_REQUESTS.inc(site=site, result=result)
+
+    async def aget(self, site: str, key: str) -> Optional[str]:
+        """Respuesta serializada o None. En modo "record" no se lee: se vuelve a llamar a la API."""
+        if self.mode == "record":
+            return None
+        (response, tier), = await self._lookup([key])
+        with self._lock:
+            self._count(site, f"{tier}_hit" if tier else "miss")
+        return response
+
+    def put(self, site: str, model: str, key: str, response: str) -> None:
+        """Guarda en memoria ya y encola la escritura en disco (no bloquea)."""
+        if self.mode == "replay":
+            return
+        self._store({key: response}, ("site", "model", "created_at"), (site, model, time.time()))
+
+    def stats(self) -> Dict[str, Any]:
+        sites = {}
+        for site, counters in self._sites.items():
+            hits = counters["memory_hits"] + counters["disk_hits"]
+            lookups = hits + counters["misses"]
+            sites[site] = {**counters, "hit_rate": hits / lookups if lookups else None}
+        return {"mode": self.mode, **self.disk_stats(), "sites": sites}
+
+
+# Caché compartida por el proceso (la base en disco se abre al primer uso)
+llm_response_cache = LLMResponseCache()
@@ -0,0 +1,282 @@
+# app/llm_client.py
+
+import asyncio
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    AsyncOpenAI,
+    RateLimitError,
+)
+from openai.types.chat import ChatCompletion
+
+from app.llm_cache import LLMCacheMiss, LLMResponseCache, llm_response_cache, response_key
+from app.metrics import LLM_RETRIES, LLM_WAIT, record_llm_call
+from app.config import (
+    LLM_BASE_URL,
+    LLM_TIMEOUT,
+    LLM_CONNECT_TIMEOUT,
+    LLM_DEADLINE,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BASE_DELAY,
+    LLM_RETRY_MAX_DELAY,
+    LLM_MAX_CONCURRENCY,
+    LLM_MODEL_CONCURRENCY,
+    LLM_RATE_LIMIT_RPS,
+    LLM_RATE_LIMIT_BURST,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE,
+)
+
+load_dotenv()
+
+
+class TokenBucket:
+    """
+    Limitador de tasa: `rate` peticiones por segundo de media con ráfagas de
+    hasta `burst`. `acquire` espera (sin bloquear el event loop) a que haya
+    una ficha. Con rate <= 0 no limita.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def _retry_reason(error: Exception) -> Optional[str]:
+    """Motivo de reintento, o None si el error no es transitorio (p. ej. 400 o 401)."""
+    if isinstance(error, RateLimitError):
+        return "429"
+    if isinstance(error, APITimeoutError):
+        return "timeout"
+    if isinstance(error, APIConnectionError):
+        return "connection"
+    if isinstance(error, APIStatusError) and error.status_code >= 500:
+        return str(error.status_code)
+    return None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class LLMClient:
+    """
+    Cliente OpenAI compartido por todo el proceso (parser, llm_helper,
+    join_resolver y embeddings):
+    - un pool HTTP (httpx) con conexiones keep-alive acotadas,
+    - timeout por intento y plazo total (`deadline`) por llamada, que incluye
+      la espera en semáforos y en el token bucket,
+    - reintentos con backoff exponencial y jitter completo ante 429, 5xx,
+      timeouts y errores de conexión (respetando Retry-After),
+    - semáforo por modelo y otro global para acotar las llamadas en vuelo (el
+      global se toma después, así una cola de un modelo no ocupa cupos de otros),
+    - token bucket para no superar la tasa contratada.
+    `base_url` (LLM_BASE_URL) permite apuntar a un servidor OpenAI falso.
+    Las respuestas de chat pasan por `cache` (LLMResponseCache; None = sin caché).
+    El cliente HTTP y los semáforos se crean por event loop.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = LLM_BASE_URL,
+        api_key: Optional[str] = None,
+        timeout: float = LLM_TIMEOUT,
+        deadline: float = LLM_DEADLINE,
+        max_retries: int = LLM_MAX_RETRIES,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        model_concurrency: int = LLM_MODEL_CONCURRENCY,
+        rate_limit: float = LLM_RATE_LIMIT_RPS,
+        burst: int = LLM_RATE_LIMIT_BURST,
+        cache: Optional[LLMResponseCache] = llm_response_cache
+    ):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.model_concurrency = model_concurrency
+        self.bucket = TokenBucket(rate_limit, burst)
+        self.cache = cache
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[AsyncOpenAI] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._global: Optional[asyncio.Semaphore] = None
+        self._per_model: Dict[str, asyncio.Semaphore] = {}
+
+        # Contadores
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.in_flight = 0
+
+    def _bind(self) -> AsyncOpenAI:
+        # Conexiones y semáforos pertenecen a un event loop concreto
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop or self._client is None:
+            if self._http is not None:
+                self._close_stale(self._http, self._loop)
+            self._loop = loop
+            self._http = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                    keepalive_expiry=30.0
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=LLM_CONNECT_TIMEOUT)
+            )
+            self._client = AsyncOpenAI(
+                api_key=self.api_key or os.getenv("OPENAI_API_KEY"),
+                base_url=self.base_url,
+                http_client=self._http,
+                # Los reintentos los maneja _call (con semáforos y límite de tasa)
+                max_retries=0
+            )
+            self._global = asyncio.Semaphore(self.max_concurrency)
+            self._per_model = {}
+        return self._client
+
+    @staticmethod
+    def _close_stale(http: httpx.AsyncClient, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        """Cierra el pool HTTP de un event loop anterior, en ese loop si sigue vivo."""
+        if loop is not None and loop.is_running():
+            asyncio.run_coroutine_threadsafe(http.aclose(), loop)
+            return
+        # Loop ya terminado: se cierra el pool desde el actual; un error aquí no importa
+        task = asyncio.get_running_loop().create_task(http.aclose())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def _model_semaphore(self, model: str) -> asyncio.Semaphore:
+        semaphore = self._per_model.get(model)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.model_concurrency)
+            self._per_model[model] = semaphore
+        return semaphore
+
+    async def _call(self, site: str, model: str, method: str, **kwargs) -> Any:
+        client = self._bind()
+        create = client.chat.completions.create if method == "chat" else client.embeddings.create
+        deadline = time.monotonic() + (kwargs.pop("deadline", None) or self.deadline)
+        attempt = 0
+        self.calls += 1
+
+        async def send() -> Any:
+            waited = time.perf_counter()
+            async with self._model_semaphore(model), self._global:
+                await self.bucket.acquire()
+                LLM_WAIT.observe(time.perf_counter() - waited, model=model)
+                self.in_flight += 1
+                try:
+                    return await create(model=model, timeout=min(self.timeout, deadline - time.monotonic()), **kwargs)
+                finally:
+                    self.in_flight -= 1
+
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                # El plazo cubre la espera en semáforos y token bucket, no solo la petición
+                response = await asyncio.wait_for(send(), remaining)
+                record_llm_call(site, model, response)
+                return response
+            except asyncio.TimeoutError:
+                error = asyncio.TimeoutError(f"LLM call {site} ({model}) exceeded its deadline")
+            except Exception as e:
+                error = e
+
+            reason = _retry_reason(error)
+            delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+            delay = max(delay, _retry_after(error) or 0.0)
+            if reason is None or attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                self.failures += 1
+                record_llm_call(site, model, error=True)
+                raise error
+            attempt += 1
+            self.retries += 1
+            LLM_RETRIES.inc(site=site, reason=reason)
+            await asyncio.sleep(delay)
+
+    async def chat(
+        self,
+        site: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        use_cache: bool = True,
+        **params
+    ) -> Any:
+        """
+        chat.completions.create con reintentos y límites; `site` etiqueta las
+        métricas. Si la caché aplica (p. ej. temperature=0) se responde desde
+        ella; `use_cache=False` la salta (ni lee ni guarda).
+        """
+        key = None
+        if use_cache and self.cache is not None and self.cache.applies_to(params):
+            key = response_key(model, messages, params)
+            cached = await self.cache.aget(site, key)
+            if cached is not None:
+                return ChatCompletion.model_validate_json(cached)
+            if self.cache.mode == "replay":
+                raise LLMCacheMiss(f"No recorded LLM response for {site} ({model}, key {key[:12]})")
+
+        response = await self._call(site, model, "chat", messages=messages, **params)
+        if key is not None:
+            self.cache.put(site, model, key, response.model_dump_json())
+        return response
+
+    async def embed(self, site: str, model: str, input: Any, **params) -> Any:
+        """embeddings.create con reintentos y límites."""
+        return await self._call(site, model, "embed", input=input, **params)
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+        self._client = None
+        self._http = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "model_concurrency": self.model_concurrency,
+            "rate_limit_rps": self.bucket.rate,
+            "cache_mode": self.cache.mode if self.cache is not None else "off"
+        }
+
+
+# Instancia compartida por todo el proceso
+llm_client = LLMClient()
@@ -1,21 +1,27 @@
 # app/llm_helper.py
 
-import os
 import json
-from openai import AsyncOpenAI
+from typing import Optional
 
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from app.llm_client import llm_client
+from app.schema_linking import format_table
 
-async def complete_placeholders_with_llm(user_query: str, partial_sql: str, schema: dict) -> dict:
+async def complete_placeholders_with_llm(
+    user_query: str,
+    partial_sql: str,
+    schema: dict,
+    schema_text: Optional[str] = None
+) -> dict:
     """
     Consulta al LLM para sugerir cómo completar los placeholders faltantes.
     Devuelve un diccionario JSON con las claves y valores que faltaban.
+    `schema_text` (esquema ya formateado, p. ej. recortado) reemplaza a `schema`.
     """
 
-    schema_str = "\n".join(
-        f"Table: {table}\nColumns: {', '.join([f'\"{col}\"' for col in cols])}"
-        for table, cols in schema.items()
-    )
+    if schema_text is not None:
+        schema_str = schema_text
+    else:
+        schema_str = "\n".join(format_table(table, cols, quoted=True) for table, cols in schema.items())
 
     prompt = f"""
 You are a SQL assistant. A partially filled SQL query contains unknown placeholders like UNKNOWN_COLUMN,
@@ -54,9 +60,10 @@ Return only the JSON object:
 """
 
     try:
-        response = await client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
+        response = await llm_client.chat(
+            "complete_placeholders",
+            "gpt-3.5-turbo",
+            [{"role": "user", "content": prompt}],
             temperature=0
         )
 
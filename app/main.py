@@ -1,71 +1,225 @@
 # app/main.py
 
-from fastapi import FastAPI
-from pydantic import BaseModel
-from typing import Optional
-
-from app.parser import parse_intent
-from app.embedding import get_embedding
-from app.selector import select_best_template
-from app.assembler import assemble_query
-from app.complex_assembler import apply_complex_assembly
-from app.validator import validate_sql
-from app.schema_repository import SchemaRepository
-
-# Configuración para base de datos (PostgreSQL por defecto)
-db_config = {
-    "dbname": "spider_test",
-    "user": "postgres",
-    "password": "",
-    "host": "localhost",
-    "port": 5432
-}
-
-app = FastAPI(title="SQL Sketcher API")
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from app.pipeline import run_sql_pipeline, iter_sql_pipeline_events
+from app.batch import iter_generate_sql_batch
+from app.db_registry import DatabaseEntry, DatabaseRegistry, load_database_catalog, make_resolver
+from app.config import DEFAULT_DB_ID, METRICS_ENABLED
+from app.metrics import REGISTRY, REQUEST_LATENCY
+from app.db_executor import db_executor, run_db
+from app.embedding_cache import embedding_cache
+from app.embedding import get_batcher
+from app.embedding_providers import get_embedding_provider
+from app.llm_client import llm_client
+from app.template_scoring import get_template_scorer
+from app.llm_cache import llm_response_cache
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Registro de bases por db_id; la base por defecto se precarga al arrancar
+    app.state.databases = DatabaseRegistry(make_resolver(load_database_catalog()))
+    try:
+        database = app.state.databases.get(DEFAULT_DB_ID)
+        repo = await database.schema_cache.aload()
+        # Embeddings de tablas para el enlace de esquema, sin retrasar el arranque
+        database.linker.schedule_warm(repo)
+    except Exception as e:
+        # Si la base no está disponible, se reintenta en la primera petición
+        print(f"⚠️ Schema preload failed: {e}")
+    try:
+        # Plantillas e índice IVF (construirlo tarda con bibliotecas grandes) antes de la primera petición
+        await asyncio.to_thread(get_template_scorer)
+    except Exception as e:
+        print(f"⚠️ Template store preload failed: {e}")
+    yield
+    await run_db(app.state.databases.close_all)
+    embedding_cache.close()
+    await llm_client.aclose()
+    llm_response_cache.close()
+    db_executor.shutdown()
+
+
+app = FastAPI(title="SQL Sketcher API", lifespan=lifespan)
+
+
+def get_database(db_id: Optional[str]) -> DatabaseEntry:
+    try:
+        return app.state.databases.get(db_id or DEFAULT_DB_ID)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown db_id: {db_id}")
+
+
+def acquire_database(db_id: Optional[str]) -> DatabaseEntry:
+    """Como `get_database`, pero la entrada no se cierra (si se expulsa) hasta `release_database`."""
+    try:
+        return app.state.databases.acquire(db_id or DEFAULT_DB_ID)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown db_id: {db_id}")
+
+
+async def release_database(database: DatabaseEntry) -> None:
+    # Cerrar una entrada expulsada toca conexiones: fuera del event loop
+    if app.state.databases.release(database, close=False):
+        await run_db(app.state.databases.close_entry, database)
+
 
 class QueryRequest(BaseModel):
     query: str
-    db_id: Optional[str] = None  # Preparado para compatibilidad futura
+    db_id: Optional[str] = None  # Base destino; por defecto DEFAULT_DB_ID
+    include_timings: bool = False  # Devuelve la traza de tiempos por etapa
+    use_cache: bool = True  # False: no consulta la caché de resultados (sí guarda el nuevo)
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    db_id: Optional[str] = None
+    concurrency: Optional[int] = Field(default=None, gt=0)  # Límite de llamadas LLM simultáneas
+    use_cache: bool = True
 
 @app.post("/generate-sql")
 async def generate_sql(request: QueryRequest):
-    # 1. Cargar esquema de la base de datos
-    schema_repo = SchemaRepository.from_postgres_config(db_config)
-    schema_dict = schema_repo.get_schema_dict()["columns"]
-    db_info = schema_repo.get_db_info()
-
-    # 2. Extraer intención semántica con ayuda del esquema
-    intent = await parse_intent(request.query, schema=schema_dict)
-
-    # 3. Generar embedding de la consulta
-    embedding = await get_embedding(request.query)
-
-    # 4. Seleccionar plantilla ideal
-    selected = select_best_template(embedding, intent)
-
-    # 5. Ensamblar consulta parcial
-    assembled = assemble_query(selected["template"], intent)
-
-    # 6. Refinar placeholders incompletos con ayuda del LLM
-    enriched = await apply_complex_assembly(
-        assembled["query"],
-        intent,
-        request.query,
-        schema_repo
-    )
-
-    # 7. Validación sintáctica usando PostgreSQL (EXPLAIN)
-    validation_result = validate_sql(enriched["query"], db_info)
-
-    # 8. Respuesta final
-    return {
-        "status": "parsed",
-        "input": request.query,
-        "intent": intent,
-        "embedding_preview": embedding[:5],
-        "selected_template": selected,
-        "final_query": enriched["query"],
-        "missing_fields": assembled["missing_fields"],
-        "enrichment_notes": enriched["notes"],
-        "validation": validation_result
-    }
+    # Las etapas corren como grafo: esquema → intención en paralelo con el embedding,
+    # luego selección → ensamblado → enriquecimiento → validación (EXPLAIN)
+    database = acquire_database(request.db_id)
+    start = time.perf_counter()
+    try:
+        return await run_sql_pipeline(
+            request.query,
+            database,
+            include_timings=request.include_timings,
+            use_cache=request.use_cache
+        )
+    finally:
+        await release_database(database)
+        REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint="generate-sql")
+
+
+@app.post("/generate-sql/stream")
+async def generate_sql_stream(
+    request: QueryRequest,
+    format: str = Query("ndjson", pattern="^(ndjson|sse)$")
+):
+    # Un evento por etapa en cuanto termina (intención, plantilla, ...), y al final el resultado completo
+    database = acquire_database(request.db_id)
+
+    async def stream():
+        try:
+            async for event in iter_sql_pipeline_events(request.query, database, use_cache=request.use_cache):
+                if format == "sse":
+                    payload = json.dumps(
+                        {k: v for k, v in event.items() if k != "event"},
+                        ensure_ascii=False,
+                        default=str
+                    )
+                    yield f"event: {event['event']}\ndata: {payload}\n\n"
+                else:
+                    yield json.dumps(event, ensure_ascii=False, default=str) + "\n"
+        finally:
+            await release_database(database)
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    # Evitar que proxies intermedios acumulen la respuesta antes de enviarla
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(stream(), media_type=media_type, headers=headers)
+
+
+@app.post("/generate-sql/batch")
+async def generate_sql_batch(request: BatchQueryRequest):
+    # Resultados en NDJSON, una línea por pregunta y en el orden de entrada
+    database = acquire_database(request.db_id)
+
+    async def stream():
+        try:
+            async for result in iter_generate_sql_batch(
+                request.queries,
+                database,
+                concurrency=request.concurrency,
+                use_cache=request.use_cache
+            ):
+                yield json.dumps(result, ensure_ascii=False, default=str) + "\n"
+        finally:
+            await release_database(database)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.get("/metrics")
+async def metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled.")
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/schema/cache")
+async def schema_cache_stats(db_id: Optional[str] = None):
+    return get_database(db_id).schema_cache.stats()
+
+
+@app.get("/embedding/cache")
+async def embedding_cache_stats():
+    return embedding_cache.stats()
+
+
+@app.get("/embedding/batcher")
+async def embedding_batcher_stats():
+    provider = get_embedding_provider()
+    if not provider.batchable:
+        return {"backend": provider.name, "batching": False}
+    return {"backend": provider.name, "batching": True, **get_batcher(provider).stats()}
+
+
+@app.get("/llm/client")
+async def llm_client_stats():
+    return llm_client.stats()
+
+
+@app.get("/llm/cache")
+async def llm_cache_stats():
+    return llm_response_cache.stats()
+
+
+@app.post("/llm/cache/clear")
+async def clear_llm_cache():
+    llm_response_cache.clear()
+    return {"status": "cleared"}
+
+
+@app.get("/result/cache")
+async def result_cache_stats(db_id: Optional[str] = None):
+    return get_database(db_id).results.stats()
+
+
+@app.post("/result/cache/clear")
+async def clear_result_cache(db_id: Optional[str] = None):
+    get_database(db_id).results.clear()
+    return {"status": "cleared", "db_id": db_id or DEFAULT_DB_ID}
+
+
+@app.get("/databases")
+async def databases_stats():
+    return app.state.databases.stats()
+
+
+@app.get("/db/executor")
+async def db_executor_stats():
+    return db_executor.stats()
+
+
+@app.post("/schema/refresh")
+async def refresh_schema(db_id: Optional[str] = None):
+    change = await run_db(get_database(db_id).schema_cache.refresh)
+    return {"status": "refreshed", "db_id": db_id or DEFAULT_DB_ID, "change": change.to_dict()}
+
+
+@app.post("/schema/invalidate")
+async def invalidate_schema_cache(db_id: Optional[str] = None):
+    get_database(db_id).schema_cache.invalidate()
+    return {"status": "invalidated", "db_id": db_id or DEFAULT_DB_ID}
@@ -0,0 +1,331 @@
+# app/metrics.py
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.config import METRICS_ENABLED
+
+# Buckets de latencia en segundos (desde cachés en memoria hasta llamadas al LLM)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[str, ...]
+
+# ------------------ UTILS ------------------
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+# ------------------ TIPOS DE MÉTRICA ------------------
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por combinación de etiquetas: [conteos por bucket..., suma, total]
+        self._series: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [0.0] * (len(self.buckets) + 2)
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        if not METRICS_ENABLED:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+
+        lines = []
+        for key, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key, ("le", "+Inf"))
+            lines.append(f"{self.name}_bucket{labels} {_format_value(series[-1])}")
+            plain = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{plain} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{plain} {_format_value(series[-1])}")
+        return lines
+
+# ------------------ REGISTRO ------------------
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))  # type: ignore[return-value]
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))  # type: ignore[return-value]
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        """Exposición en formato de texto de Prometheus (versión 0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ------------------ MÉTRICAS DEL PIPELINE ------------------
+
+STAGE_LATENCY = REGISTRY.histogram(
+    "sql_sketcher_stage_duration_seconds",
+    "Latency of each generate-sql pipeline stage.",
+    ["stage"]
+)
+REQUEST_LATENCY = REGISTRY.histogram(
+    "sql_sketcher_request_duration_seconds",
+    "End-to-end latency per endpoint.",
+    ["endpoint"]
+)
+LLM_CALLS = REGISTRY.counter(
+    "sql_sketcher_llm_calls_total",
+    "Calls to the OpenAI API by call site and outcome.",
+    ["site", "model", "status"]
+)
+LLM_TOKENS = REGISTRY.counter(
+    "sql_sketcher_llm_tokens_total",
+    "Tokens reported by the OpenAI API.",
+    ["site", "model", "kind"]
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "sql_sketcher_cache_requests_total",
+    "Cache lookups by cache and result (hit/miss).",
+    ["cache", "result"]
+)
+VALIDATION_FAILURES = REGISTRY.counter(
+    "sql_sketcher_validation_failures_total",
+    "Queries rejected by EXPLAIN.",
+    ["db_type"]
+)
+ERRORS = REGISTRY.counter(
+    "sql_sketcher_errors_total",
+    "Unhandled errors by stage.",
+    ["stage"]
+)
+
+DB_QUEUE_DEPTH = REGISTRY.gauge(
+    "sql_sketcher_db_executor_queue_depth",
+    "Database jobs waiting for a worker thread."
+)
+DB_ACTIVE = REGISTRY.gauge(
+    "sql_sketcher_db_executor_active",
+    "Database jobs currently running."
+)
+DB_QUEUE_WAIT = REGISTRY.histogram(
+    "sql_sketcher_db_executor_wait_seconds",
+    "Time a database job waited before a worker picked it up."
+)
+
+DB_REQUESTS = REGISTRY.counter(
+    "sql_sketcher_db_requests_total",
+    "Requests routed to each database.",
+    ["db_id"]
+)
+DB_VALIDATION_CONNECTIONS = REGISTRY.gauge(
+    "sql_sketcher_db_validation_connections",
+    "Open validation connections per database.",
+    ["db_id"]
+)
+REGISTRY_DATABASES = REGISTRY.gauge(
+    "sql_sketcher_registry_databases",
+    "Databases currently held by the registry."
+)
+REGISTRY_EVICTIONS = REGISTRY.counter(
+    "sql_sketcher_registry_evictions_total",
+    "Databases evicted from the registry by budget.",
+    ["reason"]
+)
+
+SCHEMA_CHANGES = REGISTRY.counter(
+    "sql_sketcher_schema_changes_total",
+    "Relations found added, dropped or altered by incremental schema refresh.",
+    ["kind"]
+)
+
+JOIN_RESOLUTIONS = REGISTRY.counter(
+    "sql_sketcher_join_resolutions_total",
+    "Auto-JOIN resolutions by source (fk_graph, llm, none).",
+    ["source"]
+)
+
+LLM_RETRIES = REGISTRY.counter(
+    "sql_sketcher_llm_retries_total",
+    "OpenAI calls retried by the shared client, by call site and reason (429, 5xx, timeout, connection).",
+    ["site", "reason"]
+)
+LLM_CACHE_REQUESTS = REGISTRY.counter(
+    "sql_sketcher_llm_cache_requests_total",
+    "LLM response cache lookups by call site and result (memory_hit, disk_hit, miss).",
+    ["site", "result"]
+)
+LLM_WAIT = REGISTRY.histogram(
+    "sql_sketcher_llm_wait_seconds",
+    "Time an OpenAI call waited for the concurrency limits and the rate limiter.",
+    ["model"]
+)
+
+
+def record_llm_call(site: str, model: str, response=None, error: bool = False) -> None:
+    """Cuenta la llamada y, si la respuesta trae `usage`, los tokens consumidos."""
+    if not METRICS_ENABLED:
+        return
+    LLM_CALLS.inc(site=site, model=model, status="error" if error else "ok")
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, site=site, model=model, kind="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, site=site, model=model, kind="completion")
+
+PROMPT_SCHEMA_TOKENS = REGISTRY.counter(
+    "sql_sketcher_prompt_schema_tokens_total",
+    "Estimated schema tokens sent to the LLM, and saved by schema linking, per call site.",
+    ["site", "kind"]
+)
+
+EMBEDDING_BATCH_SIZE = REGISTRY.histogram(
+    "sql_sketcher_embedding_batch_size",
+    "Texts sent per micro-batched embedding call.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+EMBEDDING_QUEUE_WAIT = REGISTRY.histogram(
+    "sql_sketcher_embedding_queue_wait_seconds",
+    "Time an embedding request waited in the micro-batcher before its batch was sent."
+)
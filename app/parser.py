@@ -1,27 +1,65 @@
 # app/parser.py
 
-from openai import AsyncOpenAI
-from dotenv import load_dotenv
-import os
 import json
-from typing import Dict
+from typing import Dict, List, Optional
 
-# Cargar variables de entorno
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
+from app.llm_client import llm_client
+from app.schema_index import SchemaIndex
 
-# Crear cliente OpenAI
-client = AsyncOpenAI(api_key=api_key)
+def _canonical_column(column: str, tables: List[str], index: SchemaIndex) -> str:
+    # Preferir las tablas de la intención; si no, cualquier tabla que tenga la columna
+    for table in tables + list(index.tables_with_column(column)):
+        canonical = index.canonical_column(table, column)
+        if canonical is not None:
+            return canonical
+    return column
 
-async def parse_intent(nl_query: str, schema: Dict[str, list]) -> dict:
+
+def canonicalize_intent(intent: Dict, index: SchemaIndex) -> Dict:
+    """
+    Ajusta tablas y columnas de la intención a los nombres exactos del esquema
+    (el LLM suele cambiar mayúsculas), para que luego se citen correctamente.
+    """
+    tables = [
+        index.canonical_table(t) or t if isinstance(t, str) else t
+        for t in intent.get("tables") or []
+    ]
+    if "tables" in intent:
+        intent["tables"] = tables
+    known_tables = [t for t in tables if isinstance(t, str) and index.has_table(t)]
+
+    for key in ("columns", "group_by", "order_by"):
+        values = intent.get(key)
+        if isinstance(values, list):
+            intent[key] = [
+                _canonical_column(v, known_tables, index) if isinstance(v, str) else v
+                for v in values
+            ]
+
+    for key in ("conditions", "aggregations"):
+        for item in intent.get(key) or []:
+            if isinstance(item, dict) and isinstance(item.get("column"), str):
+                item["column"] = _canonical_column(item["column"], known_tables, index)
+
+    return intent
+
+
+async def parse_intent(
+    nl_query: str,
+    schema: Dict[str, list],
+    index: Optional[SchemaIndex] = None,
+    schema_text: Optional[str] = None
+) -> dict:
     """
     Extrae la intención SQL a partir de una pregunta NL, usando OpenAI y el esquema proporcionado.
     :param nl_query: La consulta en lenguaje natural.
     :param schema: Diccionario con tablas y sus columnas. Ej: { "table1": ["col1", "col2"], ... }
+    :param index: Índice del esquema; si se pasa, los identificadores se normalizan al esquema.
+    :param schema_text: Esquema ya formateado (p. ej. recortado por SchemaLinker); reemplaza a `schema`.
     """
 
     try:
-        schema_info = "\n".join(
+        schema_info = schema_text if schema_text is not None else "\n".join(
             f"Table: {table}\nColumns: {', '.join(cols)}"
             for table, cols in schema.items()
         )
@@ -69,9 +107,10 @@ Return only the JSON. Do not include explanations.
 """
 
     try:
-        response = await client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
+        response = await llm_client.chat(
+            "parse_intent",
+            "gpt-3.5-turbo",
+            [{"role": "user", "content": prompt}],
             temperature=0
         )
 
@@ -82,6 +121,8 @@ Return only the JSON. Do not include explanations.
 
         try:
             parsed = json.loads(parsed_raw)
+            if index is not None and isinstance(parsed, dict):
+                parsed = canonicalize_intent(parsed, index)
             return parsed
         except json.JSONDecodeError:
             return {
@@ -0,0 +1,412 @@
+# app/pipeline.py
+
+import asyncio
+import inspect
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.parser import parse_intent
+from app.embedding import get_embedding
+from app.selector import select_best_template
+from app.assembler import assemble_query
+from app.complex_assembler import apply_complex_assembly
+from app.db_registry import DatabaseEntry
+from app.result_cache import query_tables
+from app.schema_linking import LinkedSchema
+from app.schema_repository import SchemaRepository
+from app.metrics import STAGE_LATENCY, ERRORS
+
+# ------------------ GRAFO DE ETAPAS ------------------
+
+class StageGraph:
+    """
+    Ejecuta etapas con dependencias: cada etapa arranca en cuanto sus entradas
+    están listas, de modo que las ramas independientes corren en paralelo.
+    Registra inicio/fin de cada etapa para reconstruir la ruta crítica.
+    `on_complete(name, result, span)` se invoca al terminar cada etapa.
+    """
+
+    def __init__(self, on_complete: Optional[Callable[[str, Any, Dict[str, float]], None]] = None):
+        self._stages: Dict[str, Tuple[Callable[..., Any], Tuple[str, ...]]] = {}
+        self.spans: Dict[str, Dict[str, float]] = {}
+        self.on_complete = on_complete
+        self._t0 = 0.0
+
+    def add(self, name: str, fn: Callable[..., Any], deps: Sequence[str] = ()) -> None:
+        """
+        Registra una etapa. `fn` recibe los resultados de `deps` en orden y puede
+        ser síncrona o devolver un awaitable. Las dependencias deben existir.
+        """
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"Unknown dependency '{dep}' for stage '{name}'")
+        self._stages[name] = (fn, tuple(deps))
+
+    async def _run_stage(self, name: str, tasks: Dict[str, "asyncio.Task"]) -> Any:
+        fn, deps = self._stages[name]
+        inputs = [await tasks[dep] for dep in deps]
+
+        start = time.perf_counter()
+        try:
+            result = fn(*inputs)
+            if inspect.isawaitable(result):
+                result = await result
+        except Exception:
+            ERRORS.inc(stage=name)
+            raise
+        end = time.perf_counter()
+        STAGE_LATENCY.observe(end - start, stage=name)
+
+        self.spans[name] = {
+            "start_ms": (start - self._t0) * 1000,
+            "end_ms": (end - self._t0) * 1000,
+            "duration_ms": (end - start) * 1000
+        }
+        if self.on_complete is not None:
+            self.on_complete(name, result, self.spans[name])
+        return result
+
+    async def run(self) -> Dict[str, Any]:
+        self._t0 = time.perf_counter()
+        self.spans = {}
+
+        tasks: Dict[str, asyncio.Task] = {}
+        for name in self._stages:
+            tasks[name] = asyncio.create_task(self._run_stage(name, tasks))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+        return {name: task.result() for name, task in tasks.items()}
+
+    def critical_path(self) -> List[str]:
+        """
+        Recorre hacia atrás desde la etapa que terminó última, eligiendo siempre
+        la dependencia que terminó más tarde (la que realmente la bloqueó).
+        """
+        if not self.spans:
+            return []
+
+        current = max(self.spans, key=lambda n: self.spans[n]["end_ms"])
+        path = [current]
+        while True:
+            deps = [d for d in self._stages[current][1] if d in self.spans]
+            if not deps:
+                break
+            current = max(deps, key=lambda d: self.spans[d]["end_ms"])
+            path.append(current)
+
+        path.reverse()
+        return path
+
+    def timings(self) -> Dict[str, Any]:
+        total = max((s["end_ms"] for s in self.spans.values()), default=0.0)
+        return {
+            "total_ms": total,
+            "critical_path": self.critical_path(),
+            "stages": self.spans
+        }
+
+# ------------------ PIPELINE NL → SQL ------------------
+
+def build_sql_pipeline(
+    nl_query: str,
+    database: DatabaseEntry,
+    repo: Optional[SchemaRepository] = None,
+    embedding: Optional[Awaitable[List[float]]] = None
+) -> StageGraph:
+    """
+    Arma el grafo de /generate-sql. El embedding solo depende de la pregunta,
+    así que corre en paralelo con la carga de esquema y con la intención: el
+    enlace de esquema del prompt de intención es léxico (solo necesita el
+    esquema). El recorte por embedding se aplica después, en el enriquecimiento.
+    `repo` (ya cargado al consultar la caché de resultados) no se vuelve a
+    pedir; `embedding` es la tarea ya en vuelo del embedding, si la hay.
+    """
+    graph = StageGraph()
+
+    graph.add("schema", (lambda: repo) if repo is not None else database.schema_cache.aget)
+    graph.add("embedding", (lambda: embedding) if embedding is not None else (lambda: get_embedding(nl_query)))
+    graph.add(
+        "schema_linking",
+        lambda repo: database.linker.link(repo, nl_query, None, site="parse_intent"),
+        deps=["schema"]
+    )
+    graph.add(
+        "intent",
+        lambda repo, linked: parse_intent(
+            nl_query,
+            schema=repo.get_schema_dict()["columns"],
+            index=repo.get_index(),
+            schema_text=linked.text
+        ),
+        deps=["schema", "schema_linking"]
+    )
+    graph.add(
+        "selection",
+        lambda embedding, intent: select_best_template(embedding, intent),
+        deps=["embedding", "intent"]
+    )
+    graph.add(
+        "assembly",
+        lambda selected, intent, repo: assemble_query(selected["template"], intent, index=repo.get_index()),
+        deps=["selection", "intent", "schema"]
+    )
+    graph.add(
+        "enrichment",
+        lambda assembled, intent, repo, embedding, selected: apply_complex_assembly(
+            assembled["query"], intent, nl_query, repo,
+            linker=database.linker, question_embedding=embedding, template=selected["template"]
+        ),
+        deps=["assembly", "intent", "schema", "embedding", "selection"]
+    )
+    graph.add(
+        "validation",
+        lambda enriched: database.pool.avalidate(enriched["query"]),
+        deps=["enrichment"]
+    )
+    return graph
+
+
+def format_result(
+    nl_query: str,
+    intent: Dict,
+    embedding: List[float],
+    selected: Dict,
+    assembled: Dict,
+    enriched: Dict,
+    validation: Dict,
+    linked: Optional[LinkedSchema] = None
+) -> Dict[str, Any]:
+    """Respuesta común a /generate-sql y al endpoint por lotes."""
+    response = {
+        "status": "parsed",
+        "input": nl_query,
+        "intent": intent,
+        "embedding_preview": embedding[:5],
+        "selected_template": selected,
+        "final_query": enriched["query"],
+        "missing_fields": assembled["missing_fields"],
+        "enrichment_notes": enriched["notes"],
+        "validation": validation
+    }
+    if linked is not None:
+        response["schema_context"] = linked.to_dict()
+    return response
+
+
+def _result_from_graph(nl_query: str, graph: StageGraph, results: Dict[str, Any]) -> Dict[str, Any]:
+    response = format_result(
+        nl_query,
+        results["intent"],
+        results["embedding"],
+        results["selection"],
+        results["assembly"],
+        results["enrichment"],
+        results["validation"],
+        results["schema_linking"]
+    )
+    response["timings"] = graph.timings()
+    return response
+
+
+# ------------------ CACHÉ DE RESULTADOS ------------------
+
+# Partes de la respuesta que se guardan y se devuelven tal cual en un acierto
+CACHED_FIELDS = (
+    "intent", "embedding_preview", "selected_template", "final_query",
+    "missing_fields", "enrichment_notes", "validation"
+)
+
+
+async def lookup_exact_result(
+    nl_query: str,
+    database: DatabaseEntry
+) -> Tuple[Optional[Dict[str, Any]], SchemaRepository]:
+    """
+    (acierto, esquema) del nivel exacto, que solo necesita el esquema. El
+    semántico necesita el embedding: se consulta cuando termina esa etapa del
+    grafo, que ya arrancó la intención en paralelo (y se cancela si acierta).
+    """
+    repo = await database.schema_cache.aget()
+    return database.results.get_exact(repo.fingerprint, nl_query), repo
+
+
+async def _similar_result(
+    nl_query: str,
+    database: DatabaseEntry,
+    repo: SchemaRepository,
+    embedding: Awaitable[List[float]]
+) -> Optional[Dict[str, Any]]:
+    try:
+        vector = await embedding
+    except Exception:
+        # El fallo del embedding lo reporta la etapa correspondiente del grafo
+        return None
+    return database.results.get_similar(repo.fingerprint, nl_query, vector)
+
+
+def _cached_with_timings(nl_query: str, hit: Dict[str, Any], start: float, include_timings: bool) -> Dict[str, Any]:
+    response = cached_response(nl_query, hit)
+    if include_timings:
+        total = (time.perf_counter() - start) * 1000
+        response["timings"] = {"total_ms": total, "critical_path": ["result_cache"], "stages": {}}
+    return response
+
+
+def cached_response(nl_query: str, hit: Dict[str, Any]) -> Dict[str, Any]:
+    response = {"status": "parsed", "input": nl_query}
+    response.update(hit["result"])
+    response["cache"] = {
+        "tier": hit["tier"],
+        "similarity": hit["similarity"],
+        "matched_question": hit["question"]
+    }
+    return response
+
+
+def remember_result(
+    database: DatabaseEntry,
+    repo: SchemaRepository,
+    nl_query: str,
+    embedding: Optional[List[float]],
+    response: Dict[str, Any]
+) -> None:
+    """Guarda la respuesta si pasó la validación (un error no se repite desde caché)."""
+    if not response["validation"].get("valid"):
+        return
+    tables = query_tables(response["final_query"], repo.get_tables())
+    tables |= {t for t in response["intent"].get("tables") or [] if isinstance(t, str)}
+    database.results.put(
+        repo.fingerprint,
+        nl_query,
+        embedding,
+        {field: response[field] for field in CACHED_FIELDS},
+        frozenset(tables)
+    )
+
+
+async def run_sql_pipeline(
+    nl_query: str,
+    database: DatabaseEntry,
+    include_timings: bool = False,
+    use_cache: bool = True
+) -> Dict[str, Any]:
+    start = time.perf_counter()
+    repo = None
+    if use_cache:
+        hit, repo = await lookup_exact_result(nl_query, database)
+        if hit is not None:
+            return _cached_with_timings(nl_query, hit, start, include_timings)
+
+    # El grafo arranca ya; el nivel semántico se decide en cuanto llega el embedding
+    embedding_task = asyncio.ensure_future(get_embedding(nl_query))
+    graph = build_sql_pipeline(nl_query, database, repo, embedding_task)
+    run_task = asyncio.create_task(graph.run())
+    try:
+        if use_cache:
+            hit = await _similar_result(nl_query, database, repo, embedding_task)
+            if hit is not None:
+                return _cached_with_timings(nl_query, hit, start, include_timings)
+        results = await run_task
+    finally:
+        if not run_task.done():
+            run_task.cancel()
+        if not embedding_task.done():
+            embedding_task.cancel()
+
+    response = _result_from_graph(nl_query, graph, results)
+    remember_result(database, results["schema"], nl_query, results["embedding"], response)
+    if not include_timings:
+        response.pop("timings")
+    return response
+
+# ------------------ EVENTOS POR ETAPA (STREAMING) ------------------
+
+def stage_payload(name: str, result: Any) -> Any:
+    """Parte de cada etapa que se envía al cliente (sin el esquema ni el vector completo)."""
+    if name == "schema":
+        return {"tables": len(result.get_tables())}
+    if name == "embedding":
+        return {"embedding_preview": result[:5], "dimensions": len(result)}
+    if name == "schema_linking":
+        return result.to_dict()
+    return result
+
+
+async def iter_sql_pipeline_events(
+    nl_query: str,
+    database: DatabaseEntry,
+    use_cache: bool = True
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Ejecuta el pipeline y produce un evento por etapa en cuanto termina,
+    seguido de un evento final "result" (o "error" si alguna etapa falla).
+    Un acierto exacto de la caché de resultados produce directamente el
+    "result"; uno semántico, en cuanto llega el evento "embedding" (y se
+    cancela el resto del grafo).
+    """
+    start = time.perf_counter()
+    repo = None
+    if use_cache:
+        try:
+            hit, repo = await lookup_exact_result(nl_query, database)
+        except Exception as e:
+            yield {"event": "error", "data": {"error": str(e)}}
+            return
+        if hit is not None:
+            yield {
+                "event": "result",
+                "elapsed_ms": (time.perf_counter() - start) * 1000,
+                "data": cached_response(nl_query, hit)
+            }
+            return
+
+    queue: asyncio.Queue = asyncio.Queue()
+    graph = build_sql_pipeline(nl_query, database, repo)
+    graph.on_complete = lambda name, result, span: queue.put_nowait((name, result, span))
+
+    run_task = asyncio.create_task(graph.run())
+    run_task.add_done_callback(lambda _: queue.put_nowait(None))
+
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            name, result, span = item
+            yield {
+                "event": name,
+                "elapsed_ms": span["end_ms"],
+                "data": stage_payload(name, result)
+            }
+            if use_cache and name == "embedding":
+                hit = database.results.get_similar(repo.fingerprint, nl_query, result)
+                if hit is not None:
+                    run_task.cancel()
+                    yield {
+                        "event": "result",
+                        "elapsed_ms": (time.perf_counter() - start) * 1000,
+                        "data": cached_response(nl_query, hit)
+                    }
+                    return
+
+        results = run_task.result()
+        response = _result_from_graph(nl_query, graph, results)
+        remember_result(database, results["schema"], nl_query, results["embedding"], response)
+        yield {
+            "event": "result",
+            "elapsed_ms": graph.timings()["total_ms"],
+            "data": response
+        }
+
+    except Exception as e:
+        yield {"event": "error", "data": {"error": str(e)}}
+
+    finally:
+        if not run_task.done():
+            run_task.cancel()
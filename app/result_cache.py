@@ -0,0 +1,291 @@
+# app/result_cache.py
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_SIMILARITY, RESULT_CACHE_TTL
+from app.embedding_cache import normalize_text
+from app.embedding_providers import SQL_CONCEPTS
+from app.metrics import CACHE_REQUESTS
+from app.schema_linking import tokenize
+from app.schema_repository import SchemaChange
+
+# Números y literales entre comillas de la pregunta ("older than 30" ≠ "older than 40")
+_LITERAL_RE = re.compile(r"\d+(?:\.\d+)?|'[^']*'|\"[^\"]*\"")
+_QUOTED_IDENT_RE = re.compile(r'"((?:[^"]|"")+)"')
+# Palabras que solo expresan la operación SQL (además de las stopwords que ya quita tokenize)
+_GENERIC_WORDS = frozenset(tokenize(" ".join(SQL_CONCEPTS)))
+
+# Filas iniciales de la matriz semántica; crece al doble hasta max_entries
+_INITIAL_SLOTS = 64
+
+
+def question_entities(question: str) -> FrozenSet[str]:
+    """
+    Lo que una paráfrasis no puede cambiar: literales y toda palabra de
+    contenido que no sea genérica (tablas, columnas y valores como "france").
+    Dos preguntas solo comparten resultado semántico si estos conjuntos son
+    iguales: "customers in France" ≠ "customers in Germany".
+    """
+    return frozenset(_LITERAL_RE.findall(normalize_text(question))) | (tokenize(question) - _GENERIC_WORDS)
+
+
+def query_tables(sql: str, known_tables: Iterable[str]) -> FrozenSet[str]:
+    """Tablas del esquema citadas en la consulta (identificadores entre comillas dobles)."""
+    known = set(known_tables)
+    return frozenset(
+        name for name in (m.replace('""', '"') for m in _QUOTED_IDENT_RE.findall(sql)) if name in known
+    )
+
+
+class CachedResult:
+    __slots__ = ("question", "fingerprint", "result", "tables", "entities", "slot", "created_at")
+
+    def __init__(
+        self,
+        question: str,
+        fingerprint: Optional[str],
+        result: Dict[str, Any],
+        tables: FrozenSet[str],
+        slot: Optional[int]
+    ):
+        self.question = question
+        self.fingerprint = fingerprint
+        self.result = result
+        self.tables = tables
+        self.entities = question_entities(question)
+        self.slot = slot
+        self.created_at = time.monotonic()
+
+
+class ResultCache:
+    """
+    Caché de resultados completos del pipeline (intención, plantilla, SQL final
+    y validación) de una base de datos, en dos niveles:
+    - exacto: (huella de esquema, pregunta normalizada),
+    - semántico: la pregunta en caché más parecida por coseno de embeddings, si
+      supera `threshold` y nombra las mismas entidades (`question_entities`).
+    Los embeddings viven en una matriz (una fila por entrada) que crece al
+    doble según hace falta, así que buscar es un producto matriz-vector y la
+    memoria sigue al uso (`memory_bytes`). Expulsión LRU acotada a
+    `max_entries` y por `ttl` segundos. Un cambio de esquema descarta las
+    entradas que usan tablas afectadas (todas en una recarga completa).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+        ttl: float = RESULT_CACHE_TTL,
+        threshold: float = RESULT_CACHE_SIMILARITY
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: "OrderedDict[Tuple[Optional[str], str], CachedResult]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Nivel semántico: fila `slot` de la matriz ↔ entrada (None = libre)
+        self._matrix: Optional[np.ndarray] = None
+        self._slot_keys: List[Optional[Tuple[Optional[str], str]]] = []
+        self._free: List[int] = []
+        # Callback con los nuevos bytes de la matriz al crecer o vaciarse (presupuesto del registro)
+        self.on_resize: Optional[Callable[[int], None]] = None
+
+        # Contadores
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _expired(self, entry: CachedResult) -> bool:
+        return self.ttl > 0 and (time.monotonic() - entry.created_at) >= self.ttl
+
+    # ------------------ NIVEL SEMÁNTICO ------------------
+
+    def _grow(self, dim: int) -> None:
+        rows = 0 if self._matrix is None else self._matrix.shape[0]
+        capacity = min(self.max_entries, max(_INITIAL_SLOTS, rows * 2))
+        if capacity <= rows:
+            return
+        matrix = np.zeros((capacity, dim), dtype=np.float32)
+        if self._matrix is not None:
+            matrix[:rows] = self._matrix
+        self._matrix = matrix
+        self._slot_keys.extend([None] * (capacity - rows))
+        # Los slots nuevos se entregan en orden ascendente (pop desde el final)
+        self._free = list(range(capacity - 1, rows - 1, -1)) + self._free
+        self._resized()
+
+    def _alloc_slot(self, key: Tuple[Optional[str], str], vector: np.ndarray) -> Optional[int]:
+        if self._matrix is None or not self._free:
+            self._grow(vector.shape[0])
+        if vector.shape[0] != self._matrix.shape[1] or not self._free:
+            return None
+        slot = self._free.pop()
+        self._matrix[slot] = vector
+        self._slot_keys[slot] = key
+        return slot
+
+    def _release(self, entry: CachedResult) -> None:
+        if entry.slot is not None:
+            self._matrix[entry.slot] = 0.0
+            self._slot_keys[entry.slot] = None
+            self._free.append(entry.slot)
+            entry.slot = None
+
+    def _remove(self, key: Tuple[Optional[str], str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._release(entry)
+
+    # ------------------ CONSULTA ------------------
+
+    def get_exact(self, fingerprint: Optional[str], question: str) -> Optional[Dict[str, Any]]:
+        key = (fingerprint, normalize_text(question))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                self._remove(key)
+                entry = None
+            if entry is None:
+                CACHE_REQUESTS.inc(cache="result_exact", result="miss")
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+        CACHE_REQUESTS.inc(cache="result_exact", result="hit")
+        return {"tier": "exact", "similarity": 1.0, "question": entry.question, "result": entry.result}
+
+    def get_similar(
+        self,
+        fingerprint: Optional[str],
+        question: str,
+        embedding: Sequence[float]
+    ) -> Optional[Dict[str, Any]]:
+        """Mejor entrada por coseno (con la misma huella y las mismas entidades) sobre `threshold`."""
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        entities = question_entities(question)
+        with self._lock:
+            match = None
+            if self._matrix is not None and norm and query.shape[0] == self._matrix.shape[1] and self._entries:
+                scores = self._matrix @ (query / norm)
+                # Las filas libres valen 0; se recorren los candidatos de mayor a menor
+                candidates = np.flatnonzero(scores >= self.threshold)
+                for slot in candidates[np.argsort(-scores[candidates])]:
+                    key = self._slot_keys[slot]
+                    entry = self._entries.get(key) if key is not None else None
+                    if entry is None or entry.fingerprint != fingerprint or entry.entities != entities:
+                        continue
+                    if self._expired(entry):
+                        self._remove(key)
+                        continue
+                    self._entries.move_to_end(key)
+                    self.semantic_hits += 1
+                    match = {
+                        "tier": "semantic",
+                        "similarity": float(scores[slot]),
+                        "question": entry.question,
+                        "result": entry.result
+                    }
+                    break
+            if match is None:
+                self.misses += 1
+        CACHE_REQUESTS.inc(cache="result_semantic", result="hit" if match else "miss")
+        return match
+
+    # ------------------ ESCRITURA ------------------
+
+    def put(
+        self,
+        fingerprint: Optional[str],
+        question: str,
+        embedding: Optional[Sequence[float]],
+        result: Dict[str, Any],
+        tables: FrozenSet[str] = frozenset()
+    ) -> None:
+        # RESULT_CACHE_MAX_ENTRIES=0 desactiva la caché
+        if self.max_entries <= 0:
+            return
+        key = (fingerprint, normalize_text(question))
+        vector = None
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            vector = vector / norm if norm else None
+
+        with self._lock:
+            self._remove(key)
+            while len(self._entries) >= self.max_entries:
+                _, oldest = self._entries.popitem(last=False)
+                self._release(oldest)
+                self.evictions += 1
+            slot = self._alloc_slot(key, vector) if vector is not None else None
+            self._entries[key] = CachedResult(question, fingerprint, result, tables, slot)
+
+    # ------------------ INVALIDACIÓN ------------------
+
+    def on_schema_change(self, change: SchemaChange) -> None:
+        """
+        Recarga completa: se vacía todo. Refresco incremental: se descartan las
+        entradas que usan tablas afectadas y las demás pasan a la huella nueva.
+        """
+        with self._lock:
+            if change.full:
+                self.invalidations += len(self._entries)
+                self._clear()
+                return
+            touched = change.tables
+            entries = list(self._entries.items())
+            self._entries.clear()
+            for (_, normalized), entry in entries:
+                if entry.tables & touched:
+                    self._release(entry)
+                    self.invalidations += 1
+                    continue
+                entry.fingerprint = change.fingerprint
+                key = (change.fingerprint, normalized)
+                self._entries[key] = entry
+                if entry.slot is not None:
+                    self._slot_keys[entry.slot] = key
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._matrix = None
+        self._slot_keys = []
+        self._free = []
+        self._resized()
+
+    def _resized(self) -> None:
+        if self.on_resize is not None:
+            self.on_resize(self.memory_bytes())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def memory_bytes(self) -> int:
+        """Memoria de la matriz semántica (lo que pesa de verdad; las entradas son respuestas chicas)."""
+        matrix = self._matrix
+        return matrix.nbytes if matrix is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_bytes": self.memory_bytes(),
+            "ttl_seconds": self.ttl,
+            "similarity_threshold": self.threshold,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
@@ -0,0 +1,160 @@
+# app/schema_cache.py
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.schema_repository import SchemaRepository, SchemaChange
+from app.metrics import CACHE_REQUESTS, STAGE_LATENCY, SCHEMA_CHANGES
+from app.db_executor import run_db
+
+
+class SchemaCache:
+    """
+    Caché de esquema de vida larga, compartida por todas las peticiones.
+    Introspecciona la base de datos una sola vez y reutiliza el resultado
+    hasta que vence el TTL o se invalida explícitamente. Al vencer el TTL
+    solo se recargan las relaciones que cambiaron (refresco incremental) y
+    se avisa a los suscriptores con un SchemaChange.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], SchemaRepository],
+        ttl: float = 300.0,
+        incremental: bool = True
+    ):
+        self._loader = loader
+        self.ttl = ttl
+        self.incremental = incremental
+        self._repo: Optional[SchemaRepository] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[SchemaChange], None]] = []
+
+        # Contadores
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.refreshes = 0
+
+    def _is_fresh(self) -> bool:
+        if self._repo is None:
+            return False
+        return self.ttl <= 0 or (time.monotonic() - self._loaded_at) < self.ttl
+
+    def subscribe(self, listener: Callable[[SchemaChange], None]) -> None:
+        """Registra un callback que recibe cada SchemaChange (refrescos y recargas completas)."""
+        self._listeners.append(listener)
+
+    def _notify(self, change: SchemaChange) -> None:
+        for listener in self._listeners:
+            try:
+                listener(change)
+            except Exception as e:
+                print(f"⚠️ Schema change listener failed: {e}")
+
+    def _refresh_current(self, repo: SchemaRepository) -> SchemaChange:
+        with STAGE_LATENCY.time(stage="schema_refresh"):
+            change = repo.refresh()
+        self._loaded_at = time.monotonic()
+        self.refreshes += 1
+        if change:
+            for kind in ("added", "dropped", "altered"):
+                count = len(getattr(change, kind))
+                if count:
+                    SCHEMA_CHANGES.inc(count, kind=kind)
+            self._notify(change)
+        return change
+
+    def _reload(self, full: bool = False) -> SchemaRepository:
+        current = self._repo
+        if current is not None and self.incremental and not full:
+            try:
+                self._refresh_current(current)
+            except Exception as e:
+                # Mejor un esquema algo viejo que fallar la petición; se reintenta al vencer el TTL
+                print(f"⚠️ Incremental schema refresh failed, serving cached schema: {e}")
+                self._loaded_at = time.monotonic()
+            return current
+
+        with STAGE_LATENCY.time(stage="schema_introspection"):
+            repo = self._loader()
+            # Construir el índice aquí (fuera del event loop) y no en la primera petición
+            repo.get_index()
+        # El esquema queda en memoria; no hace falta retener la conexión
+        repo.close()
+        self._repo = repo
+        self._loaded_at = time.monotonic()
+        self.reloads += 1
+        self._notify(SchemaChange([], [], [], fingerprint=repo.fingerprint, full=True))
+        return repo
+
+    def load(self) -> SchemaRepository:
+        """Fuerza una carga completa (usado al arrancar la aplicación)."""
+        with self._lock:
+            return self._reload(full=True)
+
+    def refresh(self) -> SchemaChange:
+        """Refresco incremental inmediato; si no hay esquema cargado, hace una carga completa."""
+        with self._lock:
+            if self._repo is None:
+                repo = self._reload(full=True)
+                return SchemaChange([], [], [], fingerprint=repo.fingerprint, full=True)
+            return self._refresh_current(self._repo)
+
+    def get(self) -> SchemaRepository:
+        repo = self._repo
+        if repo is not None and self._is_fresh():
+            self.hits += 1
+            CACHE_REQUESTS.inc(cache="schema", result="hit")
+            return repo
+
+        with self._lock:
+            # Otro hilo pudo haber recargado mientras esperábamos el lock
+            if self._is_fresh():
+                self.hits += 1
+                CACHE_REQUESTS.inc(cache="schema", result="hit")
+                return self._repo  # type: ignore[return-value]
+            self.misses += 1
+            CACHE_REQUESTS.inc(cache="schema", result="miss")
+            return self._reload()
+
+    async def aget(self) -> SchemaRepository:
+        """
+        Variante asíncrona de `get`: un acierto se resuelve en el event loop y
+        una recarga se ejecuta en el pool de base de datos.
+        """
+        repo = self._repo
+        if repo is not None and self._is_fresh():
+            self.hits += 1
+            CACHE_REQUESTS.inc(cache="schema", result="hit")
+            return repo
+        return await run_db(self.get)
+
+    async def aload(self) -> SchemaRepository:
+        return await run_db(self.load)
+
+    def peek(self) -> Optional[SchemaRepository]:
+        """Esquema cargado actualmente, sin contar acierto ni forzar una recarga."""
+        return self._repo
+
+    def invalidate(self) -> None:
+        """Descarta el esquema cacheado; la próxima petición lo recarga."""
+        with self._lock:
+            self._repo = None
+            self._loaded_at = 0.0
+
+    def stats(self) -> Dict:
+        age = time.monotonic() - self._loaded_at if self._repo is not None else None
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "refreshes": self.refreshes,
+            "ttl": self.ttl,
+            "age_seconds": age,
+            "loaded": self._repo is not None,
+            "fingerprint": self._repo.fingerprint if self._repo is not None else None,
+            "from_snapshot": self._repo.loaded_from_snapshot if self._repo is not None else False
+        }
@@ -0,0 +1,138 @@
+# app/schema_index.py
+
+import sys
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+
+class SchemaIndex:
+    """
+    Vista indexada e inmutable del esquema de SchemaRepository:
+    - pertenencia de columnas por tabla con conjuntos (O(1)),
+    - índice invertido columna → tablas, sin distinguir mayúsculas,
+    - grafo de FKs con vecinos precalculados y condiciones de JOIN por arista.
+    Los identificadores se internan para que las comparaciones sean baratas.
+    """
+
+    def __init__(self, schema: Dict, fingerprint: Optional[str] = None, _build: bool = True):
+        self.fingerprint = fingerprint
+        if not _build:
+            return
+
+        self._set_tables(schema)
+        self.columns: Dict[str, FrozenSet[str]] = {}
+        self._column_lookup: Dict[str, Dict[str, str]] = {}
+        column_tables: Dict[str, List[str]] = {}
+
+        for table, cols in schema.get("columns", {}).items():
+            self._add_table_columns(sys.intern(table), cols, column_tables)
+
+        self.column_tables: Dict[str, Tuple[str, ...]] = {
+            col: tuple(owners) for col, owners in column_tables.items()
+        }
+        self._build_fk_graph(schema)
+
+    def _set_tables(self, schema: Dict) -> None:
+        self.tables: Tuple[str, ...] = tuple(sys.intern(t) for t in schema.get("tables", []))
+        self._table_lookup: Dict[str, str] = {t.lower(): t for t in self.tables}
+
+    def _add_table_columns(self, table: str, cols: List[str], column_tables: Dict[str, List[str]]) -> None:
+        names = [sys.intern(c) for c in cols]
+        self.columns[table] = frozenset(names)
+        self._column_lookup[table] = {c.lower(): c for c in names}
+        for col in names:
+            owners = column_tables.setdefault(col.lower(), [])
+            if table not in owners:
+                owners.append(table)
+
+    def patched(self, schema: Dict, change, fingerprint: Optional[str] = None) -> "SchemaIndex":
+        """
+        Nuevo índice para `schema` que solo recalcula las tablas de `change`
+        (un SchemaChange); el resto de entradas se comparte con este índice.
+        El grafo de FKs se reconstruye porque es proporcional al número de FKs.
+        """
+        touched = change.tables
+        index = SchemaIndex(schema, fingerprint, _build=False)
+        index._set_tables(schema)
+
+        index.columns = {t: c for t, c in self.columns.items() if t not in touched}
+        index._column_lookup = {t: c for t, c in self._column_lookup.items() if t not in touched}
+
+        # Quitar las tablas tocadas solo de las entradas del índice invertido que las contienen
+        column_tables: Dict[str, List[str]] = {}
+        for table in touched:
+            for col in self.columns.get(table, ()):
+                key = col.lower()
+                if key not in column_tables:
+                    column_tables[key] = [t for t in self.column_tables.get(key, ()) if t not in touched]
+
+        for table in list(change.added) + list(change.altered):
+            cols = schema["columns"].get(table, [])
+            for col in cols:
+                key = col.lower()
+                if key not in column_tables:
+                    column_tables[key] = [t for t in self.column_tables.get(key, ()) if t not in touched]
+            index._add_table_columns(sys.intern(table), cols, column_tables)
+
+        index.column_tables = dict(self.column_tables)
+        for key, owners in column_tables.items():
+            if owners:
+                index.column_tables[key] = tuple(owners)
+            else:
+                index.column_tables.pop(key, None)
+
+        index._build_fk_graph(schema)
+        return index
+
+    def _build_fk_graph(self, schema: Dict) -> None:
+        intern = sys.intern
+        # Grafo no dirigido de FKs; cada arista guarda sus condiciones orientadas
+        neighbors: Dict[str, List[str]] = {t: [] for t in self.tables}
+        self._edges: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+
+        for fk in schema.get("foreign_keys", []):
+            # Sin columna destino no hay condición de JOIN posible (la carga ya
+            # resuelve el destino implícito de SQLite a la clave primaria)
+            if not fk.get("to_column"):
+                continue
+            src, dst = intern(fk["from_table"]), intern(fk["to_table"])
+            src_col, dst_col = intern(fk["from_column"]), intern(fk["to_column"])
+            self._edges.setdefault((src, dst), []).append((src_col, dst_col))
+            if src != dst:
+                self._edges.setdefault((dst, src), []).append((dst_col, src_col))
+            for a, b in ((src, dst), (dst, src)):
+                adjacent = neighbors.setdefault(a, [])
+                if b != a and b not in adjacent:
+                    adjacent.append(b)
+
+        self.neighbors: Dict[str, Tuple[str, ...]] = {t: tuple(n) for t, n in neighbors.items()}
+
+    # ------------------ TABLAS Y COLUMNAS ------------------
+
+    def has_table(self, table: str) -> bool:
+        return table in self.columns
+
+    def canonical_table(self, table: str) -> Optional[str]:
+        """Nombre de tabla tal como está en el esquema (búsqueda sin mayúsculas)."""
+        return self._table_lookup.get(table.strip('"').lower())
+
+    def has_column(self, table: str, column: str) -> bool:
+        return column in self.columns.get(table, ())
+
+    def canonical_column(self, table: str, column: str) -> Optional[str]:
+        lookup = self._column_lookup.get(table)
+        if lookup is None:
+            return None
+        return lookup.get(column.strip('"').lower())
+
+    def tables_with_column(self, column: str) -> Tuple[str, ...]:
+        """Tablas que contienen una columna con ese nombre (sin distinguir mayúsculas)."""
+        return self.column_tables.get(column.strip('"').lower(), ())
+
+    # ------------------ GRAFO DE FKs ------------------
+
+    def neighbors_of(self, table: str) -> Tuple[str, ...]:
+        return self.neighbors.get(table, ())
+
+    def join_conditions(self, left: str, right: str) -> List[Tuple[str, str]]:
+        """Pares (columna en `left`, columna en `right`) de las FKs que unen ambas tablas."""
+        return self._edges.get((left, right), [])
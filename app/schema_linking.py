@@ -0,0 +1,311 @@
+# app/schema_linking.py
+
+import asyncio
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.embedding import get_embeddings
+from app.schema_repository import SchemaRepository, SchemaChange
+from app.metrics import PROMPT_SCHEMA_TOKENS, STAGE_LATENCY
+from app.config import (
+    SCHEMA_LINK_TOP_K,
+    SCHEMA_LINK_MIN_TABLES,
+    SCHEMA_LINK_EMBEDDINGS,
+    SCHEMA_LINK_EMBEDDING_WEIGHT
+)
+
+# Palabras de la pregunta que no ayudan a elegir tablas
+_STOPWORDS = frozenset(
+    "a an the of in on at to for by with from and or not is are was were be what which who whom "
+    "how many much show list give find get all each every their its that this those these there "
+    "than more most less least number count average avg total sum max min".split()
+)
+
+_WORD_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+# Aproximación estándar para modelos GPT: ~4 caracteres por token
+CHARS_PER_TOKEN = 4
+
+# Límite de entradas por llamada a la API de embeddings
+EMBEDDING_CHUNK = 1000
+
+# Segundos antes de reintentar un calentamiento de embeddings que falló
+WARM_RETRY_SECONDS = 60.0
+
+
+def tokenize(text: str) -> Set[str]:
+    """Palabras en minúsculas y en singular; separa snake_case y camelCase."""
+    words = set()
+    for word in _WORD_RE.findall(text):
+        word = word.lower()
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.add(word)
+    return words
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def format_table(table: str, columns: Sequence, quoted: bool = False) -> str:
+    """Fragmento de prompt de una tabla, en el formato que ya usaban los prompts."""
+    names = [col["name"] if isinstance(col, dict) and "name" in col else str(col) for col in columns]
+    if quoted:
+        names = [f'"{name}"' for name in names]
+    return f"Table: {table}\nColumns: {', '.join(names)}"
+
+
+class LinkedSchema:
+    """Resultado del enlace de esquema: tablas elegidas, texto del prompt y tokens estimados."""
+
+    def __init__(self, tables: List[str], text: str, full_tokens: int, pruned: bool):
+        self.tables = tables
+        self.text = text
+        self.full_tokens = full_tokens
+        self.tokens = estimate_tokens(text)
+        self.pruned = pruned
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(self.full_tokens - self.tokens, 0)
+
+    def to_dict(self) -> Dict:
+        return {
+            "tables": self.tables,
+            "pruned": self.pruned,
+            "estimated_tokens": self.tokens,
+            "estimated_tokens_saved": self.tokens_saved
+        }
+
+
+class SchemaLinker:
+    """
+    Elige las tablas relevantes para una pregunta y arma el fragmento de
+    esquema que va en los prompts, en lugar del esquema completo:
+    - puntaje léxico (palabras de la pregunta vs. nombres de tabla y columna),
+    - más, si hay embedding de la pregunta, similitud con el embedding de cada tabla,
+    - se envían las `top_k` mejores más sus vecinas por FK (y las tablas forzadas).
+    Los fragmentos formateados, los tokens y los embeddings se cachean por
+    (huella de esquema, tabla); `on_schema_change` (suscrito a la SchemaCache)
+    pasa a la huella nueva las tablas que no cambiaron y descarta el resto.
+    Los embeddings de tablas se calculan en segundo plano (`schedule_warm`):
+    mientras no estén, el ranking es solo léxico y la petición no espera.
+    """
+
+    def __init__(
+        self,
+        top_k: int = SCHEMA_LINK_TOP_K,
+        min_tables: int = SCHEMA_LINK_MIN_TABLES,
+        use_embeddings: bool = SCHEMA_LINK_EMBEDDINGS,
+        embedding_weight: float = SCHEMA_LINK_EMBEDDING_WEIGHT
+    ):
+        self.top_k = top_k
+        self.min_tables = min_tables
+        self.use_embeddings = use_embeddings
+        self.embedding_weight = embedding_weight
+        self._lock = threading.Lock()
+        # Claves: (huella, tabla, quoted), (huella, tabla), (huella, tabla) y (huella, quoted)
+        self._fragments: Dict[Tuple[Optional[str], str, bool], str] = {}
+        self._words: Dict[Tuple[Optional[str], str], Tuple[Set[str], Set[str]]] = {}
+        self._vectors: Dict[Tuple[Optional[str], str], np.ndarray] = {}
+        self._full_tokens: Dict[Tuple[Optional[str], bool], int] = {}
+        # Un solo calentamiento de embeddings a la vez; huella del que está en curso
+        self._embed_lock = asyncio.Lock()
+        self._warming: Optional[str] = None
+        self._warm_task: Optional[asyncio.Task] = None
+        self._warm_retry_at = 0.0
+
+    # ------------------ CACHÉ POR TABLA ------------------
+
+    def on_schema_change(self, change: SchemaChange) -> None:
+        with self._lock:
+            if change.full:
+                self._fragments.clear()
+                self._words.clear()
+                self._vectors.clear()
+            else:
+                # Las tablas intactas pasan a la huella nueva; las tocadas y las de huellas viejas se descartan
+                touched = change.tables
+                fingerprint = change.fingerprint
+                self._fragments = {
+                    (fingerprint, k[1], k[2]): v for k, v in self._fragments.items() if k[1] not in touched
+                }
+                self._words = {(fingerprint, k[1]): v for k, v in self._words.items() if k[1] not in touched}
+                self._vectors = {(fingerprint, k[1]): v for k, v in self._vectors.items() if k[1] not in touched}
+            self._full_tokens.clear()
+
+    def fragment(self, repo: SchemaRepository, table: str, quoted: bool = False) -> str:
+        key = (repo.fingerprint, table, quoted)
+        text = self._fragments.get(key)
+        if text is None:
+            text = format_table(table, repo.get_schema_dict()["columns"].get(table, []), quoted)
+            with self._lock:
+                self._fragments[key] = text
+        return text
+
+    def render(self, repo: SchemaRepository, tables: Iterable[str], quoted: bool = False) -> str:
+        return "\n".join(self.fragment(repo, table, quoted) for table in tables)
+
+    def full_tokens(self, repo: SchemaRepository, quoted: bool = False) -> int:
+        """Tokens estimados del esquema completo (lo que se enviaba antes)."""
+        key = (repo.fingerprint, quoted)
+        total = self._full_tokens.get(key)
+        if total is None:
+            columns = repo.get_schema_dict()["columns"]
+            # +1 por el salto de línea entre fragmentos
+            total = sum(estimate_tokens(self.fragment(repo, t, quoted)) + 1 for t in columns)
+            with self._lock:
+                self._full_tokens[key] = total
+        return total
+
+    def _table_words(self, repo: SchemaRepository, table: str) -> Tuple[Set[str], Set[str]]:
+        key = (repo.fingerprint, table)
+        words = self._words.get(key)
+        if words is None:
+            columns = repo.get_schema_dict()["columns"].get(table, [])
+            column_words: Set[str] = set()
+            for col in columns:
+                column_words |= tokenize(str(col))
+            words = (tokenize(table), column_words)
+            with self._lock:
+                self._words[key] = words
+        return words
+
+    def _table_vectors(self, repo: SchemaRepository, tables: Sequence[str]) -> Optional[np.ndarray]:
+        """Embeddings normalizados de las tablas, o None si falta alguno (aún no calentados)."""
+        fingerprint = repo.fingerprint
+        with self._lock:
+            vectors = [self._vectors.get((fingerprint, t)) for t in tables]
+        if any(v is None for v in vectors):
+            return None
+        return np.stack(vectors)
+
+    async def warm(self, repo: SchemaRepository) -> None:
+        """Calcula los embeddings de las tablas que falten (una llamada por lote)."""
+        fingerprint = repo.fingerprint
+        async with self._embed_lock:
+            with self._lock:
+                missing = [t for t in repo.get_schema_dict()["columns"] if (fingerprint, t) not in self._vectors]
+            try:
+                with STAGE_LATENCY.time(stage="schema_embedding"):
+                    for start in range(0, len(missing), EMBEDDING_CHUNK):
+                        chunk = missing[start:start + EMBEDDING_CHUNK]
+                        vectors = await get_embeddings([self.fragment(repo, t) for t in chunk])
+                        normalized = {}
+                        for table, vector in zip(chunk, vectors):
+                            v = np.asarray(vector, dtype=np.float32)
+                            norm = np.linalg.norm(v)
+                            normalized[(fingerprint, table)] = v / norm if norm else v
+                        with self._lock:
+                            self._vectors.update(normalized)
+            except Exception as e:
+                print(f"⚠️ Schema embeddings unavailable, using lexical linking only: {e}")
+                self._warm_retry_at = time.monotonic() + WARM_RETRY_SECONDS
+            finally:
+                self._warming = None
+
+    def schedule_warm(self, repo: SchemaRepository) -> None:
+        """Lanza `warm` en segundo plano (una vez por huella) desde el event loop."""
+        if not self.use_embeddings or self._warming == repo.fingerprint or time.monotonic() < self._warm_retry_at:
+            return
+        self._warming = repo.fingerprint
+        self._warm_task = asyncio.get_running_loop().create_task(self.warm(repo))
+
+    # ------------------ RANKING ------------------
+
+    def lexical_scores(self, repo: SchemaRepository, question: str, tables: Sequence[str]) -> np.ndarray:
+        """Coincidencias con el nombre de la tabla valen el doble que con sus columnas."""
+        words = tokenize(question)
+        scores = np.zeros(len(tables), dtype=np.float32)
+        if not words:
+            return scores
+        for i, table in enumerate(tables):
+            table_words, column_words = self._table_words(repo, table)
+            scores[i] = 2 * len(words & table_words) + len(words & column_words)
+        return scores
+
+    async def rank(
+        self,
+        repo: SchemaRepository,
+        question: str,
+        question_embedding: Optional[Sequence[float]] = None
+    ) -> List[Tuple[str, float]]:
+        tables = list(repo.get_schema_dict()["columns"])
+        scores = self.lexical_scores(repo, question, tables)
+
+        if self.use_embeddings and question_embedding is not None and tables:
+            matrix = self._table_vectors(repo, tables)
+            if matrix is None:
+                # Primera petición con esta huella: léxico ahora, embeddings para las siguientes
+                self.schedule_warm(repo)
+            else:
+                q = np.asarray(question_embedding, dtype=np.float32)
+                sims = matrix @ (q / (np.linalg.norm(q) or 1.0))
+                # Los cosenos de ada-002 caen en un rango estrecho: se reescalan a [0, 1]
+                spread = float(sims.max() - sims.min())
+                if spread > 0:
+                    scores = scores + self.embedding_weight * (sims - sims.min()) / spread
+
+        order = sorted(range(len(tables)), key=lambda i: (-scores[i], tables[i]))
+        return [(tables[i], float(scores[i])) for i in order]
+
+    def subset(
+        self,
+        repo: SchemaRepository,
+        tables: Iterable[str],
+        quoted: bool = False,
+        site: str = "schema"
+    ) -> LinkedSchema:
+        """Fragmento con las `tables` dadas (en el orden del esquema), contando los tokens ahorrados."""
+        columns = repo.get_schema_dict()["columns"]
+        kept = set(tables)
+        selected = [t for t in columns if t in kept]
+        pruned = len(selected) < len(columns)
+        return self._account(
+            LinkedSchema(selected, self.render(repo, selected, quoted), self.full_tokens(repo, quoted), pruned),
+            site
+        )
+
+    async def link(
+        self,
+        repo: SchemaRepository,
+        question: str,
+        question_embedding: Optional[Sequence[float]] = None,
+        quoted: bool = False,
+        include: Iterable[str] = (),
+        site: str = "schema"
+    ) -> LinkedSchema:
+        """
+        Esquema para el prompt de `site`: las `top_k` tablas mejor puntuadas, las
+        de `include` y sus vecinas por FK. Con pocas tablas, o si ninguna señal
+        distingue a las tablas, se envía el esquema completo como antes.
+        """
+        columns = repo.get_schema_dict()["columns"]
+        if len(columns) <= self.min_tables:
+            return self.subset(repo, columns, quoted, site)
+
+        forced = [t for t in include if t in columns]
+        ranked = [t for t, score in await self.rank(repo, question, question_embedding) if score > 0]
+        if not ranked and not forced:
+            return self.subset(repo, columns, quoted, site)
+
+        index = repo.get_index()
+        selected = list(dict.fromkeys(forced + ranked[:self.top_k]))
+        for table in list(selected):
+            selected.extend(n for n in index.neighbors_of(table) if n not in selected)
+        return self.subset(repo, selected, quoted, site)
+
+    @staticmethod
+    def _account(linked: LinkedSchema, site: str) -> LinkedSchema:
+        PROMPT_SCHEMA_TOKENS.inc(linked.tokens, site=site, kind="sent")
+        PROMPT_SCHEMA_TOKENS.inc(linked.tokens_saved, site=site, kind="saved")
+        return linked
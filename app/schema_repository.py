@@ -1,17 +1,93 @@
+import hashlib
+import json
+import os
 import sqlite3
+import tempfile
 import psycopg2
 from psycopg2 import sql as pg_sql
-from typing import List, Dict, Union, Optional
+from typing import List, Dict, Set, Union, Optional
+
+from app.schema_index import SchemaIndex
+
+# Versión del formato de snapshot; cambiarla invalida los snapshots existentes
+# (3: `to_column` de las FKs implícitas de SQLite resuelto a la clave primaria)
+SNAPSHOT_VERSION = 3
+
+
+class SchemaChange:
+    """Relaciones que cambiaron en un refresco; se entrega a los suscriptores de la caché."""
+
+    def __init__(
+        self,
+        added: List[str],
+        dropped: List[str],
+        altered: List[str],
+        fingerprint: Optional[str] = None,
+        full: bool = False
+    ):
+        self.added = added
+        self.dropped = dropped
+        self.altered = altered
+        self.fingerprint = fingerprint
+        # Recarga completa: los consumidores deben invalidar todo
+        self.full = full
+
+    @property
+    def tables(self) -> Set[str]:
+        return set(self.added) | set(self.dropped) | set(self.altered)
+
+    def __bool__(self) -> bool:
+        return self.full or bool(self.added or self.dropped or self.altered)
+
+    def to_dict(self) -> Dict:
+        return {
+            "added": self.added,
+            "dropped": self.dropped,
+            "altered": self.altered,
+            "fingerprint": self.fingerprint,
+            "full": self.full
+        }
+
+
+class SchemaState:
+    """
+    Una versión del esquema: diccionario, huella e índice. No se modifica
+    después de publicarse; un refresco arma otra y la publica de una vez.
+    El índice se construye al pedirlo (siempre el mismo para esta versión).
+    """
+
+    __slots__ = ("schema", "fingerprint", "_index")
+
+    def __init__(self, schema: Dict, fingerprint: Optional[str], index: Optional[SchemaIndex] = None):
+        self.schema = schema
+        self.fingerprint = fingerprint
+        self._index = index
+
+    @property
+    def has_index(self) -> bool:
+        return self._index is not None
+
+    def index(self) -> SchemaIndex:
+        if self._index is None:
+            self._index = SchemaIndex(self.schema, fingerprint=self.fingerprint)
+        return self._index
+
 
 class SchemaRepository:
-    def __init__(self, db_type: str, db_config: dict):
+    def __init__(
+        self,
+        db_type: str,
+        db_config: dict,
+        pg_schema: str = "public",
+        snapshot_dir: Optional[str] = None
+    ):
         self.db_type = db_type.lower()
         self.db_config = db_config
-        self.schema = {
-            "tables": [],
-            "columns": {},
-            "foreign_keys": []
-        }
+        self.pg_schema = pg_schema
+        self.snapshot_dir = snapshot_dir
+        # Versión publicada; los lectores la toman con una sola lectura de atributo
+        self._state = SchemaState(self._empty_schema([]), None)
+        self.loaded_from_snapshot = False
 
         self.conn: Optional[Union[sqlite3.Connection, psycopg2.extensions.connection]] = None
         self._connect()
@@ -25,83 +101,377 @@ class SchemaRepository:
         else:
             raise ValueError("Unsupported DB type: must be 'sqlite' or 'postgresql'.")
 
+    @property
+    def state(self) -> SchemaState:
+        return self._state
+
+    @property
+    def schema(self) -> Dict:
+        return self._state.schema
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        return self._state.fingerprint
+
     def _load_schema(self):
+        # La huella identifica la versión del esquema para las cachés derivadas;
+        # con snapshots activos, además evita introspeccionar si no cambió
+        fingerprint = self.compute_fingerprint()
+        schema = self._load_snapshot(fingerprint) if self.snapshot_dir else None
+        if schema is not None:
+            self._state = SchemaState(schema, fingerprint)
+            return
+
+        schema = self._load_relations()
+        schema["relation_signatures"] = self._relation_signatures()
+        self._state = SchemaState(schema, fingerprint)
+
+        if self.snapshot_dir:
+            self._save_snapshot(self._state)
+
+    # ------------------ HUELLA Y SNAPSHOTS ------------------
+
+    def compute_fingerprint(self) -> str:
+        """
+        Huella barata del estado del esquema, calculada en una sola consulta.
+        Cambia cuando se crean/borran tablas, columnas o FKs, o cambia un tipo.
+        """
+        assert self.conn is not None
+        cursor = self.conn.cursor()
+
         if self.db_type == "sqlite":
-            self._load_sqlite_schema()
-        elif self.db_type == "postgresql":
-            self._load_postgres_schema()
+            cursor.execute("PRAGMA schema_version;")
+            version = cursor.fetchone()[0]
+            # schema_version se repite entre archivos distintos; se añade el DDL
+            cursor.execute("SELECT type, name, sql FROM sqlite_master ORDER BY type, name;")
+            digest = hashlib.sha1(repr(cursor.fetchall()).encode("utf-8")).hexdigest()
+            return f"sqlite:{version}:{digest}"
+
+        cursor.execute("""
+            SELECT md5(coalesce(string_agg(item, '|' ORDER BY item), ''))
+            FROM (
+                SELECT c.relname || ':' || c.relkind || ':' || a.attnum || ':' || a.attname
+                       || ':' || a.atttypid || ':' || a.atttypmod || ':' || a.attnotnull
+                FROM pg_catalog.pg_attribute AS a
+                JOIN pg_catalog.pg_class AS c ON c.oid = a.attrelid
+                JOIN pg_catalog.pg_namespace AS n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s
+                  AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+                  AND a.attnum > 0
+                  AND NOT a.attisdropped
+                UNION ALL
+                SELECT c.relname || ':' || con.conname || ':' || pg_catalog.pg_get_constraintdef(con.oid)
+                FROM pg_catalog.pg_constraint AS con
+                JOIN pg_catalog.pg_class AS c ON c.oid = con.conrelid
+                JOIN pg_catalog.pg_namespace AS n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s
+                  AND con.contype = 'f'
+            ) AS state(item)
+        """, (self.pg_schema, self.pg_schema))
+        return f"postgresql:{cursor.fetchone()[0]}"
+
+    def _snapshot_path(self) -> str:
+        assert self.snapshot_dir is not None
+        if self.db_type == "sqlite":
+            identity = os.path.abspath(self.db_config["path"])
+        else:
+            identity = "{host}:{port}/{dbname}".format(
+                host=self.db_config.get("host", ""),
+                port=self.db_config.get("port", 5432),
+                dbname=self.db_config.get("dbname", "")
+            ) + f"/{self.pg_schema}"
+        key = hashlib.sha1(f"{self.db_type}|{identity}".encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.snapshot_dir, f"{self.db_type}_{key}.json")
+
+    def _load_snapshot(self, fingerprint: str) -> Optional[Dict]:
+        path = self._snapshot_path()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if data.get("version") != SNAPSHOT_VERSION or data.get("fingerprint") != fingerprint:
+            return None
+
+        self.loaded_from_snapshot = True
+        return data["schema"]
+
+    def _save_snapshot(self, state: SchemaState):
+        """Escritura atómica: un worker nunca lee un snapshot a medio escribir."""
+        path = self._snapshot_path()
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)  # type: ignore[arg-type]
+            fd, tmp_path = tempfile.mkstemp(dir=self.snapshot_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"version": SNAPSHOT_VERSION, "fingerprint": state.fingerprint, "schema": state.schema},
+                    f,
+                    separators=(",", ":")
+                )
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # Un snapshot fallido no debe impedir servir el esquema recién cargado
+            print(f"⚠️ Could not write schema snapshot {path}: {e}")
 
-    def _load_sqlite_schema(self):
+    @staticmethod
+    def _empty_schema(tables: List[str]) -> Dict:
+        return {
+            "tables": tables,
+            "columns": {table: [] for table in tables},
+            "column_details": {table: [] for table in tables},
+            "foreign_keys": []
+        }
+
+    def _load_sqlite_schema(self, only: Optional[List[str]] = None) -> Dict:
+        """
+        Introspección en un número constante de consultas, usando las funciones
+        con valor de tabla pragma_table_info / pragma_foreign_key_list (SQLite 3.16+).
+        Con `only`, se limita a esas tablas (refresco incremental).
+        """
         assert self.conn is not None
         cursor = self.conn.cursor()
 
+        table_filter = ""
+        params: tuple = ()
+        if only is not None:
+            table_filter = "AND m.name IN (SELECT value FROM json_each(?))"
+            params = (json.dumps(only),)
+
         # Obtener tablas
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [row[0] for row in cursor.fetchall()]
-        self.schema["tables"] = tables
-
-        # Obtener columnas y claves foráneas
-        for table in tables:
-            cursor.execute(f"PRAGMA table_info('{table}')")
-            columns = cursor.fetchall()
-            self.schema["columns"][table] = [col[1] for col in columns]
-
-            cursor.execute(f"PRAGMA foreign_key_list('{table}')")
-            fks = cursor.fetchall()
-            for fk in fks:
-                self.schema["foreign_keys"].append({
-                    "from_table": table,
-                    "from_column": fk[3],
-                    "to_table": fk[2],
-                    "to_column": fk[4]
-                })
-
-    def _load_postgres_schema(self):
+        cursor.execute(f"""
+            SELECT m.name FROM sqlite_master AS m
+            WHERE m.type = 'table' {table_filter}
+            ORDER BY m.name;
+        """, params)
+        schema = self._empty_schema([row[0] for row in cursor.fetchall()])
+
+        # Obtener columnas de todas las tablas
+        cursor.execute(f"""
+            SELECT m.name, p.name, p.type, p."notnull", p.cid
+            FROM sqlite_master AS m
+            JOIN pragma_table_info(m.name) AS p
+            WHERE m.type = 'table' {table_filter}
+            ORDER BY m.name, p.cid;
+        """, params)
+        for table, column, data_type, not_null, ordinal in cursor.fetchall():
+            self._add_column(schema, table, column, data_type, not not_null, ordinal + 1)
+
+        # Obtener claves foráneas de todas las tablas. `REFERENCES t` sin columna
+        # apunta a la clave primaria de t: se resuelve con su posición en la PK
+        cursor.execute(f"""
+            SELECT m.name, f."from", f."table", COALESCE(f."to", pk.name)
+            FROM sqlite_master AS m
+            JOIN pragma_foreign_key_list(m.name) AS f
+            LEFT JOIN pragma_table_info(f."table") AS pk
+              ON f."to" IS NULL AND pk.pk = f.seq + 1
+            WHERE m.type = 'table' {table_filter}
+            ORDER BY m.name, f.id, f.seq;
+        """, params)
+        schema["foreign_keys"] = [
+            {
+                "from_table": row[0],
+                "from_column": row[1],
+                "to_table": row[2],
+                "to_column": row[3]
+            }
+            for row in cursor.fetchall()
+        ]
+        return schema
+
+    def _load_postgres_schema(self, only: Optional[List[str]] = None) -> Dict:
+        """
+        Introspección en tres consultas sobre pg_catalog, limitada a `self.pg_schema`
+        (antes se mezclaban columnas homónimas de otros esquemas).
+        Con `only`, se limita a esas relaciones (refresco incremental).
+        """
         assert self.conn is not None
         cursor = self.conn.cursor()
 
-        # Tablas
-        cursor.execute("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public'
-        """)
-        tables = [row[0] for row in cursor.fetchall()]
-        self.schema["tables"] = tables
-
-        # Columnas
-        for table in tables:
-            cursor.execute(f"""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name = '{table}'
-            """)
-            cols = cursor.fetchall()
-            self.schema["columns"][table] = [col[0] for col in cols]
-
-        # Claves foráneas
-        cursor.execute("""
+        rel_filter = "AND c.relname = ANY(%s)" if only is not None else ""
+        params: tuple = (self.pg_schema, list(only)) if only is not None else (self.pg_schema,)
+
+        # Tablas (incluye vistas, como information_schema.tables)
+        cursor.execute(f"""
+            SELECT c.relname
+            FROM pg_catalog.pg_class AS c
+            JOIN pg_catalog.pg_namespace AS n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s
+              AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+              {rel_filter}
+            ORDER BY c.relname
+        """, params)
+        schema = self._empty_schema([row[0] for row in cursor.fetchall()])
+
+        # Columnas de todas las tablas, con tipo, nulabilidad y posición
+        cursor.execute(f"""
             SELECT
-                tc.table_name AS from_table,
-                kcu.column_name AS from_column,
-                ccu.table_name AS to_table,
-                ccu.column_name AS to_column
-            FROM
-                information_schema.table_constraints AS tc
-                JOIN information_schema.key_column_usage AS kcu
-                  ON tc.constraint_name = kcu.constraint_name
-                JOIN information_schema.constraint_column_usage AS ccu
-                  ON ccu.constraint_name = tc.constraint_name
-            WHERE constraint_type = 'FOREIGN KEY';
-        """)
-        fks = cursor.fetchall()
-        for row in fks:
-            self.schema["foreign_keys"].append({
+                c.relname,
+                a.attname,
+                pg_catalog.format_type(a.atttypid, a.atttypmod),
+                NOT a.attnotnull,
+                a.attnum
+            FROM pg_catalog.pg_attribute AS a
+            JOIN pg_catalog.pg_class AS c ON c.oid = a.attrelid
+            JOIN pg_catalog.pg_namespace AS n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s
+              AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+              AND a.attnum > 0
+              AND NOT a.attisdropped
+              {rel_filter}
+            ORDER BY c.relname, a.attnum
+        """, params)
+        for table, column, data_type, nullable, ordinal in cursor.fetchall():
+            self._add_column(schema, table, column, data_type, nullable, ordinal)
+
+        # Claves foráneas (una fila por par de columnas, también en FKs compuestas)
+        fk_filter = rel_filter.replace("c.relname", "src.relname")
+        cursor.execute(f"""
+            SELECT src.relname, sa.attname, dst.relname, da.attname
+            FROM pg_catalog.pg_constraint AS con
+            JOIN pg_catalog.pg_class AS src ON src.oid = con.conrelid
+            JOIN pg_catalog.pg_namespace AS n ON n.oid = src.relnamespace
+            JOIN pg_catalog.pg_class AS dst ON dst.oid = con.confrelid
+            CROSS JOIN LATERAL unnest(con.conkey, con.confkey) AS k(src_attnum, dst_attnum)
+            JOIN pg_catalog.pg_attribute AS sa
+              ON sa.attrelid = con.conrelid AND sa.attnum = k.src_attnum
+            JOIN pg_catalog.pg_attribute AS da
+              ON da.attrelid = con.confrelid AND da.attnum = k.dst_attnum
+            WHERE con.contype = 'f'
+              AND n.nspname = %s
+              {fk_filter}
+            ORDER BY src.relname, con.conname
+        """, params)
+        schema["foreign_keys"] = [
+            {
                 "from_table": row[0],
                 "from_column": row[1],
                 "to_table": row[2],
                 "to_column": row[3]
-            })
+            }
+            for row in cursor.fetchall()
+        ]
+        return schema
+
+    @staticmethod
+    def _add_column(schema: Dict, table: str, column: str, data_type: str, nullable: bool, ordinal: int):
+        if table not in schema["columns"]:
+            return
+        schema["columns"][table].append(column)
+        schema["column_details"][table].append({
+            "name": column,
+            "type": data_type,
+            "nullable": bool(nullable),
+            "ordinal": ordinal
+        })
+
+    def _relation_signatures(self) -> Dict[str, str]:
+        """
+        Firma por relación para detectar qué cambió: hash del DDL en sqlite_master
+        (SQLite) o de las columnas y FKs en pg_attribute/pg_constraint (PostgreSQL).
+        """
+        assert self.conn is not None
+        cursor = self.conn.cursor()
+
+        if self.db_type == "sqlite":
+            cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table';")
+            return {
+                name: hashlib.sha1((ddl or "").encode("utf-8")).hexdigest()
+                for name, ddl in cursor.fetchall()
+            }
+
+        cursor.execute("""
+            SELECT
+                c.relname,
+                md5(
+                    c.relkind || '|' ||
+                    coalesce(string_agg(
+                        a.attnum || ':' || a.attname || ':' || a.atttypid || ':'
+                        || a.atttypmod || ':' || a.attnotnull,
+                        ',' ORDER BY a.attnum
+                    ), '') || '|' ||
+                    coalesce((
+                        SELECT string_agg(con.conname || ':' || pg_catalog.pg_get_constraintdef(con.oid),
+                                          ',' ORDER BY con.conname)
+                        FROM pg_catalog.pg_constraint AS con
+                        WHERE con.conrelid = c.oid AND con.contype = 'f'
+                    ), '')
+                )
+            FROM pg_catalog.pg_class AS c
+            JOIN pg_catalog.pg_namespace AS n ON n.oid = c.relnamespace
+            LEFT JOIN pg_catalog.pg_attribute AS a
+              ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+            WHERE n.nspname = %s
+              AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+            GROUP BY c.oid, c.relname, c.relkind
+        """, (self.pg_schema,))
+        return {name: signature for name, signature in cursor.fetchall()}
+
+    # ------------------ REFRESCO INCREMENTAL ------------------
+
+    def refresh(self) -> SchemaChange:
+        """
+        Recarga solo las relaciones añadidas, borradas o alteradas desde la última
+        carga y arma un SchemaState nuevo (esquema, FKs, huella e índice parcheado)
+        sin tocar el actual. Se publica con un único cambio de referencia, así que
+        un lector nunca ve una huella nueva con un esquema viejo. Devuelve el cambio.
+        """
+        reconnect = self.conn is None
+        if reconnect:
+            self._connect()
+        try:
+            current = self._state
+            new_signatures = self._relation_signatures()
+            old_signatures = current.schema.get("relation_signatures", {})
+
+            added = sorted(set(new_signatures) - set(old_signatures))
+            dropped = sorted(set(old_signatures) - set(new_signatures))
+            altered = sorted(
+                t for t in new_signatures
+                if t in old_signatures and new_signatures[t] != old_signatures[t]
+            )
+            change = SchemaChange(added, dropped, altered, fingerprint=current.fingerprint)
+            if not change:
+                return change
+
+            changed = added + altered
+            partial = self._load_relations(changed) if changed else self._empty_schema([])
+
+            touched = set(changed) | set(dropped)
+            columns = {t: c for t, c in current.schema["columns"].items() if t not in touched}
+            details = {t: c for t, c in current.schema["column_details"].items() if t not in touched}
+            columns.update(partial["columns"])
+            details.update(partial["column_details"])
+
+            # Las FKs pertenecen a su tabla origen: se reemplazan las de las tablas tocadas
+            foreign_keys = [fk for fk in current.schema["foreign_keys"] if fk["from_table"] not in touched]
+            foreign_keys.extend(partial["foreign_keys"])
+
+            new_schema = {
+                "tables": sorted(set(columns)),
+                "columns": columns,
+                "column_details": details,
+                "foreign_keys": foreign_keys,
+                "relation_signatures": new_signatures
+            }
+            fingerprint = self.compute_fingerprint()
+            change.fingerprint = fingerprint
+
+            new_index = current.index().patched(new_schema, change, fingerprint) if current.has_index else None
+            state = SchemaState(new_schema, fingerprint, new_index)
+            self._state = state
+
+            if self.snapshot_dir:
+                self._save_snapshot(state)
+            return change
+        finally:
+            if reconnect:
+                self.close()
+
+    def _load_relations(self, only: Optional[List[str]] = None) -> Dict:
+        if self.db_type == "sqlite":
+            return self._load_sqlite_schema(only)
+        return self._load_postgres_schema(only)
 
     def get_tables(self) -> List[str]:
         return self.schema["tables"]
@@ -109,12 +479,20 @@ class SchemaRepository:
     def get_columns(self, table: str) -> List[str]:
         return self.schema["columns"].get(table, [])
 
+    def get_column_details(self, table: str) -> List[Dict]:
+        """Columnas con tipo, nulabilidad y posición ordinal (1-based)."""
+        return self.schema["column_details"].get(table, [])
+
     def get_foreign_keys(self) -> List[Dict[str, str]]:
         return self.schema["foreign_keys"]
 
     def get_schema_dict(self) -> Dict:
         return self.schema
 
+    def get_index(self) -> SchemaIndex:
+        """Índice del esquema (conjuntos, índice invertido y grafo de FKs), construido una vez por versión."""
+        return self._state.index()
+
     def get_db_info(self) -> Dict:
         """Devuelve info de conexión para pasar al validador"""
         return {
@@ -125,12 +503,13 @@ class SchemaRepository:
     def close(self):
         if self.conn:
             self.conn.close()
+            self.conn = None
 
     # 👇 Métodos de clase añadidos
     @classmethod
-    def from_postgres_config(cls, config: dict) -> "SchemaRepository":
-        return cls(db_type="postgresql", db_config=config)
+    def from_postgres_config(cls, config: dict, snapshot_dir: Optional[str] = None) -> "SchemaRepository":
+        return cls(db_type="postgresql", db_config=config, snapshot_dir=snapshot_dir)
 
     @classmethod
-    def from_sqlite_path(cls, path: str) -> "SchemaRepository":
-        return cls(db_type="sqlite", db_config={"path": path})
+    def from_sqlite_path(cls, path: str, snapshot_dir: Optional[str] = None) -> "SchemaRepository":
+        return cls(db_type="sqlite", db_config={"path": path}, snapshot_dir=snapshot_dir)
@@ -0,0 +1,215 @@
+# app/template_builder.py
+
+import asyncio
+import hashlib
+import json
+import os
+import struct
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.config import TEMPLATE_BUILD_BATCH_SIZE, TEMPLATE_BUILD_CONCURRENCY
+from app.embedding_providers import EmbeddingProvider
+from app.template_store import TemplateStore, binary_store_base
+
+# Checkpoint: cabecera (magia + dimensiones) y registros de sha256 (32 bytes) + vector float32
+_CHECKPOINT_MAGIC = b"TPLCKPT1"
+_HEADER = struct.Struct("<8sI")
+
+
+def template_hash(model: str, template: str) -> bytes:
+    """Huella de una plantilla para un modelo: si cambia el texto o el modelo, se vuelve a embeber."""
+    return hashlib.sha256(model.encode("utf-8") + b"\x00" + template.encode("utf-8")).digest()
+
+
+class BuildCheckpoint:
+    """
+    Registro append-only de los vectores ya calculados en una construcción.
+    Cada lote terminado se agrega y se sincroniza a disco; si el proceso se
+    corta, la siguiente corrida retoma desde aquí (un registro truncado al
+    final se descarta).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dim: Optional[int] = None
+        self._file = None
+
+    def load(self) -> Dict[bytes, np.ndarray]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if len(data) < _HEADER.size:
+            return {}
+        magic, dim = _HEADER.unpack_from(data)
+        if magic != _CHECKPOINT_MAGIC:
+            return {}
+        self.dim = dim
+        record = 32 + dim * 4
+        count = (len(data) - _HEADER.size) // record
+        vectors = {}
+        for i in range(count):
+            offset = _HEADER.size + i * record
+            key = data[offset:offset + 32]
+            vectors[key] = np.frombuffer(data, dtype=np.float32, count=dim, offset=offset + 32)
+        return vectors
+
+    def append(self, keys: Sequence[bytes], vectors: np.ndarray) -> None:
+        if self._file is None:
+            self.dim = self.dim or vectors.shape[1]
+            fresh = not os.path.exists(self.path) or os.path.getsize(self.path) < _HEADER.size
+            self._file = open(self.path, "wb" if fresh else "ab")
+            if fresh:
+                self._file.write(_HEADER.pack(_CHECKPOINT_MAGIC, self.dim))
+            else:
+                # Descarta un registro a medias de una corrida anterior
+                record = 32 + self.dim * 4
+                size = os.path.getsize(self.path)
+                self._file.truncate(size - (size - _HEADER.size) % record)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding has {vectors.shape[1]} dimensions, checkpoint has {self.dim}")
+        for key, vector in zip(keys, vectors):
+            self._file.write(key)
+            self._file.write(vector.tobytes())
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self, remove: bool = False) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _previous_vectors(output: str, model: str) -> Dict[bytes, np.ndarray]:
+    """
+    Vectores reutilizables del store anterior, por huella. Se usa el store
+    binario solo si fue generado con el mismo modelo; el JSON (sin modelo
+    registrado) solo cuando no hay binario.
+    """
+    base = binary_store_base(output)
+    try:
+        if os.path.exists(f"{base}.npy") and os.path.exists(f"{base}.meta.json"):
+            store = TemplateStore.open_binary(base)
+            with open(f"{base}.meta.json", "r", encoding="utf-8") as f:
+                if json.load(f).get("model") != model:
+                    return {}
+        elif os.path.exists(output):
+            store = TemplateStore.from_file(output)
+        else:
+            return {}
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Ignoring previous template store {output}: {e}")
+        return {}
+    return {
+        template_hash(model, template): store.matrix[i]
+        for i, template in enumerate(store.templates)
+    }
+
+
+def _write_json(path: str, ids: List[str], templates: List[str], matrix: np.ndarray) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(
+            [
+                {"template_id": tpl_id, "template": template, "embedding": vector.tolist()}
+                for tpl_id, template, vector in zip(ids, templates, matrix)
+            ],
+            f
+        )
+    os.replace(tmp_path, path)
+
+
+async def build_template_store(
+    templates: Sequence[Dict[str, Any]],
+    provider: EmbeddingProvider,
+    output: str,
+    batch_size: int = TEMPLATE_BUILD_BATCH_SIZE,
+    concurrency: int = TEMPLATE_BUILD_CONCURRENCY,
+    write_json: bool = True
+) -> Dict[str, Any]:
+    """
+    Construye el store de plantillas (`{"id", "template"}`) en `output`:
+    - solo se embeben las plantillas cuya huella (modelo + texto) no está en el
+      store anterior ni en el checkpoint de una corrida interrumpida,
+    - en lotes de `batch_size` textos por llamada, con `concurrency` llamadas en vuelo,
+    - cada lote queda en el checkpoint `<base>.build.ckpt` apenas termina,
+    - al final se escriben el JSON y el store binario (cada archivo con reemplazo
+      atómico) y se borra el checkpoint.
+    """
+    start = time.perf_counter()
+    model = provider.model
+    ids = [tpl["id"] for tpl in templates]
+    texts = [tpl["template"] for tpl in templates]
+    keys = [template_hash(model, text) for text in texts]
+
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    base = binary_store_base(output)
+    checkpoint = BuildCheckpoint(f"{base}.build.ckpt")
+    known = _previous_vectors(output, model)
+    reused = sum(1 for key in keys if key in known)
+    resumed = checkpoint.load()
+    known.update(resumed)
+
+    # Cada texto nuevo se embebe una vez aunque se repita en varias plantillas
+    pending: List[int] = []
+    queued = set()
+    for i, key in enumerate(keys):
+        if key not in known and key not in queued:
+            queued.add(key)
+            pending.append(i)
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    print(
+        f"🧮 {len(templates)} templates: {reused} unchanged, "
+        f"{len(resumed)} from checkpoint, {len(pending)} to embed in {len(batches)} batches"
+    )
+
+    semaphore = asyncio.Semaphore(concurrency)
+    done = 0
+
+    async def run_batch(batch: List[int]) -> None:
+        nonlocal done
+        async with semaphore:
+            vectors = await provider.embed([texts[i] for i in batch])
+        vectors = np.asarray(vectors, dtype=np.float32)
+        batch_keys = [keys[i] for i in batch]
+        checkpoint.append(batch_keys, vectors)
+        known.update(zip(batch_keys, vectors))
+        done += len(batch)
+        print(f"   {done}/{len(pending)} embedded")
+
+    tasks = [asyncio.ensure_future(run_batch(batch)) for batch in batches]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # Lo que terminó ya está en el checkpoint; el resto se cancela y se reanuda en la próxima corrida
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        checkpoint.close()
+
+    matrix = np.stack([known[key] for key in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+    if write_json:
+        _write_json(output, ids, texts, matrix)
+    # El binario se escribe después del JSON para que _load_store lo prefiera
+    TemplateStore.from_arrays(ids, texts, matrix).save_binary(base, model)
+    checkpoint.close(remove=True)
+
+    return {
+        "templates": len(templates),
+        "unchanged": reused,
+        "resumed": len(resumed),
+        "embedded": len(pending),
+        "batches": len(batches),
+        "output": output,
+        "store": f"{base}.npy",
+        "seconds": round(time.perf_counter() - start, 2)
+    }
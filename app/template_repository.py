@@ -2,11 +2,12 @@
 
 import json
 import os
-from typing import List, Dict, Any
-from app.embedding import get_embedding
-from app.similarity import cosine_similarity
-
-TEMPLATE_FILE = "app/templates.json"
+from typing import List, Dict, Any, Optional
+from app.config import TEMPLATE_BUILD_BATCH_SIZE, TEMPLATE_BUILD_CONCURRENCY
+from app.embedding_providers import EmbeddingProvider, get_embedding_provider
+from app.template_builder import build_template_store
+from app.template_scoring import TemplateScorer
+from app.template_store import TEMPLATE_FILE, template_file, get_template_store
 
 # Plantillas base
 RAW_TEMPLATES = [
@@ -22,46 +23,46 @@ RAW_TEMPLATES = [
     {"id": "tpl_10", "template": "SELECT MAX({{column}}) FROM {{table}} WHERE {{column}} < {{value}};"}
 ]
 
-async def generate_template_embeddings():
-    templates_with_embeddings = []
-
-    for tpl in RAW_TEMPLATES:
-        embedding = await get_embedding(tpl["template"])
-        templates_with_embeddings.append({
-            "template_id": tpl["id"],
-            "template": tpl["template"],
-            "embedding": embedding
-        })
-
-    with open(TEMPLATE_FILE, "w", encoding="utf-8") as f:
-        json.dump(templates_with_embeddings, f, indent=2)
-
-    print(f"✅ Guardado en {TEMPLATE_FILE}")
+async def generate_template_embeddings(
+    provider: Optional[EmbeddingProvider] = None,
+    templates: Optional[List[Dict[str, Any]]] = None,
+    output: Optional[str] = None,
+    batch_size: int = TEMPLATE_BUILD_BATCH_SIZE,
+    concurrency: int = TEMPLATE_BUILD_CONCURRENCY
+) -> str:
+    """
+    Genera (o actualiza) el archivo de plantillas del backend y su store binario.
+    Solo se embeben las plantillas nuevas o modificadas (ver build_template_store).
+    """
+    provider = provider or get_embedding_provider()
+    output = output or template_file(provider.name)
+    stats = await build_template_store(
+        templates if templates is not None else RAW_TEMPLATES,
+        provider,
+        output,
+        batch_size=batch_size,
+        concurrency=concurrency
+    )
+    print(f"✅ Guardado en {output} y {stats['store']} ({stats['embedded']} embebidas, {stats['seconds']} s)")
+    return output
 
 
 def load_templates() -> List[Dict[str, Any]]:
-    if not os.path.exists(TEMPLATE_FILE):
-        raise FileNotFoundError(f"Archivo de plantillas no encontrado: {TEMPLATE_FILE}")
-    with open(TEMPLATE_FILE, "r", encoding="utf-8") as f:
+    path = template_file()
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Archivo de plantillas no encontrado: {path}")
+    with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
 def find_best_template(user_embedding: List[float], intent: Dict) -> Dict:
-    templates = load_templates()
-    best_tpl = None
-    best_score = -1
-
-    for tpl in templates:
-        score = cosine_similarity(user_embedding, tpl["embedding"])
-        if score > best_score:
-            best_score = score
-            best_tpl = tpl
-
-    if best_tpl is None:
+    # Solo coseno, con el mismo motor de puntaje que select_best_template
+    scorer = TemplateScorer(get_template_store(), weights={"cosine": 1.0})
+    best = scorer.best(user_embedding, intent)
+    if "error" in best:
         return {"error": "No template matched."}
-
     return {
-        "template_id": best_tpl["template_id"],
-        "template": best_tpl["template"],
-        "cosine_similarity": best_score
+        "template_id": best["template_id"],
+        "template": best["template"],
+        "cosine_similarity": best["cosine_similarity"]
     }
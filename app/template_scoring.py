@@ -0,0 +1,188 @@
+# app/template_scoring.py
+
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.config import TEMPLATE_SCORE_WEIGHTS
+from app.template_store import PLACEHOLDERS, POPCOUNT, TemplateStore, get_template_store
+
+
+def _has(field: str) -> Callable[[Dict], bool]:
+    return lambda intent: bool(intent.get(field))
+
+
+def _has_join(intent: Dict) -> bool:
+    return bool(intent.get("joins")) or len(intent.get("tables") or []) > 1
+
+
+# Qué campo de la intención puede llenar cada placeholder (mismo criterio que assemble_query)
+PLACEHOLDER_FEATURES: Dict[str, Callable[[Dict], bool]] = {
+    "table": _has("tables"),
+    "column": lambda intent: bool(intent.get("columns") or intent.get("aggregations")),
+    "value": lambda intent: bool(intent.get("conditions") or intent.get("limit")),
+    "group_column": _has("group_by"),
+    "agg_func": _has("aggregations"),
+    "agg_column": _has("aggregations"),
+    "table1": _has_join,
+    "table2": _has_join,
+    "col1": _has_join,
+    "col2": _has_join,
+}
+
+# Términos del puntaje final (los pesos vienen de TEMPLATE_SCORE_WEIGHTS):
+# - cosine: similitud entre la pregunta y la plantilla,
+# - coverage: fracción de los placeholders de la plantilla que la intención puede llenar,
+# - entity_match: placeholders llenables sobre el total de placeholders puntuados.
+SCORE_TERMS = ("cosine", "coverage", "entity_match")
+DEFAULT_WEIGHTS = {"cosine": 0.7, "coverage": 0.3}
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """Pesos desde "cosine=0.7,coverage=0.3" (cadena vacía = DEFAULT_WEIGHTS)."""
+    if not spec.strip():
+        return dict(DEFAULT_WEIGHTS)
+    weights = {}
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in SCORE_TERMS:
+            raise ValueError(f"Unknown template score term: {name!r} (expected one of {', '.join(SCORE_TERMS)})")
+        weights[name] = float(value)
+    return weights
+
+
+class TemplateScorer:
+    """
+    Único motor de puntaje de plantillas. Las máscaras de placeholders se
+    calculan al cargar el store; por petición la intención se reduce a una
+    máscara y cada término sale de un AND de bits (con popcount por tabla)
+    más un único producto matriz-vector para el coseno.
+    - `weights`: peso por término de SCORE_TERMS (los que faltan valen 0;
+      por defecto, TEMPLATE_SCORE_WEIGHTS),
+    - `features`: placeholders que cuentan para coverage/entity_match.
+    Con un IVFIndex en el store, solo se puntúan los candidatos del índice.
+    """
+
+    def __init__(
+        self,
+        store: TemplateStore,
+        weights: Optional[Dict[str, float]] = None,
+        features: Optional[Sequence[str]] = None
+    ):
+        self.store = store
+        self.weights = parse_weights(TEMPLATE_SCORE_WEIGHTS) if weights is None else dict(weights)
+        unknown = set(self.weights) - set(SCORE_TERMS)
+        if unknown:
+            raise ValueError(f"Unknown template score terms: {', '.join(sorted(unknown))}")
+
+        self.features = tuple(features or PLACEHOLDERS)
+        missing = [name for name in self.features if name not in PLACEHOLDER_FEATURES]
+        if missing:
+            raise ValueError(f"Unknown template features: {', '.join(missing)}")
+        self.feature_mask = sum(1 << PLACEHOLDERS.index(name) for name in self.features)
+        self._template_counts = self._count_features()
+
+    def _count_features(self) -> np.ndarray:
+        # Placeholders puntuados de cada plantilla: no depende de la intención
+        return POPCOUNT[self.store.masks & self.feature_mask]
+
+    def intent_mask(self, intent: Dict) -> int:
+        mask = 0
+        for name in self.features:
+            if PLACEHOLDER_FEATURES[name](intent):
+                mask |= 1 << PLACEHOLDERS.index(name)
+        return mask
+
+    def scores(self, embedding: Sequence[float], intent: Dict, rows: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """Cada término y el puntaje final ("final") para todas las plantillas (o solo `rows`)."""
+        if len(self._template_counts) != len(self.store):
+            # El store creció con add_templates
+            self._template_counts = self._count_features()
+        masks = self.store.masks if rows is None else self.store.masks[rows]
+        counts = self._template_counts if rows is None else self._template_counts[rows]
+        matched = POPCOUNT[masks & self.intent_mask(intent)].astype(np.float32)
+
+        terms = {
+            "matched": matched,
+            "cosine": self.store.cosine_scores(embedding, rows),
+            "coverage": matched / np.maximum(counts, 1),
+            "entity_match": matched / max(len(self.features), 1)
+        }
+        final = np.zeros(len(matched), dtype=np.float32)
+        for name, weight in self.weights.items():
+            if weight:
+                final += terms[name] * weight
+        terms["final"] = final
+        return terms
+
+    def _candidate(self, row: int, terms: Dict[str, np.ndarray], i: int) -> Dict[str, Any]:
+        breakdown = {name: float(terms[name][i]) for name in SCORE_TERMS}
+        return {
+            "template_id": self.store.ids[row],
+            "template": self.store.templates[row],
+            "cosine_similarity": breakdown["cosine"],
+            "entity_match_score": int(terms["matched"][i]),
+            "final_score": float(terms["final"][i]),
+            "score_breakdown": {
+                name: {"value": value, "weight": self.weights.get(name, 0.0)}
+                for name, value in breakdown.items()
+            }
+        }
+
+    def rank(
+        self,
+        embedding: Sequence[float],
+        intent: Dict,
+        k: int = 5,
+        nprobe: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Las `k` mejores plantillas, de mayor a menor; argpartition evita ordenar toda la biblioteca."""
+        n = len(self.store)
+        if not n:
+            return []
+        if self.store.index is not None:
+            return self._rank_ann(embedding, intent, k, nprobe)
+
+        terms = self.scores(embedding, intent)
+        final = terms["final"]
+        k = min(k, n)
+        best = np.argpartition(-final, k - 1)[:k] if k < n else np.arange(n)
+        # Empates: gana la plantilla que aparece antes en la biblioteca
+        best = best[np.lexsort((best, -final[best]))]
+        return [self._candidate(int(i), terms, int(i)) for i in best]
+
+    def _rank_ann(self, embedding: Sequence[float], intent: Dict, k: int, nprobe: Optional[int]) -> List[Dict[str, Any]]:
+        """
+        Candidatos por coseno aproximado (IVF) y puntaje exacto solo sobre ellos.
+        Los términos de placeholders se aplican a los candidatos, por eso el
+        índice devuelve TEMPLATE_ANN_REFINE veces más que `k` antes de reordenar.
+        """
+        query = self.store.normalize_query(embedding)
+        rows, _ = self.store.index.search(
+            query, k, nprobe=nprobe, exact=lambda ids: self.scores(query, intent, ids)["final"]
+        )
+        terms = self.scores(query, intent, rows)
+        return [self._candidate(int(row), terms, i) for i, row in enumerate(rows)]
+
+    def best(self, embedding: Sequence[float], intent: Dict) -> Dict[str, Any]:
+        candidates = self.rank(embedding, intent, k=1)
+        return candidates[0] if candidates else {"error": "No templates available."}
+
+
+# ------------------ MOTOR COMPARTIDO ------------------
+
+_shared: Optional[TemplateScorer] = None
+
+
+def get_template_scorer() -> TemplateScorer:
+    """
+    Motor con los pesos configurados sobre el store precargado. Se reutiliza
+    mientras el store sea el mismo objeto; tras reload_template_store se crea otro.
+    """
+    global _shared
+    store = get_template_store()
+    scorer = _shared
+    if scorer is None or scorer.store is not store:
+        scorer = _shared = TemplateScorer(store)
+    return scorer
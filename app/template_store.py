@@ -0,0 +1,315 @@
+# app/template_store.py
+
+import json
+import os
+import re
+import threading
+import zipfile
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.ann_index import IVFIndex
+from app.embedding_providers import get_embedding_provider
+from app.config import TEMPLATE_ANN_MIN_TEMPLATES
+
+TEMPLATE_FILE = "app/templates.json"
+
+# Formato binario: <base>.npy (matriz float32 normalizada) + <base>.meta.json,
+# que guarda filas y CRC32 de la matriz para detectar pares de archivos desparejos
+STORE_VERSION = 2
+
+# Placeholders conocidos; el bit i de la máscara de una plantilla indica si usa PLACEHOLDERS[i]
+PLACEHOLDERS: Tuple[str, ...] = (
+    "table", "column", "value", "group_column",
+    "agg_func", "agg_column", "table1", "table2", "col1", "col2"
+)
+_PLACEHOLDER_BITS = {name: 1 << i for i, name in enumerate(PLACEHOLDERS)}
+_PLACEHOLDER_RE = re.compile(r"\{\{(\w+)\}\}")
+
+# Bits encendidos de cada máscara posible (con PLACEHOLDERS caben en una tabla de 1024)
+POPCOUNT = np.array([bin(m).count("1") for m in range(1 << len(PLACEHOLDERS))], dtype=np.uint8)
+
+
+def template_file(backend: Optional[str] = None) -> str:
+    """
+    Archivo de plantillas con embeddings del backend dado (por defecto EMBEDDING_BACKEND).
+    Cada backend tiene su propio espacio vectorial, así que cada uno tiene su archivo;
+    el de OpenAI conserva el nombre original.
+    """
+    name = get_embedding_provider(backend).name
+    if name == "openai":
+        return TEMPLATE_FILE
+    return TEMPLATE_FILE.replace(".json", f".{name}.json")
+
+
+def binary_store_base(json_path: str) -> str:
+    """Ruta base del store binario equivalente a un archivo JSON de plantillas."""
+    return json_path[:-len(".json")] if json_path.endswith(".json") else json_path
+
+
+def matrix_checksum(matrix: np.ndarray) -> int:
+    """CRC32 de los bytes de la matriz, por bloques (no copia un mmap entero a memoria)."""
+    flat = np.ascontiguousarray(matrix).reshape(-1).view(np.uint8)
+    checksum = 0
+    step = 64 * 1024 * 1024
+    for start in range(0, flat.shape[0], step):
+        checksum = zlib.crc32(flat[start:start + step], checksum)
+    return checksum
+
+
+def placeholder_mask(template: str) -> int:
+    mask = 0
+    for name in _PLACEHOLDER_RE.findall(template):
+        mask |= _PLACEHOLDER_BITS.get(name, 0)
+    return mask
+
+class TemplateStore:
+    """
+    Plantillas cargadas una sola vez en memoria:
+    - `matrix`: embeddings como matriz float32 contigua, ya normalizada (L2);
+      desde el store binario es un mmap de solo lectura compartido entre procesos,
+    - `masks`: máscara de placeholders por plantilla (PLACEHOLDERS), calculada al cargar,
+    - `index`: IVFIndex opcional para bibliotecas grandes.
+    El puntaje de las plantillas está en app/template_scoring.py.
+    """
+
+    def __init__(self, templates: Sequence[Dict[str, Any]]):
+        if templates:
+            matrix = np.asarray([tpl["embedding"] for tpl in templates], dtype=np.float32)
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        self._init(
+            [tpl["template_id"] for tpl in templates],
+            [tpl["template"] for tpl in templates],
+            matrix
+        )
+
+    def _init(
+        self,
+        ids: List[str],
+        templates: List[str],
+        matrix: np.ndarray,
+        masks: Optional[np.ndarray] = None,
+        normalized: bool = False
+    ) -> None:
+        self.ids = ids
+        self.templates = templates
+        self.index: Optional[IVFIndex] = None
+
+        if normalized:
+            # Se usa tal cual (p. ej. el mmap del store binario): sin copia
+            self.matrix = matrix
+        else:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.matrix = np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+        if masks is None:
+            masks = np.array([placeholder_mask(t) for t in templates], dtype=np.uint32)
+        self.masks = masks
+
+    @classmethod
+    def from_arrays(cls, ids: List[str], templates: List[str], matrix: np.ndarray) -> "TemplateStore":
+        """Store a partir de una matriz ya construida (sin pasar por listas de floats)."""
+        store = cls.__new__(cls)
+        store._init(list(ids), list(templates), np.asarray(matrix, dtype=np.float32))
+        return store
+
+    @classmethod
+    def from_file(cls, path: str) -> "TemplateStore":
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Template file not found at: {path}")
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def open_binary(cls, base: str) -> "TemplateStore":
+        """
+        Abre `<base>.npy` como mmap de solo lectura (sin copiar ni parsear floats).
+        Lanza ValueError si la matriz no es la que describen los metadatos
+        (filas o CRC32 distintos, p. ej. tras un corte entre los dos reemplazos).
+        """
+        with open(f"{base}.meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported template store version: {meta.get('version')}")
+        if list(meta["placeholders"]) != list(PLACEHOLDERS):
+            raise ValueError("Template store was written with a different placeholder set; convert it again")
+
+        matrix = np.load(f"{base}.npy", mmap_mode="r")
+        rows = meta["rows"]
+        if (
+            matrix.dtype != np.float32
+            or matrix.shape[0] != rows
+            or not (len(meta["ids"]) == len(meta["templates"]) == len(meta["masks"]) == rows)
+            or matrix_checksum(matrix) != meta["checksum"]
+        ):
+            raise ValueError(f"Template store {base}.npy does not match its metadata")
+        store = cls.__new__(cls)
+        store._init(
+            meta["ids"],
+            meta["templates"],
+            matrix,
+            masks=np.asarray(meta["masks"], dtype=np.uint32),
+            normalized=True
+        )
+        return store
+
+    def save_binary(self, base: str, model: Optional[str] = None) -> None:
+        """
+        Escribe el store binario: matriz y metadatos, cada uno con reemplazo
+        atómico. Los metadatos llevan filas y CRC32 de la matriz, así que un
+        corte entre ambos reemplazos se detecta al abrir (y se usa el JSON).
+        """
+        directory = os.path.dirname(base)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        matrix = np.ascontiguousarray(self.matrix, dtype=np.float32)
+        tmp_matrix = f"{base}.tmp.npy"
+        np.save(tmp_matrix, matrix)
+        os.replace(tmp_matrix, f"{base}.npy")
+
+        meta = {
+            "version": STORE_VERSION,
+            "model": model,
+            "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+            "rows": int(matrix.shape[0]),
+            "checksum": matrix_checksum(matrix),
+            "placeholders": list(PLACEHOLDERS),
+            "ids": self.ids,
+            "templates": self.templates,
+            "masks": [int(m) for m in self.masks]
+        }
+        tmp_meta = f"{base}.meta.json.tmp"
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_meta, f"{base}.meta.json")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ------------------ SIMILITUD ------------------
+
+    def normalize_query(self, embedding: Sequence[float]) -> np.ndarray:
+        query = np.asarray(embedding, dtype=np.float32)
+        if self.matrix.ndim == 2 and query.shape[0] != self.matrix.shape[1]:
+            raise ValueError(
+                f"Embedding has {query.shape[0]} dimensions, templates have {self.matrix.shape[1]}"
+            )
+        norm = np.linalg.norm(query)
+        return query / norm if norm else query
+
+    def cosine_scores(self, embedding: Sequence[float], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Coseno contra todas las plantillas (o solo `rows`): un producto matriz-vector."""
+        query = self.normalize_query(embedding)
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        return matrix @ query
+
+    # ------------------ ÍNDICE APROXIMADO ------------------
+
+    def build_index(self, n_lists: Optional[int] = None) -> IVFIndex:
+        self.index = IVFIndex.build(self.matrix, n_lists)
+        return self.index
+
+    def add_templates(self, templates: Sequence[Dict[str, Any]]) -> None:
+        """Agrega plantillas nuevas; si hay índice, se insertan en él sin reentrenarlo."""
+        if not templates:
+            return
+        start = len(self)
+        added = TemplateStore(templates)
+        self.ids = self.ids + added.ids
+        self.templates = self.templates + added.templates
+        self.matrix = np.concatenate([self.matrix, added.matrix]) if start else added.matrix
+        self.masks = np.concatenate([self.masks, added.masks])
+        if self.index is not None:
+            self.index.add(added.matrix, np.arange(start, len(self)))
+
+# ------------------ STORE COMPARTIDO ------------------
+
+_stores: Dict[str, TemplateStore] = {}
+_stores_lock = threading.Lock()
+
+
+def _attach_index(store: TemplateStore, base: str, source: str) -> None:
+    """
+    Con bibliotecas grandes, adjunta el IVFIndex guardado junto al store
+    (`<base>.ivf.npz`) o lo construye y lo guarda si falta o es más viejo que `source`.
+    """
+    if len(store) < TEMPLATE_ANN_MIN_TEMPLATES:
+        return
+    index_path = f"{base}.ivf.npz"
+    if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(source):
+        try:
+            index = IVFIndex.load(index_path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            # Truncado, corrupto o de un formato anterior: se reconstruye
+            print(f"⚠️ Could not load template index from {index_path}, rebuilding: {e}")
+            index = None
+        if index is not None and len(index) == len(store) and index.dim == store.matrix.shape[1]:
+            store.index = index
+            return
+
+    store.build_index()
+    try:
+        store.index.save(index_path)
+    except OSError as e:
+        print(f"⚠️ Could not save template index to {index_path}: {e}")
+
+
+def _load_store(path: str) -> TemplateStore:
+    """
+    Prefiere el store binario junto al JSON si existe y no es más viejo que él;
+    si no (o si el binario no se puede abrir o no cuadra con sus metadatos),
+    parsea el JSON y avisa: convert_templates.py genera el binario.
+    """
+    base = binary_store_base(path)
+    binary = f"{base}.npy"
+    store = None
+    if os.path.exists(binary) and os.path.exists(f"{base}.meta.json") and (
+        not os.path.exists(path) or os.path.getmtime(binary) >= os.path.getmtime(path)
+    ):
+        try:
+            store = TemplateStore.open_binary(base)
+            source = binary
+        except (OSError, ValueError, KeyError) as e:
+            if not os.path.exists(path):
+                raise
+            print(f"⚠️ Binary template store {binary} unusable ({e}); falling back to JSON")
+    if store is None:
+        store = TemplateStore.from_file(path)
+        source = path
+        print(f"⚠️ Loading templates from JSON ({path}); run convert_templates.py for the binary store")
+    _attach_index(store, base, source)
+    return store
+
+
+def convert_json_store(path: str, model: Optional[str] = None) -> str:
+    """Convierte un templates*.json al store binario; devuelve la ruta base."""
+    base = binary_store_base(path)
+    TemplateStore.from_file(path).save_binary(base, model)
+    return base
+
+
+def get_template_store(path: Optional[str] = None) -> TemplateStore:
+    """Store del archivo de plantillas (por defecto, el del backend configurado), cargado una vez por proceso."""
+    path = path or template_file()
+    store = _stores.get(path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(path)
+            if store is None:
+                store = _load_store(path)
+                _stores[path] = store
+    return store
+
+
+def reload_template_store(path: Optional[str] = None) -> TemplateStore:
+    """Vuelve a leer el archivo (p. ej. tras regenerar los embeddings)."""
+    path = path or template_file()
+    store = _load_store(path)
+    with _stores_lock:
+        _stores[path] = store
+    return store
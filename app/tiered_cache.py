@@ -0,0 +1,238 @@
+# app/tiered_cache.py
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Marcas de uso pendientes antes de escribirlas en disco de una vez
+TOUCH_FLUSH_SIZE = 256
+# Claves por SELECT ... IN (...) (por debajo del límite de variables de SQLite)
+_LOOKUP_CHUNK = 500
+
+
+class TieredCache:
+    """
+    Base de las cachés en dos niveles (embeddings, respuestas del LLM):
+    - LRU en memoria acotada a `max_memory` valores,
+    - SQLite en disco acotado a `max_disk` filas (se expulsan las de uso más
+      antiguo), que sobrevive a reinicios.
+    Todo el acceso a SQLite corre en un hilo propio, dueño de la conexión: las
+    lecturas se esperan sin bloquear el event loop, las escrituras (y la poda)
+    se encolan sin esperar y las marcas de uso se escriben por lotes. El disco
+    es una optimización: sus fallos se avisan y la caché sigue solo en memoria.
+
+    Las subclases definen la tabla (`table`, `columns` sin key ni last_used,
+    `value_column`), cómo se guarda un valor (`_encode`/`_decode`) y sus claves
+    y contadores.
+    """
+
+    table = ""
+    columns = ""
+    value_column = ""
+    # Nombre para avisos e hilos
+    label = "Cache"
+
+    def __init__(self, path: Optional[str], max_memory: int, max_disk: int):
+        self.path = path
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_rows = 0
+        # Hilo único dueño de la conexión; solo él toca `_conn` y `_touched`
+        self._disk_thread = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sql-sketcher-{self.label.lower()}-cache")
+            if path else None
+        )
+        self._touched: Dict[str, float] = {}
+
+    def _encode(self, value: Any) -> Any:
+        return value
+
+    def _decode(self, raw: Any) -> Any:
+        return raw
+
+    # ------------------ DISCO (hilo propio) ------------------
+
+    def _disk(self) -> Optional[sqlite3.Connection]:
+        """Abre la base SQLite la primera vez que se usa; sin `path` no hay nivel en disco."""
+        if self._conn is None and self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                    f" key TEXT PRIMARY KEY, {self.columns}, last_used REAL NOT NULL)"
+                )
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_last_used ON {self.table}(last_used)")
+                self._disk_rows = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            except BaseException:
+                # No dejar abierta una conexión a medio preparar
+                conn.close()
+                raise
+            self._conn = conn
+        return self._conn
+
+    def _disk_get_many(self, keys: List[str]) -> Dict[str, Any]:
+        conn = self._disk()
+        if conn is None:
+            return {}
+        found = {}
+        for start in range(0, len(keys), _LOOKUP_CHUNK):
+            chunk = keys[start:start + _LOOKUP_CHUNK]
+            rows = conn.execute(
+                f"SELECT key, {self.value_column} FROM {self.table} WHERE key IN ({', '.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            for key, raw in rows:
+                found[key] = self._decode(raw)
+        # Solo se marca el uso al subir a memoria, y por lotes
+        self._touched.update(dict.fromkeys(found, time.time()))
+        if len(self._touched) >= TOUCH_FLUSH_SIZE:
+            self._flush_touched()
+        return found
+
+    def _flush_touched(self) -> None:
+        if not self._touched or self._conn is None:
+            return
+        touched, self._touched = self._touched, {}
+        self._conn.executemany(
+            f"UPDATE {self.table} SET last_used = ? WHERE key = ?",
+            [(used, key) for key, used in touched.items()]
+        )
+
+    def _disk_put(self, names: Sequence[str], rows: List[Tuple]) -> None:
+        """Inserta filas (key, *names, last_used) en una transacción y poda si hace falta."""
+        conn = self._disk()
+        if conn is None or not rows:
+            return
+        # Las marcas pendientes primero, para que la poda vea el uso real
+        self._flush_touched()
+        columns = ", ".join(("key", *names, "last_used"))
+        placeholders = ", ".join("?" * (len(names) + 2))
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(f"INSERT OR REPLACE INTO {self.table} ({columns}) VALUES ({placeholders})", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._disk_rows += len(rows)
+
+        if self._disk_rows > self.max_disk:
+            # Recortar al 90% del límite para no podar en cada inserción
+            self._disk_rows = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            excess = self._disk_rows - int(self.max_disk * 0.9)
+            if excess > 0:
+                conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self._disk_rows -= excess
+
+    def _disk_clear(self) -> None:
+        conn = self._disk()
+        if conn is not None:
+            self._touched.clear()
+            conn.execute(f"DELETE FROM {self.table}")
+            self._disk_rows = 0
+
+    def _disk_close(self) -> None:
+        if self._conn is not None:
+            self._flush_touched()
+            self._conn.close()
+            self._conn = None
+
+    def _log_disk_error(self, future: Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            # El disco es una optimización: un fallo no debe romper la petición
+            print(f"⚠️ {self.label} disk cache write failed: {future.exception()}")
+
+    def _submit(self, fn, *args) -> None:
+        """Encola una escritura en el hilo de disco, sin esperarla."""
+        if self._disk_thread is not None:
+            self._disk_thread.submit(fn, *args).add_done_callback(self._log_disk_error)
+
+    # ------------------ API ------------------
+
+    def _remember(self, key: str, value: Any) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory:
+            self._memory.popitem(last=False)
+
+    async def _lookup(self, keys: List[str]) -> List[Tuple[Any, Optional[str]]]:
+        """
+        (valor, nivel) por clave, con nivel "memory", "disk" o None (fallo).
+        El disco se consulta una sola vez para todos los fallos en memoria.
+        """
+        results: List[Tuple[Any, Optional[str]]] = [(None, None)] * len(keys)
+        pending: List[int] = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                value = self._memory.get(key)
+                if value is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = (value, "memory")
+                else:
+                    pending.append(i)
+        if not pending or self._disk_thread is None:
+            return results
+
+        found: Dict[str, Any] = {}
+        try:
+            future = self._disk_thread.submit(self._disk_get_many, [keys[i] for i in pending])
+            found = await asyncio.wrap_future(future)
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠️ {self.label} disk cache read failed: {e}")
+
+        with self._lock:
+            for i in pending:
+                value = found.get(keys[i])
+                if value is not None:
+                    self._remember(keys[i], value)
+                    results[i] = (value, "disk")
+        return results
+
+    def _store(self, items: Dict[str, Any], names: Sequence[str], extra: Tuple = ()) -> None:
+        """Guarda en memoria ya y encola la escritura en disco (no bloquea); `extra` va tras el valor."""
+        with self._lock:
+            for key, value in items.items():
+                self._remember(key, value)
+        if self._disk_thread is not None:
+            now = time.time()
+            rows = [(key, self._encode(value), *extra, now) for key, value in items.items()]
+            self._submit(self._disk_put, (self.value_column, *names), rows)
+
+    def clear(self) -> None:
+        """Vacía la memoria y encola el borrado del disco (las lecturas posteriores ya lo ven)."""
+        with self._lock:
+            self._memory.clear()
+        self._submit(self._disk_clear)
+
+    def close(self) -> None:
+        """Escribe lo pendiente y cierra la base (espera al hilo de disco)."""
+        if self._disk_thread is not None:
+            self._disk_thread.submit(self._disk_close).add_done_callback(self._log_disk_error)
+            self._disk_thread.shutdown(wait=True)
+            self._disk_thread = None
+
+    def disk_stats(self) -> Dict[str, Any]:
+        return {
+            "memory_items": len(self._memory),
+            "max_memory": self.max_memory,
+            "disk_path": self.path,
+            "disk_items": self._disk_rows if self._conn is not None else None,
+            "max_disk": self.max_disk
+        }
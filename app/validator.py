@@ -1,41 +1,79 @@
 # app/validator.py
 
+import asyncio
 import psycopg2
 import sqlite3
+import threading
+from contextlib import contextmanager
 from psycopg2 import sql as pg_sql
-from typing import Dict, Any
+from typing import Callable, Dict, Any, Optional
 
+from app.db_executor import run_db
+from app.metrics import VALIDATION_FAILURES
 
-def validate_sql(query: str, db_config: Dict[str, Any]) -> Dict:
+
+def open_validation_connection(db_config: Dict[str, Any]):
+    """
+    Abre una conexión reutilizable para validar varias consultas seguidas
+    (por ejemplo, un lote completo). Quien la abre es responsable de cerrarla.
+    """
     db_type = db_config.get("type", "postgresql").lower()
 
     if db_type == "postgresql":
-        return validate_postgres_sql(query, db_config)
+        return psycopg2.connect(
+            dbname=db_config["dbname"],
+            user=db_config["user"],
+            password=db_config["password"],
+            host=db_config["host"],
+            port=db_config.get("port", 5432)
+        )
     elif db_type == "sqlite":
-        return validate_sqlite_sql(query, db_config)
+        # La conexión se usa desde los hilos del pool de base de datos
+        return sqlite3.connect(db_config["path"], check_same_thread=False)
     else:
-        return {
+        raise ValueError(f"Unsupported database type: {db_type}")
+
+
+def validate_sql(query: str, db_config: Dict[str, Any], conn=None) -> Dict:
+    db_type = db_config.get("type", "postgresql").lower()
+
+    if db_type == "postgresql":
+        result = validate_postgres_sql(query, db_config, conn)
+    elif db_type == "sqlite":
+        result = validate_sqlite_sql(query, db_config, conn)
+    else:
+        result = {
             "valid": False,
             "explain_output": [],
             "error": f"Unsupported database type: {db_type}"
         }
 
+    if not result["valid"]:
+        VALIDATION_FAILURES.inc(db_type=db_type)
+    return result
+
 
-def validate_postgres_sql(query: str, config: Dict[str, Any]) -> Dict:
+def validate_postgres_sql(query: str, config: Dict[str, Any], conn: Optional[Any] = None) -> Dict:
+    owns_conn = conn is None
     try:
-        conn = psycopg2.connect(
-            dbname=config["dbname"],
-            user=config["user"],
-            password=config["password"],
-            host=config["host"],
-            port=config.get("port", 5432)
-        )
+        if owns_conn:
+            conn = psycopg2.connect(
+                dbname=config["dbname"],
+                user=config["user"],
+                password=config["password"],
+                host=config["host"],
+                port=config.get("port", 5432)
+            )
         cur = conn.cursor()
-        cur.execute(pg_sql.SQL("EXPLAIN {}").format(pg_sql.SQL(query)))
-        result = cur.fetchall()
-
-        cur.close()
-        conn.close()
+        try:
+            cur.execute(pg_sql.SQL("EXPLAIN {}").format(pg_sql.SQL(query)))
+            result = cur.fetchall()
+        finally:
+            cur.close()
+            # EXPLAIN no modifica nada; se revierte para dejar la conexión lista
+            # (una transacción abortada bloquearía las siguientes validaciones)
+            if not owns_conn:
+                conn.rollback()
 
         return {
             "valid": True,
@@ -50,16 +88,22 @@ def validate_postgres_sql(query: str, config: Dict[str, Any]) -> Dict:
             "error": str(e)
         }
 
+    finally:
+        if owns_conn and conn is not None:
+            conn.close()
+
 
-def validate_sqlite_sql(query: str, config: Dict[str, Any]) -> Dict:
+def validate_sqlite_sql(query: str, config: Dict[str, Any], conn: Optional[Any] = None) -> Dict:
+    owns_conn = conn is None
     try:
-        conn = sqlite3.connect(config["path"])
+        if owns_conn:
+            conn = sqlite3.connect(config["path"])
         cur = conn.cursor()
-        cur.execute("EXPLAIN " + query)
-        result = cur.fetchall()
-
-        cur.close()
-        conn.close()
+        try:
+            cur.execute("EXPLAIN " + query)
+            result = cur.fetchall()
+        finally:
+            cur.close()
 
         return {
             "valid": True,
@@ -73,3 +117,101 @@ def validate_sqlite_sql(query: str, config: Dict[str, Any]) -> Dict:
             "explain_output": [],
             "error": str(e)
         }
+
+    finally:
+        if owns_conn and conn is not None:
+            conn.close()
+
+
+class ValidationPool:
+    """
+    Pool pequeño de conexiones de validación para una base de datos.
+    Reutiliza conexiones entre peticiones en lugar de abrir una por EXPLAIN.
+    Sus métodos síncronos bloquean, así que deben llamarse desde el pool de
+    base de datos; desde el event loop se usa `avalidate`, que espera turno
+    en un semáforo asyncio antes de ocupar un hilo del pool (así un hilo nunca
+    queda bloqueado esperando una conexión que otro hilo debe devolver).
+    """
+
+    def __init__(self, db_config: Dict[str, Any], max_size: int = 4):
+        self.db_config = db_config
+        self.max_size = max_size
+        self._idle: list = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._gate = asyncio.Semaphore(max_size)
+        self._open = 0
+        self._closed = False
+        # Callback con el nuevo número de conexiones abiertas (presupuesto del registro)
+        self.on_open_change: Optional[Callable[[int], None]] = None
+
+    @property
+    def open_connections(self) -> int:
+        return self._open
+
+    def _open_changed(self) -> None:
+        if self.on_open_change is not None:
+            self.on_open_change(self._open)
+
+    def acquire(self):
+        self._slots.acquire()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            conn = open_validation_connection(self.db_config)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._open += 1
+        self._open_changed()
+        return conn
+
+    def release(self, conn) -> None:
+        # psycopg2 marca `closed` si la conexión se rompió; sqlite3 no tiene el atributo
+        broken = bool(getattr(conn, "closed", False))
+        with self._lock:
+            keep = not self._closed and not broken
+            if keep:
+                self._idle.append(conn)
+            else:
+                self._open -= 1
+        if not keep:
+            self._open_changed()
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def validate(self, query: str) -> Dict:
+        with self.connection() as conn:
+            return validate_sql(query, self.db_config, conn=conn)
+
+    async def avalidate(self, query: str) -> Dict:
+        """Valida con una conexión del pool, tomada y devuelta dentro de la misma tarea del pool de base de datos."""
+        async with self._gate:
+            return await run_db(self.validate, query)
+
+    def close(self) -> None:
+        """Cierra las conexiones libres; las prestadas se cierran al devolverse."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        if idle:
+            self._open_changed()
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
@@ -0,0 +1,75 @@
+# benchmarks/bench_ann_index.py
+#
+# Recall@k y latencia del IVFIndex (app/ann_index.py) frente al barrido exacto
+# de TemplateStore, variando nprobe. Los vectores son sintéticos pero con
+# estructura de clusters (como plantillas minadas: muchas variantes de pocas
+# formas de consulta); con vectores uniformes al azar ningún IVF da buen recall.
+#
+# Uso (desde la raíz del repo):
+#   python -m benchmarks.bench_ann_index --templates 20000 100000 --nprobe 1 4 8 16 32
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app.ann_index import IVFIndex, recall_at_k
+
+DIM = 1536
+
+
+def clustered_vectors(n: int, rng: np.random.Generator, n_shapes: int = 500, noise: float = 0.6) -> np.ndarray:
+    shapes = rng.standard_normal((n_shapes, DIM)).astype(np.float32)
+    vectors = shapes[rng.integers(0, n_shapes, n)] + noise * rng.standard_normal((n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IVF template index benchmark")
+    parser.add_argument("--templates", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for n in args.templates:
+        matrix = clustered_vectors(n + args.queries, rng)
+        matrix, queries = matrix[:n], matrix[n:]
+
+        start = time.perf_counter()
+        index = IVFIndex.build(matrix)
+        build_s = time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.npz")
+            index.save(path)
+            start = time.perf_counter()
+            IVFIndex.load(path)
+            load_s = time.perf_counter() - start
+            size_mb = os.path.getsize(path) / 1e6
+
+        start = time.perf_counter()
+        for q in queries:
+            np.argpartition(-(matrix @ q), args.k - 1)[:args.k]
+        exact_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+        print(
+            f"\n{n} templates, {index.n_lists} lists: build {build_s:.1f} s, "
+            f"load {load_s * 1000:.0f} ms, {size_mb:.0f} MB on disk, exact scan {exact_ms:.2f} ms/query"
+        )
+        print(f"{'nprobe':>8} {'ms/query':>10} {'recall@1':>10} {f'recall@{args.k}':>10}")
+        for nprobe in args.nprobe:
+            start = time.perf_counter()
+            for q in queries:
+                index.search(q, args.k, nprobe=nprobe, exact=lambda ids, q=q: matrix[ids] @ q)
+            ms = (time.perf_counter() - start) / len(queries) * 1000
+            r1 = recall_at_k(index, matrix, queries, k=1, nprobe=nprobe)
+            rk = recall_at_k(index, matrix, queries, k=args.k, nprobe=nprobe)
+            print(f"{nprobe:>8} {ms:>10.2f} {r1:>10.3f} {rk:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# benchmarks/bench_assembler.py
+#
+# Throughput de render de plantillas:
+# - legacy: la versión anterior de assemble_query (un `in` + str.replace por
+#   tipo de placeholder y búsqueda de AVG({{column}}) en cada llamada),
+# - compiled: render_template sobre la plantilla ya compilada (slots y
+#   contexto de agregación resueltos al compilar, una pasada por render).
+# Se usan las plantillas de RAW_TEMPLATES; en las que ambas versiones
+# soportan (sin LIMIT, MAX ni JOIN) se verifica que den la misma consulta.
+# Además se miden plantillas largas (UNION ALL de esas mismas), al estilo de
+# las minadas: legacy recorre el texto entero por cada tipo de placeholder.
+#
+# Uso (desde la raíz del repo):
+#   python -m benchmarks.bench_assembler --renders 200000
+
+import argparse
+import time
+from typing import Dict, Optional
+
+from app.assembler import compile_template, format_value, quote_ident, render_template
+from app.schema_index import SchemaIndex
+from app.template_repository import RAW_TEMPLATES
+
+SCHEMA = {
+    "columns": {
+        "singer": ["Singer_ID", "Name", "Country", "Age"],
+        "singer_in_concert": ["concert_ID", "Singer_ID"]
+    },
+    "foreign_keys": [
+        {"from_table": "singer_in_concert", "from_column": "Singer_ID", "to_table": "singer", "to_column": "Singer_ID"}
+    ]
+}
+INTENT = {
+    "tables": ["singer", "singer_in_concert"],
+    "columns": ["Name"],
+    "conditions": [{"column": "Country", "operator": "=", "value": "France"}],
+    "aggregations": [{"function": "AVG", "column": "Age"}],
+    "group_by": ["Country"],
+    "limit": 10
+}
+# Plantillas que la versión legacy llena igual que la compilada
+COMPARABLE = {"tpl_01", "tpl_02", "tpl_03", "tpl_04", "tpl_06", "tpl_07", "tpl_09"}
+
+
+def legacy_assemble_query(
+    template: str,
+    intent: Dict,
+    overrides: Optional[Dict[str, str]] = None
+) -> Dict:
+    result = template
+    missing = []
+
+    overrides = overrides or {}
+
+    # COLUMN
+    if "{{column}}" in result:
+        if "column" in overrides:
+            result = result.replace("{{column}}", overrides["column"])
+        elif any(func in template for func in ["AVG({{column}})", "SUM({{column}})", "COUNT({{column}})"]):
+            aggs = intent.get("aggregations", [])
+            if aggs and isinstance(aggs[0], dict) and "column" in aggs[0]:
+                result = result.replace("{{column}}", quote_ident(aggs[0]["column"]))
+            else:
+                result = result.replace("{{column}}", "UNKNOWN_AGG_COLUMN")
+                missing.append("column")
+        elif intent.get("columns"):
+            result = result.replace("{{column}}", ", ".join([quote_ident(c) for c in intent["columns"]]))
+        else:
+            result = result.replace("{{column}}", "UNKNOWN_COLUMN")
+            missing.append("column")
+
+    # TABLE
+    if "{{table}}" in result:
+        if "table" in overrides:
+            result = result.replace("{{table}}", overrides["table"])
+        elif intent.get("tables"):
+            result = result.replace("{{table}}", quote_ident(intent["tables"][0]))
+        else:
+            result = result.replace("{{table}}", "UNKNOWN_TABLE")
+            missing.append("table")
+
+    # VALUE
+    if "{{value}}" in result:
+        if "value" in overrides:
+            result = result.replace("{{value}}", overrides["value"])
+        elif intent.get("conditions"):
+            val = intent["conditions"][0].get("value")
+            if val is not None:
+                result = result.replace("{{value}}", format_value(val))
+            else:
+                result = result.replace("{{value}}", "UNKNOWN_VALUE")
+                missing.append("value")
+        else:
+            result = result.replace("{{value}}", "UNKNOWN_VALUE")
+            missing.append("value")
+
+    # GROUP_COLUMN
+    if "{{group_column}}" in result:
+        if "group_column" in overrides:
+            result = result.replace("{{group_column}}", overrides["group_column"])
+        elif intent.get("group_by"):
+            result = result.replace("{{group_column}}", quote_ident(intent["group_by"][0]))
+        else:
+            result = result.replace("{{group_column}}", "UNKNOWN_GROUP")
+            missing.append("group_column")
+
+    # AGG_FUNC
+    if "{{agg_func}}" in result:
+        if "agg_func" in overrides:
+            result = result.replace("{{agg_func}}", overrides["agg_func"])
+        elif intent.get("aggregations"):
+            func = intent["aggregations"][0].get("function")
+            if func:
+                result = result.replace("{{agg_func}}", func.upper())
+            else:
+                result = result.replace("{{agg_func}}", "UNKNOWN_AGG")
+                missing.append("agg_func")
+        else:
+            result = result.replace("{{agg_func}}", "UNKNOWN_AGG")
+            missing.append("agg_func")
+
+    # AGG_COLUMN
+    if "{{agg_column}}" in result:
+        if "agg_column" in overrides:
+            result = result.replace("{{agg_column}}", overrides["agg_column"])
+        elif intent.get("aggregations"):
+            col = intent["aggregations"][0].get("column")
+            if col:
+                result = result.replace("{{agg_column}}", quote_ident(col))
+            else:
+                result = result.replace("{{agg_column}}", "UNKNOWN_AGG_COLUMN")
+                missing.append("agg_column")
+        else:
+            result = result.replace("{{agg_column}}", "UNKNOWN_AGG_COLUMN")
+            missing.append("agg_column")
+
+    return {
+        "query": result,
+        "missing_fields": missing
+    }
+
+
+def rate(fn, templates, renders: int) -> float:
+    start = time.perf_counter()
+    for i in range(renders):
+        fn(templates[i % len(templates)])
+    return renders / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Template render throughput benchmark")
+    parser.add_argument("--renders", type=int, default=200000)
+    args = parser.parse_args()
+
+    index = SchemaIndex(SCHEMA)
+    texts = [tpl["template"] for tpl in RAW_TEMPLATES]
+    compiled = [compile_template(text) for text in texts]
+
+    for tpl, program in zip(RAW_TEMPLATES, compiled):
+        if tpl["id"] in COMPARABLE:
+            assert render_template(program, INTENT, index=index) == legacy_assemble_query(tpl["template"], INTENT)
+    assert "UNKNOWN" not in render_template(compiled[7], INTENT, index=index)["query"]
+
+    legacy = rate(lambda t: legacy_assemble_query(t, INTENT), texts, args.renders)
+    fast = rate(lambda c: render_template(c, INTENT, index=index), compiled, args.renders)
+    cached = rate(lambda t: render_template(compile_template(t), INTENT, index=index), texts, args.renders)
+
+    print(f"{'variant':>22} {'renders/s':>12} {'us/render':>10}")
+    for name, value in (("legacy", legacy), ("compiled", fast), ("compile cache + render", cached)):
+        print(f"{name:>22} {value:>12,.0f} {1e6 / value:>10.2f}")
+    print(f"speedup (compiled vs legacy): {fast / legacy:.1f}x")
+
+    comparable = [tpl["template"].rstrip(";") for tpl in RAW_TEMPLATES if tpl["id"] in COMPARABLE]
+    print(f"\n{'template chars':>14} {'slots':>6} {'legacy us':>10} {'compiled us':>12}")
+    for copies in (1, 4, 16):
+        long_template = " UNION ALL ".join(comparable * copies) + ";"
+        program = compile_template(long_template)
+        renders = max(1, args.renders // (10 * copies))
+        legacy = rate(lambda t: legacy_assemble_query(t, INTENT), [long_template], renders)
+        fast = rate(lambda c: render_template(c, INTENT, index=index), [program], renders)
+        print(f"{len(long_template):>14} {len(program.refs):>6} {1e6 / legacy:>10.2f} {1e6 / fast:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
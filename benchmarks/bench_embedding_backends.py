@@ -0,0 +1,123 @@
+# benchmarks/bench_embedding_backends.py
+#
+# Compara los backends de embeddings (app/embedding_providers.py) en latencia
+# por pregunta y en precisión de selección de plantilla: para cada pregunta
+# etiquetada se elige la plantilla solo por similitud (intención vacía, así el
+# puntaje de entidades es igual para todas) y se compara con la esperada.
+# La precisión se reporta por separado para LABELED_QUESTIONS (las que se
+# miraron al ajustar el backend) y HELD_OUT_QUESTIONS (redactadas aparte, con
+# otro vocabulario y otra base): la que cuenta es la segunda.
+#
+# El backend "openai" necesita OPENAI_API_KEY y app/templates.json; el local
+# usa app/templates.hashing.json (python generate_embeddings.py --backend hashing).
+# La caché de embeddings no se usa, para medir el backend en sí.
+#
+# Uso (desde la raíz del repo):
+#   python -m benchmarks.bench_embedding_backends
+#   python -m benchmarks.bench_embedding_backends --backends hashing openai
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from app.embedding_providers import PROVIDERS, get_embedding_provider
+from app.selector import load_template_repository, select_best_template
+from app.template_repository import template_file
+
+# Preguntas al estilo Spider con la plantilla que debería elegirse
+LABELED_QUESTIONS = [
+    ("List the names of all singers", "tpl_01"),
+    ("Show all stadium locations", "tpl_01"),
+    ("What is the name of the singer whose country is France?", "tpl_02"),
+    ("Find the concerts where the stadium id equals 5", "tpl_02"),
+    ("What is the average age of singers?", "tpl_03"),
+    ("Average capacity of stadiums", "tpl_03"),
+    ("List singer names sorted by age", "tpl_04"),
+    ("Show stadiums ordered by capacity", "tpl_04"),
+    ("Show the first 5 singers", "tpl_05"),
+    ("List the top 10 concert names", "tpl_05"),
+    ("Average age of singers per country", "tpl_06"),
+    ("What is the mean capacity for each location?", "tpl_06"),
+    ("Which countries have an average singer age greater than 30?", "tpl_07"),
+    ("Locations having an average capacity above 5000", "tpl_07"),
+    ("Show concert names together with their stadium location", "tpl_08"),
+    ("List singers along with the concerts they performed in", "tpl_08"),
+    ("How many singers are there?", "tpl_09"),
+    ("Count the number of concerts", "tpl_09"),
+    ("What is the highest capacity below 10000?", "tpl_10"),
+    ("Maximum age of singers younger than 40", "tpl_10"),
+]
+
+# Preguntas no vistas al ajustar SQL_CONCEPTS ni el pesado: no añadir sus
+# palabras al vocabulario para "arreglar" un fallo
+HELD_OUT_QUESTIONS = [
+    ("Give me every employee name", "tpl_01"),
+    ("Display the titles of all books", "tpl_01"),
+    ("Which employees work in the Sales department?", "tpl_02"),
+    ("Books whose author is Tolkien", "tpl_02"),
+    ("Mean salary of the employees", "tpl_03"),
+    ("What is the typical price of a book on average?", "tpl_03"),
+    ("Employees sorted by hire date", "tpl_04"),
+    ("Books in descending order of price", "tpl_04"),
+    ("Only the top 3 employees", "tpl_05"),
+    ("Return at most 20 book titles, limit the output", "tpl_05"),
+    ("Average salary in each department", "tpl_06"),
+    ("Mean book price per author", "tpl_06"),
+    ("Departments having an average salary over 50000", "tpl_07"),
+    ("Authors whose books average more than 30 dollars, grouped by author", "tpl_07"),
+    ("Employee names joined with their department names", "tpl_08"),
+    ("Join books with authors and show the author country", "tpl_08"),
+    ("Number of employees", "tpl_09"),
+    ("How many books are in the library?", "tpl_09"),
+    ("Largest salary under 90000", "tpl_10"),
+    ("The maximum price among books cheaper than 15, less than that value", "tpl_10"),
+]
+
+
+async def run_backend(name: str, repeat: int) -> None:
+    provider = get_embedding_provider(name)
+    path = template_file(name)
+    if not os.path.exists(path):
+        print(f"{name:>10}  skipped: {path} not found")
+        return
+    templates = load_template_repository(path)
+
+    latencies = []
+
+    async def accuracy(questions) -> float:
+        correct = 0
+        for question, expected in questions:
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                embedding = (await provider.embed([question]))[0]
+                best = min(best, time.perf_counter() - start)
+            latencies.append(best)
+
+            selected = select_best_template(embedding, {}, templates)
+            correct += selected["template_id"] == expected
+        return correct / len(questions)
+
+    tuned = await accuracy(LABELED_QUESTIONS)
+    held_out = await accuracy(HELD_OUT_QUESTIONS)
+    p50 = statistics.median(latencies) * 1000
+    p95 = sorted(latencies)[int(0.95 * (len(latencies) - 1))] * 1000
+    print(f"{name:>10} {p50:>10.3f} {p95:>10.3f} {tuned:>10.0%} {held_out:>10.0%}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Embedding backend latency/accuracy benchmark")
+    parser.add_argument("--backends", nargs="+", choices=list(PROVIDERS), default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    backends = args.backends or (["hashing", "openai"] if os.getenv("OPENAI_API_KEY") else ["hashing"])
+    print(f"{'backend':>10} {'p50 (ms)':>10} {'p95 (ms)':>10} {'tuned':>10} {'held-out':>10}")
+    for name in backends:
+        await run_backend(name, args.repeat)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+# benchmarks/bench_llm_client.py
+#
+# Lanza ráfagas de llamadas de chat contra el servidor OpenAI falso
+# (benchmarks/fake_openai.py) a través de app/llm_client.py y reporta la
+# latencia p50/p99, los reintentos y los fallos. Sirve para ajustar
+# LLM_MAX_CONCURRENCY, LLM_RATE_LIMIT_RPS y los reintentos sin gastar cuota.
+#
+# Uso (desde la raíz del repo):
+#   python -m benchmarks.bench_llm_client
+#   python -m benchmarks.bench_llm_client --calls 500 --error-rate 0.2 --concurrency 16 --rate 200
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.llm_client import LLMClient
+from benchmarks.fake_openai import start_fake_openai
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(args) -> None:
+    server = start_fake_openai(latency=args.latency, error_rate=args.error_rate)
+    client = LLMClient(
+        base_url=server.base_url,
+        api_key="test",
+        max_concurrency=args.concurrency,
+        model_concurrency=args.concurrency,
+        rate_limit=args.rate,
+        burst=args.concurrency,
+        # Sin caché de respuestas: todas las llamadas son iguales y saldrían de ella
+        cache=None
+    )
+    messages = [{"role": "user", "content": "List the names of all singers"}]
+    latencies = []
+
+    async def one() -> bool:
+        start = time.perf_counter()
+        try:
+            await client.chat("bench", "gpt-3.5-turbo", messages, temperature=0)
+            return True
+        except Exception:
+            return False
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(args.calls)))
+    elapsed = time.perf_counter() - start
+    await client.aclose()
+    server.shutdown()
+
+    stats = client.stats()
+    print(
+        f"{args.calls} calls in {elapsed:.2f}s ({args.calls / elapsed:.0f}/s)  "
+        f"p50 {statistics.median(latencies) * 1000:.0f} ms  p99 {percentile(latencies, 0.99) * 1000:.0f} ms"
+    )
+    print(
+        f"ok {sum(results)}  failed {stats['failures']}  retries {stats['retries']}  "
+        f"server requests {server.requests} ({server.errors} injected errors)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the shared LLM client against a fake OpenAI server.")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02, help="Fake server seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.1, help="Fraction of 429/503 responses")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rate", type=float, default=0.0, help="Requests per second (0 = unlimited)")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
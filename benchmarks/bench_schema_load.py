@@ -0,0 +1,146 @@
+# benchmarks/bench_schema_load.py
+#
+# Mide el tiempo de introspección de SchemaRepository a medida que crece el
+# número de tablas, comparando la carga masiva actual con la carga tabla por
+# tabla (dos PRAGMA por tabla) que se usaba antes.
+#
+# En SQLite cada PRAGMA es una llamada en proceso, así que la diferencia es
+# pequeña; la ganancia real aparece en PostgreSQL, donde cada consulta por
+# tabla es un viaje de red. Con --postgres se crea un esquema temporal en la
+# base de DB_CONFIG (app/config.py) y se borra al terminar.
+#
+# Uso (desde la raíz del repo):
+#   python -m benchmarks.bench_schema_load --tables 10 100 1000 3000
+#   python -m benchmarks.bench_schema_load --postgres --tables 100 1000
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import psycopg2
+
+from app.config import DB_CONFIG
+from app.schema_repository import SchemaRepository
+
+PG_BENCH_SCHEMA = "bench_schema_load"
+
+
+def build_sqlite_db(path: str, n_tables: int, n_columns: int = 8) -> None:
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    for i in range(n_tables):
+        cols = ", ".join(f"col_{j} TEXT" for j in range(n_columns))
+        fk = f", parent_id INTEGER REFERENCES t_{i - 1}(id)" if i > 0 else ""
+        cur.execute(f"CREATE TABLE t_{i} (id INTEGER PRIMARY KEY, {cols}{fk})")
+    conn.commit()
+    conn.close()
+
+
+def legacy_sqlite_load(path: str) -> int:
+    """Reproduce la introspección anterior: dos PRAGMA por tabla."""
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    tables = [row[0] for row in cur.fetchall()]
+    n_columns = 0
+    for table in tables:
+        cur.execute(f"PRAGMA table_info('{table}')")
+        n_columns += len(cur.fetchall())
+        cur.execute(f"PRAGMA foreign_key_list('{table}')")
+        cur.fetchall()
+    conn.close()
+    return n_columns
+
+
+def build_postgres_schema(conn, n_tables: int, n_columns: int = 8) -> None:
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {PG_BENCH_SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {PG_BENCH_SCHEMA}")
+    for i in range(n_tables):
+        cols = ", ".join(f"col_{j} TEXT" for j in range(n_columns))
+        fk = f", parent_id INTEGER REFERENCES {PG_BENCH_SCHEMA}.t_{i - 1}(id)" if i > 0 else ""
+        cur.execute(f"CREATE TABLE {PG_BENCH_SCHEMA}.t_{i} (id INTEGER PRIMARY KEY, {cols}{fk})")
+    conn.commit()
+
+
+def legacy_postgres_load(config: dict) -> int:
+    """Reproduce la introspección anterior: una consulta information_schema por tabla."""
+    conn = psycopg2.connect(**config)
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT table_name FROM information_schema.tables WHERE table_schema = %s",
+        (PG_BENCH_SCHEMA,)
+    )
+    tables = [row[0] for row in cur.fetchall()]
+    n_columns = 0
+    for table in tables:
+        cur.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_schema = %s AND table_name = %s",
+            (PG_BENCH_SCHEMA, table)
+        )
+        n_columns += len(cur.fetchall())
+    conn.close()
+    return n_columns
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_sqlite(sizes, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            path = os.path.join(tmp, f"schema_{n}.sqlite")
+            build_sqlite_db(path, n)
+
+            def bulk():
+                repo = SchemaRepository.from_sqlite_path(path)
+                repo.close()
+
+            report(n, best_of(bulk, repeat), best_of(lambda: legacy_sqlite_load(path), repeat))
+
+
+def run_postgres(sizes, repeat: int) -> None:
+    admin = psycopg2.connect(**DB_CONFIG)
+    try:
+        for n in sizes:
+            build_postgres_schema(admin, n)
+
+            def bulk():
+                repo = SchemaRepository("postgresql", DB_CONFIG, pg_schema=PG_BENCH_SCHEMA)
+                repo.close()
+
+            report(n, best_of(bulk, repeat), best_of(lambda: legacy_postgres_load(DB_CONFIG), repeat))
+    finally:
+        admin.cursor().execute(f"DROP SCHEMA IF EXISTS {PG_BENCH_SCHEMA} CASCADE")
+        admin.commit()
+        admin.close()
+
+
+def report(n: int, bulk_s: float, legacy_s: float) -> None:
+    print(f"{n:>8} {bulk_s * 1000:>12.1f} {legacy_s * 1000:>16.1f} {legacy_s / bulk_s:>8.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SchemaRepository load-time benchmark")
+    parser.add_argument("--tables", type=int, nargs="+", default=[10, 100, 500, 1000, 3000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--postgres", action="store_true", help="Usar la base de DB_CONFIG en lugar de SQLite")
+    args = parser.parse_args()
+
+    print(f"{'tables':>8} {'bulk (ms)':>12} {'per-table (ms)':>16} {'speedup':>9}")
+    if args.postgres:
+        run_postgres(args.tables, args.repeat)
+    else:
+        run_sqlite(args.tables, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
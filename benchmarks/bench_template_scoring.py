@@ -0,0 +1,126 @@
+# benchmarks/bench_template_scoring.py
+#
+# Mide el costo de elegir plantilla a medida que crece la biblioteca:
+# - legacy: coseno en Python puro sobre listas + búsqueda de placeholders en
+#   el texto de cada plantilla (lo que hacía select_best_template),
+# - engine: TemplateScorer sobre un TemplateStore precargado (AND de máscaras
+#   de placeholders + un producto matriz-vector + argpartition).
+# Para comparar resultados, el motor se configura con los términos del legacy
+# (entity_match sobre sus 4 placeholders, pesos 0.7/0.3).
+# Las plantillas son sintéticas (vectores aleatorios de 1536 dimensiones sobre
+# los textos de RAW_TEMPLATES). El legacy se omite por encima de --legacy-max
+# porque con 100k plantillas tarda decenas de segundos por consulta.
+#
+# Uso (desde la raíz del repo):
+#   python -m benchmarks.bench_template_scoring --templates 10 1000 10000 100000
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+from app.template_repository import RAW_TEMPLATES
+from app.template_scoring import TemplateScorer
+from app.template_store import TemplateStore
+
+DIM = 1536
+INTENT = {"tables": ["singer"], "columns": ["Name"], "conditions": [], "group_by": []}
+
+
+def synthetic_library(n: int, rng: np.random.Generator):
+    ids = [f"tpl_{i:06d}" for i in range(n)]
+    texts = [RAW_TEMPLATES[i % len(RAW_TEMPLATES)]["template"] for i in range(n)]
+    return ids, texts, rng.standard_normal((n, DIM)).astype(np.float32)
+
+
+def as_json_templates(ids, texts, vectors):
+    """Formato de templates.json (listas de floats), solo para el camino legacy."""
+    return [
+        {"template_id": i, "template": t, "embedding": v.tolist()}
+        for i, t, v in zip(ids, texts, vectors)
+    ]
+
+
+LEGACY_FEATURES = ("table", "column", "value", "group_column")
+LEGACY_WEIGHTS = {"cosine": 0.7, "entity_match": 0.3}
+
+
+def cosine_similarity(vec1, vec2) -> float:
+    dot = sum(a * b for a, b in zip(vec1, vec2))
+    norm1 = math.sqrt(sum(a * a for a in vec1))
+    norm2 = math.sqrt(sum(b * b for b in vec2))
+    if norm1 == 0 or norm2 == 0:
+        return 0.0
+    return dot / (norm1 * norm2)
+
+
+def count_matching_entities(template_str: str, intent) -> int:
+    score = 0
+    if "{{table}}" in template_str and intent.get("tables"):
+        score += 1
+    if "{{column}}" in template_str and intent.get("columns"):
+        score += 1
+    if "{{value}}" in template_str and intent.get("conditions"):
+        score += 1
+    if "{{group_column}}" in template_str and intent.get("group_by"):
+        score += 1
+    return score
+
+
+def legacy_select(query, templates):
+    results = []
+    for tpl in templates:
+        cos_sim = cosine_similarity(query, tpl["embedding"])
+        match_score = count_matching_entities(tpl["template"], INTENT)
+        results.append((cos_sim * 0.7 + (match_score / 4) * 0.3, tpl["template_id"]))
+    results.sort(reverse=True)
+    return results[0][1]
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Template scoring benchmark")
+    parser.add_argument("--templates", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--legacy-max", type=int, default=10000)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    query = rng.standard_normal(DIM).astype(np.float32)
+    query_list = query.tolist()
+
+    print(f"{'templates':>10} {'load (ms)':>10} {'engine (ms)':>12} {'top-k (ms)':>11} {'legacy (ms)':>12} {'speedup':>9}")
+    for n in args.templates:
+        ids, texts, vectors = synthetic_library(n, rng)
+
+        start = time.perf_counter()
+        store = TemplateStore.from_arrays(ids, texts, vectors)
+        scorer = TemplateScorer(store, LEGACY_WEIGHTS, LEGACY_FEATURES)
+        load_s = time.perf_counter() - start
+
+        engine_s = best_of(lambda: scorer.best(query, INTENT), args.repeat)
+        top_k_s = best_of(lambda: scorer.rank(query, INTENT, args.k), args.repeat)
+
+        if n <= args.legacy_max:
+            templates = as_json_templates(ids, texts, vectors)
+            legacy_s = best_of(lambda: legacy_select(query_list, templates), max(1, args.repeat // 2))
+            assert legacy_select(query_list, templates) == scorer.best(query, INTENT)["template_id"]
+            legacy = f"{legacy_s * 1000:>12.2f} {legacy_s / engine_s:>8.0f}x"
+        else:
+            legacy = f"{'-':>12} {'-':>9}"
+
+        print(f"{n:>10} {load_s * 1000:>10.1f} {engine_s * 1000:>12.3f} {top_k_s * 1000:>11.3f} {legacy}")
+
+
+if __name__ == "__main__":
+    main()
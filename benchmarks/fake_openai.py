@@ -0,0 +1,142 @@
+# benchmarks/fake_openai.py
+#
+# Servidor OpenAI falso (solo biblioteca estándar) para probar app/llm_client.py
+# sin red ni API key: responde /v1/chat/completions y /v1/embeddings con una
+# latencia fija y, con cierta probabilidad, 429 (con Retry-After) o 503.
+# El contenido del chat es siempre `reply`; los embeddings son deterministas
+# por texto.
+#
+# Uso (desde la raíz del repo):
+#   python -m benchmarks.fake_openai --port 8099 --latency 0.05 --error-rate 0.1
+#   LLM_BASE_URL=http://127.0.0.1:8099/v1 OPENAI_API_KEY=test uvicorn app.main:app
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+DEFAULT_REPLY = '{"tables": [], "columns": [], "conditions": []}'
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        reply: str = DEFAULT_REPLY,
+        dim: int = 8
+    ):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.reply = reply
+        self.dim = dim
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def _vector(text: str, dim: int):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [(digest[i % len(digest)] - 128) / 128 for i in range(dim)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: dict, headers: dict = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server: FakeOpenAIServer = self.server
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with server._lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+
+        if random.random() < server.error_rate:
+            with server._lock:
+                server.errors += 1
+            if random.random() < 0.5:
+                self._send(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {"Retry-After": "0.05"})
+            else:
+                self._send(503, {"error": {"message": "Service unavailable", "type": "server_error"}})
+            return
+
+        model = payload.get("model", "fake")
+        if self.path.endswith("/chat/completions"):
+            self._send(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": server.reply},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+            })
+        elif self.path.endswith("/embeddings"):
+            texts = payload.get("input")
+            texts = [texts] if isinstance(texts, str) else texts or []
+            self._send(200, {
+                "object": "list",
+                "model": model,
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": _vector(text, server.dim)}
+                    for i, text in enumerate(texts)
+                ],
+                "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)}
+            })
+        else:
+            self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+
+def start_fake_openai(port: int = 0, **options) -> FakeOpenAIServer:
+    """Arranca el servidor en un hilo (port=0 elige un puerto libre); `shutdown()` lo detiene."""
+    server = FakeOpenAIServer(("127.0.0.1", port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake OpenAI server for local tests.")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 429/503 responses")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(("127.0.0.1", args.port), latency=args.latency, error_rate=args.error_rate)
+    print(f"🧪 Fake OpenAI server on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+# convert_templates.py
+
+import argparse
+from app.embedding_providers import PROVIDERS, get_embedding_provider
+from app.template_store import convert_json_store, template_file
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convierte templates*.json al store binario (.npy + .meta.json)")
+    parser.add_argument("paths", nargs="*", help="Archivos JSON; por defecto, el del backend indicado")
+    parser.add_argument("--backend", choices=list(PROVIDERS), help="Por defecto, EMBEDDING_BACKEND")
+    args = parser.parse_args()
+
+    model = get_embedding_provider(args.backend).model
+    for path in args.paths or [template_file(args.backend)]:
+        base = convert_json_store(path, model if not args.paths else None)
+        print(f"✅ {path} → {base}.npy + {base}.meta.json")
@@ -1,9 +1,32 @@
 # generate_embeddings.py
 
+import argparse
 import asyncio
+import json
+from app.config import TEMPLATE_BUILD_BATCH_SIZE, TEMPLATE_BUILD_CONCURRENCY
+from app.embedding_providers import PROVIDERS, get_embedding_provider
 from app.template_repository import generate_template_embeddings
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera los embeddings de las plantillas")
+    parser.add_argument("--backend", choices=list(PROVIDERS), help="Por defecto, EMBEDDING_BACKEND")
+    parser.add_argument("--input", help="JSON con [{\"id\", \"template\"}]; por defecto, RAW_TEMPLATES")
+    parser.add_argument("--output", help="Por defecto, el archivo de plantillas del backend")
+    parser.add_argument("--batch-size", type=int, default=TEMPLATE_BUILD_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=TEMPLATE_BUILD_CONCURRENCY)
+    args = parser.parse_args()
+
+    templates = None
+    if args.input:
+        with open(args.input, "r", encoding="utf-8") as f:
+            templates = json.load(f)
+
     print("🚀 Generando embeddings de plantillas...")
-    asyncio.run(generate_template_embeddings())
-    print("✅ Embeddings generados y guardados en templates.json")
+    output = asyncio.run(generate_template_embeddings(
+        get_embedding_provider(args.backend),
+        templates=templates,
+        output=args.output,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency
+    ))
+    print(f"✅ Embeddings generados y guardados en {output}")